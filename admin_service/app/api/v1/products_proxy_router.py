@@ -1,6 +1,7 @@
 from fastapi import APIRouter, Depends, HTTPException, status, Request, Response, Body
 from starlette.datastructures import UploadFile
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, StreamingResponse
+from starlette.background import BackgroundTask
 from typing import Any, List, Optional, Dict
 import httpx
 import json
@@ -30,6 +31,34 @@ async def handle_proxy_response(response: httpx.Response) -> JSONResponse:
         raise HTTPException(status_code=error_status_code, detail=client_error_detail)
 
 
+# Валидаторы кэширования, которые BFF пробрасывает между браузером и Product Service
+CONDITIONAL_REQUEST_HEADERS = ("if-none-match",)
+VALIDATOR_RESPONSE_HEADERS = ("etag", "cache-control")
+
+
+def conditional_headers_from(request: Request) -> Dict[str, str]:
+    return {name: request.headers[name] for name in CONDITIONAL_REQUEST_HEADERS if name in request.headers}
+
+
+def proxy_cacheable_response(response: httpx.Response) -> Response:
+    # 304 пересылаем без тела, для 200 добавляем ETag/Cache-Control от Product Service.
+    # Ответ BFF требует авторизации, поэтому кэшировать его могут только браузеры (private).
+    headers = {name: response.headers[name] for name in VALIDATOR_RESPONSE_HEADERS if name in response.headers}
+    if "cache-control" in headers:
+        headers["cache-control"] = f"private, {headers['cache-control']}"
+    if response.status_code == status.HTTP_304_NOT_MODIFIED:
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    return JSONResponse(content=response.json(), status_code=response.status_code, headers=headers)
+
+
+def upstream_error_detail(response: httpx.Response) -> Any:
+    # Тело ошибки Product Service; не-JSON (например, от прокси перед сервисом) пересылаем текстом
+    try:
+        return response.json()
+    except json.JSONDecodeError:
+        return response.text[:500] or f"Upstream error {response.status_code}"
+
+
 @router.post("/", status_code=status.HTTP_201_CREATED)
 async def create_product_proxy(request: Request, current_user: AdminUserSchema = Depends(get_current_active_admin)):
     target_url = f"{PRODUCT_SERVICE_URL}/products/"
@@ -107,16 +136,94 @@ async def create_product_proxy(request: Request, current_user: AdminUserSchema =
                                 detail="Error proxying product creation request.")
 
 
+# Заголовки потоковой выгрузки, которые BFF передает браузеру как есть
+EXPORT_RESPONSE_HEADERS = ("content-type", "content-disposition", "content-encoding")
+
+
+@router.get("/export")  # До /{product_id}
+async def export_products_proxy(request: Request, current_user: AdminUserSchema = Depends(get_current_active_admin)):
+    # Ответ Product Service не буферизуется: байты пересылаются по мере получения,
+    # соединение закрывается фоновой задачей после отправки последнего куска
+    client = httpx.AsyncClient(timeout=httpx.Timeout(10.0, read=None))
+    upstream_request = client.build_request("GET", f"{PRODUCT_SERVICE_URL}/products/export",
+                                            params=request.query_params.multi_items())
+    try:
+        response = await client.send(upstream_request, stream=True)
+    except httpx.RequestError:
+        await client.aclose()
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail="Product service is unavailable.")
+
+    if response.status_code >= 400:
+        await response.aread()
+        await response.aclose()
+        await client.aclose()
+        try:
+            detail = response.json()
+        except json.JSONDecodeError:
+            detail = {"detail": response.text[:500]}
+        raise HTTPException(status_code=response.status_code, detail=detail)
+
+    async def close_upstream():
+        await response.aclose()
+        await client.aclose()
+
+    headers = {name: response.headers[name] for name in EXPORT_RESPONSE_HEADERS if name in response.headers}
+    return StreamingResponse(response.aiter_raw(), status_code=response.status_code, headers=headers,
+                             background=BackgroundTask(close_upstream))
+
+
+@router.post("/import")
+async def import_products_proxy(request: Request, current_user: AdminUserSchema = Depends(get_current_active_admin)):
+    # Тело (CSV/NDJSON) пересылается потоком, не буферизуется в BFF целиком
+    headers = {"content-type": request.headers.get("content-type", "application/octet-stream")}
+    async with httpx.AsyncClient(timeout=httpx.Timeout(10.0, read=None)) as client:  # Большой импорт идет долго
+        try:
+            response = await client.post(f"{PRODUCT_SERVICE_URL}/products/import", params=request.query_params.multi_items(),
+                                         content=request.stream(), headers=headers)
+            response.raise_for_status()
+            return await handle_proxy_response(response)
+        except httpx.HTTPStatusError as e:
+            raise HTTPException(status_code=e.response.status_code, detail=e.response.json())
+        except httpx.RequestError:
+            raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                                detail="Product service is unavailable.")
+        except json.JSONDecodeError:
+            raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                                detail="Invalid JSON response from product service.")
+
+
+@router.patch("/bulk")
+async def bulk_update_products_proxy(request: Request, current_user: AdminUserSchema = Depends(get_current_active_admin)):
+    headers = {"content-type": request.headers.get("content-type", "application/json")}
+    async with httpx.AsyncClient(timeout=httpx.Timeout(10.0, read=60.0)) as client:  # Тысячи позиций за один вызов
+        try:
+            response = await client.patch(f"{PRODUCT_SERVICE_URL}/products/bulk", content=await request.body(),
+                                          headers=headers)
+            response.raise_for_status()
+            return JSONResponse(content=response.json(), status_code=response.status_code)
+        except httpx.HTTPStatusError as e:
+            raise HTTPException(status_code=e.response.status_code, detail=e.response.json())
+        except httpx.RequestError:
+            raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                                detail="Product service is unavailable.")
+        except json.JSONDecodeError:
+            raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                                detail="Invalid JSON response from product service.")
+
+
 @router.get("/")
 async def get_all_products_proxy(request: Request, current_user: AdminUserSchema = Depends(get_current_active_admin)):
-    params = request.query_params
+    params = request.query_params.multi_items()  # Повторяющиеся фильтры (socket=E27&socket=E14) передаются все
     async with httpx.AsyncClient() as client:
         try:
-            response = await client.get(f"{PRODUCT_SERVICE_URL}/products/", params=params)
+            response = await client.get(f"{PRODUCT_SERVICE_URL}/products/", params=params,
+                                        headers=conditional_headers_from(request))
+            if response.status_code == status.HTTP_304_NOT_MODIFIED:
+                return proxy_cacheable_response(response)  # raise_for_status считает 3xx ошибкой
             response.raise_for_status()
-            return JSONResponse(content=response.json(), status_code=response.status_code)
+            return proxy_cacheable_response(response)
         except httpx.HTTPStatusError as e:
-            raise HTTPException(status_code=e.response.status_code, detail=e.response.json())
+            raise HTTPException(status_code=e.response.status_code, detail=upstream_error_detail(e.response))
         except httpx.RequestError:
             raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
                                 detail="Product service is unavailable.")
@@ -126,15 +233,19 @@ async def get_all_products_proxy(request: Request, current_user: AdminUserSchema
 
 
 @router.get("/{product_id}")
-async def get_product_by_id_proxy(product_id: str, current_user: AdminUserSchema = Depends(get_current_active_admin)):
+async def get_product_by_id_proxy(product_id: str, request: Request,
+                                  current_user: AdminUserSchema = Depends(get_current_active_admin)):
     async with httpx.AsyncClient() as client:
         try:
-            response = await client.get(f"{PRODUCT_SERVICE_URL}/products/{product_id}")
+            response = await client.get(f"{PRODUCT_SERVICE_URL}/products/{product_id}",
+                                        headers=conditional_headers_from(request))
+            if response.status_code == status.HTTP_304_NOT_MODIFIED:
+                return proxy_cacheable_response(response)  # raise_for_status считает 3xx ошибкой
             response.raise_for_status()
-            return JSONResponse(content=response.json(), status_code=response.status_code)
+            return proxy_cacheable_response(response)
         # ... (обработка ошибок как выше) ...
         except httpx.HTTPStatusError as e:
-            raise HTTPException(status_code=e.response.status_code, detail=e.response.json())
+            raise HTTPException(status_code=e.response.status_code, detail=upstream_error_detail(e.response))
         except httpx.RequestError:
             raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
                                 detail="Product service is unavailable.")
@@ -42,4 +42,42 @@ CREATE INDEX IF NOT EXISTS idx_orders_status ON orders (status);
 CREATE INDEX IF NOT EXISTS idx_orders_created_at ON orders (created_at);
 CREATE INDEX IF NOT EXISTS idx_orders_customer_email ON orders (customer_email);
 CREATE INDEX IF NOT EXISTS idx_order_items_order_id ON order_items (order_id);
-CREATE INDEX IF NOT EXISTS idx_promocodes_name ON promocodes (promocode_name);
\ No newline at end of file
+CREATE INDEX IF NOT EXISTS idx_promocodes_name ON promocodes (promocode_name);
+
+-- Уведомление кэшей промокодов в процессах Order Service (см. order_service/app/promocode_cache.py).
+-- Одно уведомление на оператор; доставляется после COMMIT, одинаковые уведомления транзакции схлопываются.
+CREATE OR REPLACE FUNCTION notify_promocodes_changed() RETURNS TRIGGER AS $$
+BEGIN
+    PERFORM pg_notify('promocodes_changed', TG_OP);
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trg_promocodes_changed ON promocodes;
+CREATE TRIGGER trg_promocodes_changed
+    AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON promocodes
+    FOR EACH STATEMENT EXECUTE FUNCTION notify_promocodes_changed();
+
+-- Номера заказов для ORDER_NUMBER_STRATEGY=sequence (см. order_service/app/order_numbers.py):
+-- LP-<дата UTC>-<номер из последовательности, не короче 8 цифр>. Уникальность - только от последовательности.
+CREATE SEQUENCE IF NOT EXISTS order_number_seq;
+
+CREATE OR REPLACE FUNCTION next_order_number() RETURNS VARCHAR AS $$
+    SELECT 'LP-' || to_char(now() AT TIME ZONE 'UTC', 'YYYYMMDD') || '-' || lpad(n::text, greatest(8, length(n::text)), '0')
+    FROM (SELECT nextval('order_number_seq') AS n) AS next_value
+$$ LANGUAGE sql VOLATILE;
+
+-- Ответы на POST с заголовком Idempotency-Key (см. order_service/app/idempotency.py).
+-- Строка вставляется в одной транзакции с заказом; просроченные удаляет фоновая очистка по expires_at.
+CREATE TABLE IF NOT EXISTS idempotency_keys (
+    scope VARCHAR(64) NOT NULL,
+    idempotency_key VARCHAR(128) NOT NULL,
+    request_fingerprint CHAR(64) NOT NULL,
+    response_status INT NOT NULL,
+    response_body JSONB NOT NULL,
+    created_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT NOW(),
+    expires_at TIMESTAMP WITH TIME ZONE NOT NULL,
+    PRIMARY KEY (scope, idempotency_key)
+);
+
+CREATE INDEX IF NOT EXISTS idx_idempotency_keys_expires_at ON idempotency_keys (expires_at);
@@ -23,9 +23,67 @@ CREATE TABLE IF NOT EXISTS product_images (
     product_image_id UUID PRIMARY KEY DEFAULT gen_random_uuid(),
     product_id UUID NOT NULL REFERENCES products(product_id) ON DELETE CASCADE,
     image_url VARCHAR(512) NOT NULL,
+    content_hash VARCHAR(64),
+    has_variants BOOLEAN NOT NULL DEFAULT FALSE,
     upload_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT NOW()
 );
 
 -- Indexes for Product Service
 CREATE INDEX IF NOT EXISTS idx_products_name ON products (name);
-CREATE INDEX IF NOT EXISTS idx_products_article ON products (article);
\ No newline at end of file
+CREATE INDEX IF NOT EXISTS idx_products_article ON products (article);
+-- Keyset-пагинация каталога: ORDER BY created_at DESC, product_id DESC
+CREATE INDEX IF NOT EXISTS idx_products_created_at_id ON products (created_at DESC, product_id DESC);
+-- Поиск подстроки (ILIKE '%term%') по названию и артикулу: триграммные GIN-индексы
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+CREATE INDEX IF NOT EXISTS idx_products_name_trgm ON products USING gin (name gin_trgm_ops);
+CREATE INDEX IF NOT EXISTS idx_products_article_trgm ON products USING gin (article gin_trgm_ops);
+-- Дедупликация изображений: поиск по хэшу содержимого и подсчет ссылок на файл
+CREATE INDEX IF NOT EXISTS idx_product_images_content_hash ON product_images (content_hash);
+CREATE INDEX IF NOT EXISTS idx_product_images_image_url ON product_images (image_url);
+-- Главное изображение в списке товаров (LATERAL ... ORDER BY upload_at LIMIT 1): покрывающий индекс,
+-- URL читается без обращения к таблице
+CREATE INDEX IF NOT EXISTS idx_product_images_product_upload
+    ON product_images (product_id, upload_at, product_image_id) INCLUDE (image_url, has_variants);
+-- Фильтры каталога: равенство по фасету + сортировка keyset-пагинации
+CREATE INDEX IF NOT EXISTS idx_products_technology_created ON products (product_technology, created_at DESC, product_id DESC);
+CREATE INDEX IF NOT EXISTS idx_products_socket_created ON products (socket, created_at DESC, product_id DESC);
+CREATE INDEX IF NOT EXISTS idx_products_manufacturer_created ON products (manufacturer, created_at DESC, product_id DESC);
+CREATE INDEX IF NOT EXISTS idx_products_energy_class ON products (class_energy_efficiency);
+CREATE INDEX IF NOT EXISTS idx_products_price ON products (price);
+CREATE INDEX IF NOT EXISTS idx_products_power ON products (power);
+-- Подсчет фасетов (GROUPING SETS): покрывающий индекс, запрос без поиска читает только индекс
+CREATE INDEX IF NOT EXISTS idx_products_facets
+    ON products (product_technology, socket, manufacturer, class_energy_efficiency)
+    INCLUDE (power, lumens, color_temperature, price);
+
+-- Резервирование остатков (POST /stock/reservations): одна строка на ключ идемпотентности
+CREATE TABLE IF NOT EXISTS stock_reservations (
+    reservation_key VARCHAR(64) PRIMARY KEY,
+    status VARCHAR(16) NOT NULL DEFAULT 'reserved' CHECK (status IN ('reserved', 'released')),
+    items JSONB NOT NULL,
+    created_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT NOW(),
+    released_at TIMESTAMP WITH TIME ZONE
+);
+
+-- Лента изменений каталога (GET /products/changes): изменения - по updated_at, удаления - по "надгробиям".
+-- Надгробие пишет триггер, поэтому в ленту попадает любое удаление, в том числе выполненное напрямую в БД.
+CREATE INDEX IF NOT EXISTS idx_products_updated_at_id ON products (updated_at, product_id);
+
+CREATE TABLE IF NOT EXISTS product_tombstones (
+    product_id UUID PRIMARY KEY,
+    deleted_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT NOW()
+);
+CREATE INDEX IF NOT EXISTS idx_product_tombstones_deleted_at_id ON product_tombstones (deleted_at, product_id);
+
+CREATE OR REPLACE FUNCTION record_product_tombstone() RETURNS trigger AS $$
+BEGIN
+    INSERT INTO product_tombstones (product_id, deleted_at) VALUES (OLD.product_id, NOW())
+    ON CONFLICT (product_id) DO UPDATE SET deleted_at = EXCLUDED.deleted_at;
+    RETURN OLD;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trg_products_tombstone ON products;
+CREATE TRIGGER trg_products_tombstone
+    AFTER DELETE ON products
+    FOR EACH ROW EXECUTE FUNCTION record_product_tombstone();
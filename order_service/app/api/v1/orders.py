@@ -1,11 +1,14 @@
-from fastapi import APIRouter, Depends, HTTPException, status, Query
+from fastapi import APIRouter, Depends, Header, HTTPException, status, Query
+from fastapi.responses import JSONResponse
 from sqlalchemy.orm import Session
 from typing import List, Optional
 from math import ceil
 import uuid
 
 from app import crud, models, schemas  # Импортируем из корневой папки app Order Service
+from app import idempotency
 from app.db import get_db
+from app.config import settings
 
 router = APIRouter(
     prefix="/orders",
@@ -14,7 +17,12 @@ router = APIRouter(
 
 
 @router.post("/", response_model=schemas.Order, status_code=status.HTTP_201_CREATED)
-def create_order_endpoint(order_in: schemas.OrderCreate, db: Session = Depends(get_db)):
+def create_order_endpoint(
+        order_in: schemas.OrderCreate,
+        idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key", min_length=1, max_length=128,
+                                                description="Ключ для безопасного повтора запроса"),
+        db: Session = Depends(get_db)
+):
     """
     Создать новый заказ.
 
@@ -26,9 +34,19 @@ def create_order_endpoint(order_in: schemas.OrderCreate, db: Session = Depends(g
         - `quantity` (количество)
         - `name` (название товара на момент заказа)
         - `price_per_one` (цена за единицу на момент заказа)
+
+    С заголовком `Idempotency-Key` повтор с тем же ключом и телом возвращает ответ первого запроса
+    (заголовок ответа `Idempotency-Replayed: true`), не создавая второй заказ. Тот же ключ с другим телом - 422,
+    первый запрос с этим ключом еще выполняется дольше ORDER_IDEMPOTENCY_LOCK_TIMEOUT_SECONDS - 409.
     """
     try:
+        if idempotency_key is not None:
+            return create_order_idempotent(db, order_in, idempotency_key)
         created_order = crud.create_order(db=db, order_data=order_in)
+    except idempotency.IdempotencyKeyReuseError as e:
+        raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail=str(e))
+    except idempotency.IdempotencyKeyBusyError as e:
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=str(e))
     except ValueError as e:
         # Ошибки от CRUD (например, неверный промокод, проблемы с товаром (если бы была проверка),
         # ошибки расчета, ошибки уникальности номера заказа)
@@ -42,17 +60,49 @@ def create_order_endpoint(order_in: schemas.OrderCreate, db: Session = Depends(g
     return created_order
 
 
+def create_order_idempotent(db: Session, order_in: schemas.OrderCreate, idempotency_key: str) -> JSONResponse:
+    def operation() -> idempotency.StoredResponse:
+        created_order = crud.insert_order(db=db, order_data=order_in)
+        return idempotency.StoredResponse(status.HTTP_201_CREATED, created_order.model_dump(mode="json"))
+
+    response, replayed = idempotency.execute_idempotent(
+        db, scope="orders:create", key=idempotency_key,
+        fingerprint=idempotency.request_fingerprint(order_in.model_dump(mode="json")),
+        operation=operation
+    )
+    # Первый ответ и повтор отдаются одинаково - из сохраненного JSON
+    return JSONResponse(status_code=response.status_code, content=response.body,
+                        headers={"Idempotency-Replayed": "true"} if replayed else None)
+
+
+@router.post("/quote", response_model=schemas.OrderQuoteResponse)
+def quote_orders_endpoint(quote_in: schemas.OrderQuoteRequest, db: Session = Depends(get_db)):
+    """
+    Рассчитать стоимость одной или нескольких корзин без создания заказа.
+
+    Для каждой корзины (`carts`, до 100) возвращаются `total_cost`, `total_cost_with_promo`, `discount`
+    и `promocode_status` - применен ли промокод, а если нет, то почему
+    (NOT_PROVIDED, NOT_FOUND, INACTIVE, BELOW_MIN_ORDER_COST с `promocode_min_order_cost`).
+    Расчет совпадает с тем, что сделает POST /orders для тех же позиций и промокода.
+    """
+    return schemas.OrderQuoteResponse(quotes=crud.quote_orders(db=db, carts=quote_in.carts))
+
+
 @router.get("/", response_model=schemas.OrderListResponse)  # Обновляем response_model
 def read_all_orders_endpoint(
         skip: int = Query(0, ge=0, description="Пропустить записи"),
         limit: int = Query(20, ge=1, le=100, description="Макс. кол-во записей"),
         status: Optional[schemas.OrderStatusPythonEnum] = Query(None, description="Фильтр по статусу заказа"),
         search: Optional[str] = Query(None, min_length=1, description="Поиск по номеру заказа, ФИО или email клиента"),
+        count_strategy: Optional[str] = Query(None, alias="count", pattern="^(exact|cached|estimate)$",
+                                              description="Как считать total_count: exact, cached или estimate"),
         db: Session = Depends(get_db)
 ):
-    order_models, total_count = crud.get_all_orders(
-        db=db, skip=skip, limit=limit, status=status, search_term=search  # Передаем search_term
+    order_models, total = crud.get_all_orders(
+        db=db, skip=skip, limit=limit, status=status, search_term=search,  # Передаем search_term
+        count_strategy=count_strategy or settings.ORDER_LIST_COUNT_STRATEGY
     )
+    total_count = total.value
 
     # Конвертируем модели в Pydantic схемы OrderInList
     items_response = [schemas.OrderInList.model_validate(order) for order in order_models]
@@ -65,7 +115,8 @@ def read_all_orders_endpoint(
         total_count=total_count,
         page=current_page,
         limit=limit,
-        pages=total_pages
+        pages=total_pages,
+        total_count_is_approximate=total.approximate
     )
 
 
@@ -51,7 +51,7 @@ def read_promocode_by_name_endpoint(promocode_name: str, db: Session = Depends(g
     """
     Получить промокод по его имени (коду).
     """
-    db_promocode = crud.get_promocode_by_name(db=db, promocode_name=promocode_name)
+    db_promocode = crud.find_promocode_by_name(db=db, promocode_name=promocode_name)
     if db_promocode is None:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Promocode not found")
     return db_promocode
@@ -1,10 +1,31 @@
 from pydantic_settings import BaseSettings, SettingsConfigDict
+from typing import Optional
 
 
 class Settings(BaseSettings):
     ORDER_DATABASE_URL: str
     APP_NAME: str = "Order Service"
 
+    # Общее количество в списке заказов (см. counting.py): exact, cached или estimate
+    ORDER_LIST_COUNT_STRATEGY: str = "exact"
+    ORDER_COUNT_CACHE_TTL_SECONDS: int = 30
+    ORDER_COUNT_ESTIMATE_MIN_ROWS: int = 10000
+
+    # Номера заказов (см. order_numbers.py): sequence или snowflake
+    ORDER_NUMBER_STRATEGY: str = "snowflake"
+    # id воркера для snowflake (0..1023). Не задан - арендуется в БД при старте каждого процесса
+    ORDER_NUMBER_WORKER_ID: Optional[int] = None
+
+    # Idempotency-Key для POST /orders (см. idempotency.py): сколько хранится ответ для повтора
+    ORDER_IDEMPOTENCY_TTL_HOURS: float = 24
+    # Сколько параллельный повтор ждет завершения первого запроса с тем же ключом, прежде чем получить 409
+    ORDER_IDEMPOTENCY_LOCK_TIMEOUT_SECONDS: float = 10
+    # Период фоновой очистки просроченных ключей в каждом процессе; 0 - очистка отключена
+    ORDER_IDEMPOTENCY_CLEANUP_INTERVAL_SECONDS: float = 300
+
+    # Промокоды в памяти процесса с согласованием через LISTEN/NOTIFY (см. promocode_cache.py)
+    ORDER_PROMOCODE_CACHE_ENABLED: bool = True
+
     model_config = SettingsConfigDict(env_file=".env", env_file_encoding='utf-8', extra='ignore')
 
 
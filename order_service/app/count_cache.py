@@ -0,0 +1,38 @@
+import json
+import threading
+import time
+from typing import Optional
+
+# Кэш точных COUNT(*) для стратегии cached (см. counting.py). У order_service нет общего кэша,
+# как product_cache у товаров, поэтому счетчики хранятся в памяти процесса.
+
+
+class CountCache:
+    # Маленький TTL-кэш в памяти процесса: ключ - нормализованные фильтры
+    def __init__(self, max_entries: int = 1024):
+        self.max_entries = max_entries
+        self._entries: dict[str, tuple[float, int]] = {}
+        self._lock = threading.Lock()  # Синхронные эндпоинты выполняются в пуле потоков
+
+    @staticmethod
+    def _key(params: dict) -> str:
+        return json.dumps(params, sort_keys=True, default=str)
+
+    def get_count(self, params: dict) -> Optional[int]:
+        with self._lock:
+            entry = self._entries.get(self._key(params))
+            if entry is None or entry[0] < time.monotonic():
+                return None
+            return entry[1]
+
+    def set_count(self, params: dict, count: int, ttl_seconds: int) -> None:
+        with self._lock:
+            now = time.monotonic()
+            if len(self._entries) >= self.max_entries:
+                self._entries = {k: entry for k, entry in self._entries.items() if entry[0] >= now}
+                if len(self._entries) >= self.max_entries:
+                    self._entries.clear()
+            self._entries[self._key(params)] = (now + ttl_seconds, count)
+
+
+count_cache = CountCache()
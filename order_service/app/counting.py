@@ -0,0 +1,86 @@
+from typing import NamedTuple, Optional
+
+from sqlalchemy import text
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.orm import Session
+from sqlalchemy.sql.expression import ClauseElement, Executable
+
+# Общее количество строк для постраничных списков. Точный COUNT(*) стоит почти столько же, сколько сама
+# страница, поэтому есть три стратегии:
+#   exact    - точный COUNT(*) на каждый запрос;
+#   cached   - точный COUNT(*), сохраненный в кэше сервиса на cache_ttl_seconds для данного набора фильтров;
+#   estimate - оценка планировщика: pg_class.reltuples для запроса без фильтров, EXPLAIN (rows) - с фильтрами.
+#              Если оценка меньше estimate_min_rows, выполняется точный подсчет - он дешев,
+#              а относительная ошибка оценки на малых выборках велика.
+#
+# Модуль не зависит от сервиса: кэш и пороги передаются в RowCounter. Тот же файл лежит в product_service
+# и order_service (каждый сервис собирается из своего каталога) - изменения вносятся в обе копии.
+COUNT_STRATEGIES = ("exact", "cached", "estimate")
+
+
+class CountResult(NamedTuple):
+    value: int
+    approximate: bool
+
+
+class Explain(Executable, ClauseElement):
+    # EXPLAIN для произвольного SELECT: параметры обрабатываются как при обычном выполнении запроса
+    inherit_cache = False
+
+    def __init__(self, statement):
+        self.statement = statement
+
+
+@compiles(Explain, "postgresql")
+def _compile_explain(element, compiler, **kw):
+    return "EXPLAIN (FORMAT JSON) " + compiler.process(element.statement, **kw)
+
+
+def table_row_estimate(db: Session, table_name: str) -> Optional[int]:
+    # reltuples обновляют VACUUM/ANALYZE (и autovacuum); -1 - таблица еще ни разу не анализировалась
+    reltuples = db.execute(
+        text("SELECT reltuples::bigint FROM pg_class WHERE oid = to_regclass(:table_name)"),
+        {"table_name": table_name}
+    ).scalar()
+    return reltuples if reltuples is not None and reltuples >= 0 else None
+
+
+def plan_row_estimate(db: Session, query) -> Optional[int]:
+    plan = db.execute(Explain(query.statement)).scalar()
+    try:
+        return int(plan[0]["Plan"]["Plan Rows"])
+    except (TypeError, LookupError, ValueError):
+        return None
+
+
+class RowCounter:
+    """
+    cache - объект с get_count(key) -> Optional[int] и set_count(key, count, ttl_seconds);
+    key - JSON-совместимый словарь.
+    """
+
+    def __init__(self, cache, cache_ttl_seconds: int, estimate_min_rows: int):
+        self.cache = cache
+        self.cache_ttl_seconds = cache_ttl_seconds
+        self.estimate_min_rows = estimate_min_rows
+
+    def count(self, db: Session, query, strategy: str, table_name: str, filtered: bool, signature) -> CountResult:
+        """
+        query - отфильтрованный запрос без сортировки и LIMIT; signature - JSON-совместимый ключ набора фильтров.
+        """
+        if strategy == "estimate":
+            estimate = plan_row_estimate(db, query) if filtered else table_row_estimate(db, table_name)
+            if estimate is not None and estimate >= self.estimate_min_rows:
+                return CountResult(estimate, approximate=True)
+            return CountResult(query.count(), approximate=False)
+
+        if strategy == "cached":
+            cache_key = {"table": table_name, "filters": signature}
+            cached_count = self.cache.get_count(cache_key)
+            if cached_count is not None:
+                return CountResult(cached_count, approximate=True)  # Может отставать от БД не больше чем на TTL
+            count = query.count()
+            self.cache.set_count(cache_key, count, self.cache_ttl_seconds)
+            return CountResult(count, approximate=False)
+
+        return CountResult(query.count(), approximate=False)
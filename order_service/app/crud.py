@@ -1,11 +1,20 @@
 from sqlalchemy.orm import Session
 from sqlalchemy.exc import IntegrityError
-from sqlalchemy import func as sqlalchemy_func
-from typing import List, Optional, Tuple
+from sqlalchemy import func as sqlalchemy_func, insert, select, bindparam, true, any_, Integer, String
+from sqlalchemy.dialects.postgresql import ARRAY, UUID
+from typing import List, NamedTuple, Optional, Tuple
 import uuid
 from decimal import Decimal
-from datetime import datetime
 from . import models, schemas
+from .config import settings
+from .count_cache import count_cache
+from .counting import CountResult, RowCounter
+from .order_numbers import get_order_number_generator
+from .promocode_cache import PromocodeSnapshot, promocode_cache
+
+# total_count списка заказов: стратегии - в counting.py, кэш и пороги - настройки сервиса
+row_counter = RowCounter(cache=count_cache, cache_ttl_seconds=settings.ORDER_COUNT_CACHE_TTL_SECONDS,
+                         estimate_min_rows=settings.ORDER_COUNT_ESTIMATE_MIN_ROWS)
 
 
 # --- Promocode CRUD ---
@@ -18,6 +27,29 @@ def get_promocode_by_name(db: Session, promocode_name: str) -> Optional[models.P
     return db.query(models.Promocode).filter(models.Promocode.promocode_name == promocode_name).first()
 
 
+def find_promocode_by_name(db: Session, promocode_name: str) -> Optional[models.Promocode | PromocodeSnapshot]:
+    # Для чтения на горячем пути: из кэша промокодов, если он загружен (см. promocode_cache.py), иначе из БД
+    promocodes = promocode_cache.promocodes()
+    if promocodes is not None:
+        return promocodes.get(promocode_name)
+    return get_promocode_by_name(db, promocode_name)
+
+
+def find_promocodes_by_names(db: Session, promocode_names) -> dict:
+    # Имя -> промокод для нескольких имен: из кэша или одним запросом к БД; ненайденных имен в результате нет
+    promocode_names = set(promocode_names)
+    promocodes = promocode_cache.promocodes()
+    if promocodes is not None:
+        return {name: promocodes[name] for name in promocode_names if name in promocodes}
+    if not promocode_names:
+        return {}
+    rows = db.query(models.Promocode).filter(
+        models.Promocode.promocode_name == any_(bindparam("promocode_names", sorted(promocode_names),
+                                                          type_=ARRAY(String)))
+    ).all()
+    return {promocode.promocode_name: promocode for promocode in rows}
+
+
 def get_all_promocodes(db: Session, skip: int = 0, limit: int = 100) -> List[models.Promocode]:
     return db.query(models.Promocode).offset(skip).limit(limit).all()
 
@@ -43,6 +75,7 @@ def create_promocode(db: Session, promocode_data: schemas.PromocodeCreate) -> mo
         if "promocodes_promocode_name_key" in str(e.orig).lower():
             raise ValueError(f"Promocode name '{promocode_data.promocode_name}' already exists (DB check).")
         raise ValueError("Could not create promocode due to DB integrity error.") from e
+    promocode_cache.reload()
     return db_promocode
 
 
@@ -76,6 +109,7 @@ def update_promocode(db: Session, promocode_id: uuid.UUID, promocode_update_data
         db.rollback()
         # ... (обработка IntegrityError) ...
         raise ValueError("Could not update promocode due to DB integrity error.") from e
+    promocode_cache.reload()
     return db_promocode
 
 
@@ -86,51 +120,142 @@ def delete_promocode(db: Session, promocode_id: uuid.UUID) -> Optional[models.Pr
         # Сейчас ForeignKey ondelete="SET NULL", так что заказы не удалятся.
         db.delete(db_promocode)
         db.commit()
+        promocode_cache.reload()
     return db_promocode
 
 
 # --- Order & OrderItem CRUD (будут добавлены дальше) ---
 
+class OrderTotals(NamedTuple):
+    total_cost: Decimal
+    total_cost_with_promo: Decimal
+    applied_promocode_uuid: Optional[uuid.UUID]
+    promocode_status: schemas.PromocodeQuoteStatus
+
+
+def evaluate_order_totals(
+        items_data,
+        promocode: Optional[models.Promocode | PromocodeSnapshot] = None,
+        promocode_name: Optional[str] = None
+) -> OrderTotals:
+    """
+    Стоимость заказа до и после промокода и причина, по которой промокод применен или нет.
+    items_data - позиции с price_per_one и quantity; promocode_name - имя, переданное клиентом
+    (нужно, чтобы отличить "промокод не указан" от "не найден"). Общая логика для заказа и расчета корзины.
+    """
+    statuses = schemas.PromocodeQuoteStatus
+    total_cost = sum(item.price_per_one * item.quantity for item in items_data)
+    total_cost_with_promo = total_cost
+    applied_promocode_uuid: Optional[uuid.UUID] = None
+
+    if promocode is None:
+        promocode_status = statuses.NOT_FOUND if promocode_name else statuses.NOT_PROVIDED
+    elif not promocode.is_active:
+        promocode_status = statuses.INACTIVE
+    elif promocode.min_order_cost is not None and total_cost < promocode.min_order_cost:
+        # Если не набрана минимальная сумма, скидку не даем
+        promocode_status = statuses.BELOW_MIN_ORDER_COST
+    else:
+        promocode_status = statuses.APPLIED
+        applied_promocode_uuid = promocode.promocode_id
+        if promocode.percent is not None:
+            discount_amount = (total_cost * Decimal(promocode.percent)) / Decimal(100)
+            total_cost_with_promo = total_cost - discount_amount
+        elif promocode.value is not None:
+            total_cost_with_promo = total_cost - promocode.value
+
+        # Убедимся, что цена не стала отрицательной
+        if total_cost_with_promo < Decimal(0):
+            total_cost_with_promo = Decimal(0)
+
+    # Округление до 2 знаков после запятой
+    return OrderTotals(total_cost.quantize(Decimal("0.01")), total_cost_with_promo.quantize(Decimal("0.01")),
+                       applied_promocode_uuid, promocode_status)
+
+
 def calculate_order_totals(
         items_data: List[schemas.OrderItemCreate],
-        promocode: Optional[models.Promocode] = None
+        promocode: Optional[models.Promocode | PromocodeSnapshot] = None
 ) -> Tuple[Decimal, Decimal, Optional[uuid.UUID]]:
     """
     Рассчитывает общую стоимость заказа и стоимость с учетом промокода.
     Возвращает (total_cost, total_cost_with_promo, applied_promocode_uuid).
     """
-    total_cost = sum(item.price_per_one * item.quantity for item in items_data)
-    total_cost_with_promo = total_cost
-    applied_promocode_uuid: Optional[uuid.UUID] = None
+    totals = evaluate_order_totals(items_data, promocode)
+    if totals.promocode_status == schemas.PromocodeQuoteStatus.BELOW_MIN_ORDER_COST:
+        print(
+            f"Promocode {promocode.promocode_name} not applied: order total {totals.total_cost} is less than min required {promocode.min_order_cost}")
+    return totals.total_cost, totals.total_cost_with_promo, totals.applied_promocode_uuid
 
-    if promocode and promocode.is_active:
-        # Проверяем минимальную сумму заказа для промокода
-        if promocode.min_order_cost is not None and total_cost < promocode.min_order_cost:
-            print(
-                f"Promocode {promocode.promocode_name} not applied: order total {total_cost} is less than min required {promocode.min_order_cost}")
-            # Промокод не применяется, но мы можем все равно его записать в заказ, если логика это позволяет
-            # В данном случае, если не прошел min_order_cost, скидку не даем
-        else:
-            applied_promocode_uuid = promocode.promocode_id
-            if promocode.percent is not None:
-                discount_amount = (total_cost * Decimal(promocode.percent)) / Decimal(100)
-                total_cost_with_promo = total_cost - discount_amount
-            elif promocode.value is not None:
-                total_cost_with_promo = total_cost - promocode.value
-
-            # Убедимся, что цена не стала отрицательной
-            if total_cost_with_promo < Decimal(0):
-                total_cost_with_promo = Decimal(0)
 
-    # Округление до 2 знаков после запятой
-    return total_cost.quantize(Decimal("0.01")), total_cost_with_promo.quantize(Decimal("0.01")), applied_promocode_uuid
+def quote_orders(db: Session, carts: List[schemas.OrderQuoteCart]) -> List[schemas.OrderQuote]:
+    """
+    Расчет стоимости корзин без создания заказа - те же правила, что в create_order.
+    Промокоды всех корзин берутся из кэша или одним SELECT; записи в БД нет.
+    """
+    promocodes = find_promocodes_by_names(db, (cart.promocode_name for cart in carts if cart.promocode_name))
+    quotes = []
+    for cart in carts:
+        promocode = promocodes.get(cart.promocode_name) if cart.promocode_name else None
+        totals = evaluate_order_totals(cart.items, promocode, cart.promocode_name)
+        quotes.append(schemas.OrderQuote(
+            total_cost=totals.total_cost,
+            total_cost_with_promo=totals.total_cost_with_promo,
+            discount=totals.total_cost - totals.total_cost_with_promo,
+            promocode_name=cart.promocode_name,
+            promocode_status=totals.promocode_status,
+            promocode_min_order_cost=promocode.min_order_cost
+            if totals.promocode_status == schemas.PromocodeQuoteStatus.BELOW_MIN_ORDER_COST else None
+        ))
+    return quotes
+
+
+def _order_insert_statement(order_values: dict, items: List[schemas.OrderItemCreate]):
+    """
+    Заказ и все его позиции - одним запросом:
+        WITH new_order AS (INSERT INTO orders ... RETURNING *),
+             new_items AS (INSERT INTO order_items SELECT ... FROM new_order, unnest(...) RETURNING *)
+        SELECT new_order.*, new_items.* FROM new_order, new_items
+    Позиции передаются параметрами-массивами: текст запроса не зависит от размера корзины.
+    Результат - по строке на позицию, колонки заказа повторяются в каждой строке.
+    """
+    new_order = (
+        insert(models.Order).values(**order_values)
+        .returning(*models.Order.__table__.c)
+        .cte("new_order")
+    )
+    requested = sqlalchemy_func.unnest(
+        bindparam("item_product_ids", [item.product_id for item in items], type_=ARRAY(UUID(as_uuid=True))),
+        bindparam("item_quantities", [item.quantity for item in items], type_=ARRAY(Integer)),
+        bindparam("item_prices", [item.price_per_one for item in items], type_=ARRAY(models.OrderItem.price_per_one.type)),
+        bindparam("item_names", [item.name for item in items], type_=ARRAY(String)),
+    ).table_valued("product_id", "quantity", "price_per_one", "name").render_derived(name="requested")
+    new_items = (
+        insert(models.OrderItem)
+        .from_select(
+            ["order_id", "product_id", "quantity", "price_per_one", "name"],
+            select(new_order.c.order_id, requested.c.product_id, requested.c.quantity,
+                   requested.c.price_per_one, requested.c.name).select_from(new_order).join(requested, true()),
+            include_defaults=False  # order_item_id - DEFAULT gen_random_uuid() в БД, по значению на строку
+        )
+        .returning(*models.OrderItem.__table__.c)
+        .cte("new_items")
+    )
+    return select(
+        *new_order.c,
+        *[column.label(f"item_{column.name}") for column in new_items.c if column.name != "order_id"]
+    ).select_from(new_order).join(new_items, true())
 
 
-def create_order(db: Session, order_data: schemas.OrderCreate) -> models.Order:
+def insert_order(db: Session, order_data: schemas.OrderCreate) -> schemas.Order:
+    """
+    Вставляет заказ с позициями без COMMIT - вызывающий код фиксирует его вместе со своими записями
+    (см. idempotency.execute_idempotent). create_order - то же с COMMIT.
+    """
     # 1. Проверить и получить промокод, если указан
-    active_promocode_model: Optional[models.Promocode] = None
+    active_promocode_model: Optional[models.Promocode | PromocodeSnapshot] = None
     if order_data.promocode_name_applied:
-        active_promocode_model = get_promocode_by_name(db, promocode_name=order_data.promocode_name_applied)
+        active_promocode_model = find_promocode_by_name(db, promocode_name=order_data.promocode_name_applied)
         if not active_promocode_model or not active_promocode_model.is_active:
             # Можно бросить ошибку или просто не применять промокод
             print(f"Warning: Promocode '{order_data.promocode_name_applied}' not found or not active.")
@@ -145,55 +270,66 @@ def create_order(db: Session, order_data: schemas.OrderCreate) -> models.Order:
         promocode=active_promocode_model
     )
 
-    timestamp_part = datetime.utcnow().strftime("%Y%m%d%H%M%S")
-    random_part = uuid.uuid4().hex[:6].upper()
-    order_number = f"LP-{timestamp_part}-{random_part}"
-
-    while db.query(models.Order).filter(models.Order.number == order_number).first():
-        random_part = uuid.uuid4().hex[:6].upper()
-        order_number = f"LP-{timestamp_part}-{random_part}"
+    # Уникален по построению (см. order_numbers.py) - проверочный запрос перед вставкой не нужен
+    order_number = get_order_number_generator().next_number(db)
 
-    db_order_data = order_data.model_dump(exclude={"items", "promocode_name_applied"})
-    db_order = models.Order(
-        **db_order_data,
+    order_values = order_data.model_dump(exclude={"items", "promocode_name_applied"})
+    order_values.update(
+        order_id=uuid.uuid4(),  # Python-default модели в INSERT внутри CTE не вычисляется - без него уйдет NULL
         number=order_number,
         promocode_uuid=applied_promo_uuid,
         total_cost=total_cost,
         total_cost_with_promo=total_cost_with_promo,
         status=models.OrderStatusPythonEnum.NEW  # Начальный статус
     )
-    db.add(db_order)
 
+    # Один запрос на заказ с позициями; ответ строится из RETURNING, без повторного чтения
     try:
-        db.flush()
-        db.refresh(db_order)
-    except IntegrityError as e_flush_order:
+        rows = db.execute(_order_insert_statement(order_values, order_data.items)).all()
+    except IntegrityError as e:
         db.rollback()
-        # ... обработка ошибок уникальности номера заказа или других ограничений ...
-        raise ValueError(f"Could not prepare order for saving: {str(e_flush_order)}") from e_flush_order
+        # Например, одинаковый product_id в двух позициях (uq_order_product)
+        raise ValueError(f"Could not save order: {str(e.orig)}") from e
+    except Exception as e:
+        db.rollback()
+        raise ValueError(f"Could not save order: {str(e)}") from e
+
+    order_row = rows[0]
+    items_by_product = {row.item_product_id: row for row in rows}
+    return schemas.Order(
+        order_id=order_row.order_id,
+        number=order_row.number,
+        status=order_row.status,
+        customer_surname=order_row.customer_surname,
+        customer_first_name=order_row.customer_first_name,
+        customer_email=order_row.customer_email,
+        customer_phone_number=order_row.customer_phone_number,
+        promocode_name_applied=order_data.promocode_name_applied,
+        promocode_uuid=order_row.promocode_uuid,
+        total_cost=order_row.total_cost,
+        total_cost_with_promo=order_row.total_cost_with_promo,
+        created_at=order_row.created_at,
+        updated_at=order_row.updated_at,
+        items=[  # В порядке позиций запроса; product_id в заказе уникален (uq_order_product)
+            schemas.OrderItem(
+                order_item_id=row.item_order_item_id, order_id=order_row.order_id, product_id=row.item_product_id,
+                quantity=row.item_quantity, price_per_one=row.item_price_per_one, name=row.item_name
+            )
+            for row in (items_by_product[item.product_id] for item in order_data.items)
+        ],
+        promocode_applied_details=schemas.Promocode.model_validate(active_promocode_model)
+        if applied_promo_uuid else None
+    )
 
-    order_item_models = []
-    for item_data in order_data.items:
-        db_item = models.OrderItem(
-            order_id=db_order.order_id,
-            product_id=item_data.product_id,
-            quantity=item_data.quantity,
-            price_per_one=item_data.price_per_one,
-            name=item_data.name
-        )
-        db.add(db_item)
-        order_item_models.append(db_item)
 
+def create_order(db: Session, order_data: schemas.OrderCreate) -> schemas.Order:
+    created_order = insert_order(db, order_data)
     try:
         db.commit()
-        db.refresh(db_order)
-        for item_model in order_item_models:
-            db.refresh(item_model)
-    except Exception as e_commit:
+    except Exception as e:
         db.rollback()
-        raise ValueError(f"Could not commit order: {str(e_commit)}") from e_commit
-
-    return db_order
+        raise ValueError(f"Could not commit order: {str(e)}") from e
+    return created_order
 
 
 def get_order_by_id(db: Session, order_id: uuid.UUID) -> Optional[models.Order]:
@@ -220,8 +356,9 @@ def get_all_orders(
         limit: int = 20,
         status: Optional[schemas.OrderStatusPythonEnum] = None,
         customer_email: Optional[str] = None,
-        search_term: Optional[str] = None  # Добавляем общий поиск
-) -> tuple[List[models.Order], int]:  # Возвращаем (items, total_count)
+        search_term: Optional[str] = None,  # Добавляем общий поиск
+        count_strategy: str = "exact"
+) -> tuple[List[models.Order], CountResult]:  # Возвращаем (items, total_count)
 
     query = db.query(models.Order)
 
@@ -241,7 +378,11 @@ def get_all_orders(
             (sqlalchemy_func.lower(models.Order.customer_email).ilike(search_filter))  # Добавим и email в общий поиск
         )
 
-    total_count = query.count()
+    total_count = row_counter.count(
+        db, query, count_strategy, table_name="orders",
+        filtered=bool(status or customer_email or search_term),
+        signature={"status": status, "customer_email": customer_email, "search": search_term}
+    )
 
     orders = query.order_by(models.Order.created_at.desc()).offset(skip).limit(limit).all()
 
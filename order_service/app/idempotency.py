@@ -0,0 +1,166 @@
+import hashlib
+import json
+import threading
+from datetime import timedelta
+from typing import Callable, NamedTuple, Optional
+
+from sqlalchemy import delete, func as sqlalchemy_func, select, text, tuple_
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import Session
+
+from . import models
+from .config import settings
+from .db import SessionLocal
+
+# Заголовок Idempotency-Key: повтор запроса с тем же ключом (таймаут клиента, повторная отправка формы)
+# получает сохраненный ответ первого запроса, а не создает второй заказ.
+#
+# Порядок в одной транзакции:
+#   1. pg_advisory_xact_lock по (scope, ключ) - параллельный повтор ждет здесь, пока первый запрос не завершится;
+#   2. поиск сохраненного ответа - если есть, он возвращается без выполнения операции;
+#   3. операция (без COMMIT) и вставка ответа в idempotency_keys, затем один COMMIT.
+# Заказ и ответ фиксируются вместе: после ошибки или падения процесса не остается ни заказа без ответа,
+# ни ответа без заказа, а ключ снова свободен. Ошибочные ответы (400, 500) не сохраняются.
+
+LOCK_NOT_AVAILABLE = "55P03"  # SQLSTATE lock_not_available: истек lock_timeout
+
+
+class StoredResponse(NamedTuple):
+    status_code: int
+    body: dict
+
+
+class IdempotencyKeyReuseError(Exception):
+    pass
+
+
+class IdempotencyKeyBusyError(Exception):
+    pass
+
+
+def request_fingerprint(payload: dict) -> str:
+    # payload - JSON-совместимое тело запроса (model_dump(mode="json")); порядок ключей не влияет на отпечаток
+    canonical = json.dumps(payload, sort_keys=True, separators=(",", ":"), ensure_ascii=False)
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+def lock_key(db: Session, scope: str, key: str) -> None:
+    # Блокировка транзакционная - снимается COMMIT/ROLLBACK; ожидание ограничено lock_timeout этой транзакции
+    previous_timeout = db.execute(
+        text("SELECT current_setting('lock_timeout'), set_config('lock_timeout', :timeout, true)"),
+        {"timeout": f"{int(settings.ORDER_IDEMPOTENCY_LOCK_TIMEOUT_SECONDS * 1000)}ms"}
+    ).scalar()
+    try:
+        db.execute(text("SELECT pg_advisory_xact_lock(hashtextextended(:lock_key, 0))"),
+                   {"lock_key": f"{scope}:{key}"})
+    except OperationalError as e:
+        db.rollback()
+        if getattr(e.orig, "pgcode", None) == LOCK_NOT_AVAILABLE:
+            raise IdempotencyKeyBusyError(
+                "A request with this Idempotency-Key is still being processed. Retry later.") from e
+        raise
+    db.execute(text("SELECT set_config('lock_timeout', :timeout, true)"), {"timeout": previous_timeout})
+
+
+def find_response(db: Session, scope: str, key: str, fingerprint: str) -> Optional[StoredResponse]:
+    stored = db.execute(
+        select(models.IdempotencyKey.request_fingerprint, models.IdempotencyKey.response_status,
+               models.IdempotencyKey.response_body)
+        .where(models.IdempotencyKey.scope == scope, models.IdempotencyKey.idempotency_key == key,
+               models.IdempotencyKey.expires_at > sqlalchemy_func.now())
+    ).first()
+    if stored is None:
+        return None
+    if stored.request_fingerprint != fingerprint:
+        raise IdempotencyKeyReuseError("Idempotency-Key was already used with a different request body.")
+    return StoredResponse(stored.response_status, stored.response_body)
+
+
+def save_response(db: Session, scope: str, key: str, fingerprint: str, response: StoredResponse) -> None:
+    # Просроченная, но еще не удаленная строка с тем же ключом перезаписывается
+    values = dict(
+        scope=scope, idempotency_key=key, request_fingerprint=fingerprint,
+        response_status=response.status_code, response_body=response.body,
+        created_at=sqlalchemy_func.now(),
+        expires_at=sqlalchemy_func.now() + timedelta(hours=settings.ORDER_IDEMPOTENCY_TTL_HOURS),
+    )
+    statement = pg_insert(models.IdempotencyKey).values(**values)
+    db.execute(statement.on_conflict_do_update(
+        index_elements=[models.IdempotencyKey.scope, models.IdempotencyKey.idempotency_key],
+        set_={name: statement.excluded[name] for name in values if name not in ("scope", "idempotency_key")}
+    ))
+
+
+def execute_idempotent(db: Session, scope: str, key: str, fingerprint: str,
+                       operation: Callable[[], StoredResponse]) -> tuple[StoredResponse, bool]:
+    """
+    operation выполняет запись в db без COMMIT и возвращает ответ; ее исключения пробрасываются после ROLLBACK.
+    Возвращает (ответ, повтор ли это). Ключ с другим телом запроса - IdempotencyKeyReuseError,
+    первый запрос не завершился за ORDER_IDEMPOTENCY_LOCK_TIMEOUT_SECONDS - IdempotencyKeyBusyError.
+    """
+    lock_key(db, scope, key)
+    try:
+        stored = find_response(db, scope, key, fingerprint)
+        if stored is not None:
+            db.rollback()  # Снимает блокировку; читающая транзакция ничего не меняла
+            return stored, True
+        response = operation()
+        save_response(db, scope, key, fingerprint, response)
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    return response, False
+
+
+def delete_expired_keys(db: Session, batch_size: int = 1000) -> int:
+    # Пачками с SKIP LOCKED: очистка из нескольких процессов не ждет друг друга и не держит долгих блокировок
+    deleted = 0
+    while True:
+        expired = (
+            select(models.IdempotencyKey.scope, models.IdempotencyKey.idempotency_key)
+            .where(models.IdempotencyKey.expires_at <= sqlalchemy_func.now())
+            .order_by(models.IdempotencyKey.expires_at)
+            .limit(batch_size)
+            .with_for_update(skip_locked=True)
+        )
+        result = db.execute(
+            delete(models.IdempotencyKey)
+            .where(tuple_(models.IdempotencyKey.scope, models.IdempotencyKey.idempotency_key).in_(expired))
+        )
+        db.commit()
+        deleted += result.rowcount
+        if result.rowcount < batch_size:
+            return deleted
+
+
+class ExpiredKeyCleaner:
+    def __init__(self, interval_seconds: float):
+        self.interval_seconds = interval_seconds
+        self._stopped = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> None:
+        if self.interval_seconds <= 0:
+            return
+        self._thread = threading.Thread(target=self._run, name="idempotency-cleanup", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+
+    def _run(self) -> None:
+        while not self._stopped.wait(self.interval_seconds):
+            try:
+                with SessionLocal() as db:
+                    deleted = delete_expired_keys(db)
+                if deleted:
+                    print(f"IDEMPOTENCY: deleted {deleted} expired key(s)")
+            except Exception as e:  # Ошибка БД не останавливает поток, очистка повторится в следующий период
+                print(f"IDEMPOTENCY: cleanup failed: {e}")
+
+
+expired_key_cleaner = ExpiredKeyCleaner(interval_seconds=settings.ORDER_IDEMPOTENCY_CLEANUP_INTERVAL_SECONDS)
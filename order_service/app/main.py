@@ -7,14 +7,23 @@ from app.api.v1 import orders as api_orders
 from app.api.v1 import promocodes as api_promocodes
 from app.db import engine, Base
 from app.config import settings
+from app.order_numbers import get_order_number_generator, shutdown_order_number_generator
+from app.idempotency import expired_key_cleaner
+from app.promocode_cache import promocode_cache
 
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     print(f"Starting up {settings.APP_NAME}...")
+    print(f"Order number strategy: {get_order_number_generator().name}")  # Для snowflake - аренда id воркера
+    expired_key_cleaner.start()
+    promocode_cache.start()
     print("Order Service startup complete.")
     yield
     print(f"Shutting down {settings.APP_NAME}...")
+    expired_key_cleaner.stop()
+    promocode_cache.stop()
+    shutdown_order_number_generator()
     if hasattr(engine, 'dispose'): # Для синхронного движка
         engine.dispose()
     print("Order Service shutdown complete.")
@@ -40,6 +49,7 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["Idempotency-Replayed"],
 )
 
 # Подключаем роутеры API
@@ -1,7 +1,7 @@
 import enum
 import uuid
 from sqlalchemy import Column, String, DECIMAL, Integer, Boolean, ForeignKey, TIMESTAMP, Enum as SQLAlchemyEnum
-from sqlalchemy.dialects.postgresql import UUID
+from sqlalchemy.dialects.postgresql import UUID, JSONB
 from sqlalchemy.orm import relationship, declarative_base
 from sqlalchemy.sql import func
 
@@ -89,3 +89,16 @@ class OrderItem(Base):
     order = relationship("Order", back_populates="items")
 
     # __table_args__ = (UniqueConstraint('order_id', 'product_id', name='uq_order_product'),)
+
+
+class IdempotencyKey(Base):
+    # Сохраненные ответы на запросы с заголовком Idempotency-Key (см. idempotency.py)
+    __tablename__ = "idempotency_keys"
+
+    scope = Column(String(64), primary_key=True)  # Операция, например "orders:create"
+    idempotency_key = Column(String(128), primary_key=True)
+    request_fingerprint = Column(String(64), nullable=False)  # sha256 канонического JSON тела запроса
+    response_status = Column(Integer, nullable=False)
+    response_body = Column(JSONB, nullable=False)
+    created_at = Column(TIMESTAMP(timezone=True), server_default=func.now(), nullable=False)
+    expires_at = Column(TIMESTAMP(timezone=True), nullable=False)
@@ -0,0 +1,244 @@
+import os
+import threading
+import time
+from abc import ABC, abstractmethod
+from datetime import datetime, timezone
+from typing import Callable, Optional
+
+from sqlalchemy import func as sqlalchemy_func, text
+from sqlalchemy.orm import Session
+
+from .config import settings
+from .db import engine
+
+# Номера заказов вида LP-<дата UTC>-<суффикс>, уникальные без проверочного SELECT перед вставкой.
+# Стратегия - ORDER_NUMBER_STRATEGY:
+#   sequence  - суффикс из последовательности order_number_seq (функция next_order_number() в БД).
+#               Номер вычисляется в самом INSERT, отдельного запроса нет. Номера короче, но по ним видно
+#               количество заказов.
+#   snowflake - суффикс собирается в процессе: миллисекунда суток, id воркера и счетчик в пределах миллисекунды.
+#               Обращений к БД при выдаче номера нет: id воркера арендуется при старте и проверяется
+#               в фоне (см. WorkerIdLease).
+# UNIQUE на orders.number остается последней линией защиты.
+
+ORDER_NUMBER_PREFIX = "LP"
+CROCKFORD_ALPHABET = "0123456789ABCDEFGHJKMNPQRSTVWXYZ"  # Без I, L, O, U - не путаются при диктовке
+
+# Раскладка snowflake-суффикса: 27 бит - миллисекунда суток (86 400 000 < 2**27), 10 бит - воркер, 12 бит - счетчик.
+# 49 бит = 10 символов base32: LP-20250101-0F3K9Q2M7A (22 символа при лимите колонки 32).
+WORKER_ID_BITS = 10
+COUNTER_BITS = 12
+MAX_WORKER_ID = (1 << WORKER_ID_BITS) - 1
+MAX_COUNTER = (1 << COUNTER_BITS) - 1
+SUFFIX_LENGTH = 10
+MS_PER_DAY = 86_400_000
+
+# Пространство рекомендательных блокировок для аренды id воркера (два int4-ключа: пространство, id)
+WORKER_LEASE_LOCK_SPACE = 0x4C50  # "LP"
+LEASE_CHECK_SECONDS = 5.0  # Как часто фоновый поток подтверждает, что блокировка все еще наша
+LEASE_TTL_SECONDS = 15.0  # Без подтверждения дольше этого номера не выдаются
+LEASE_HELD_SQL = text(
+    "SELECT EXISTS (SELECT 1 FROM pg_locks WHERE locktype = 'advisory' AND pid = pg_backend_pid() AND granted"
+    " AND classid = :space AND objid = :worker_id AND objsubid = 2)"  # objsubid 2 - блокировка по двум int4
+)
+
+
+def encode_base32(value: int, length: int) -> str:
+    chars = []
+    for _ in range(length):
+        value, remainder = divmod(value, 32)
+        chars.append(CROCKFORD_ALPHABET[remainder])
+    return "".join(reversed(chars))
+
+
+def current_time_ms() -> int:
+    return time.time_ns() // 1_000_000
+
+
+class OrderNumberGenerator(ABC):
+    name = "base"
+
+    @abstractmethod
+    def next_number(self, db: Session):
+        # Значение для Order.number: строка или SQL-выражение, вычисляемое при вставке
+        ...
+
+    def close(self) -> None:
+        pass
+
+
+class SequenceOrderNumberGenerator(OrderNumberGenerator):
+    name = "sequence"
+
+    def next_number(self, db: Session):
+        return sqlalchemy_func.next_order_number()
+
+
+class SnowflakeOrderNumberGenerator(OrderNumberGenerator):
+    """
+    Уникальность обеспечивается тройкой (миллисекунда, воркер, счетчик) при условии, что id воркера уникален
+    среди работающих процессов. Время монотонно: если часы отстали (NTP), продолжается последняя
+    миллисекунда; если счетчик исчерпан (больше 4096 номеров за мс), используется следующая миллисекунда.
+    """
+    name = "snowflake"
+
+    def __init__(self, worker_id: int, clock: Callable[[], int] = current_time_ms,
+                 lease: Optional["WorkerIdLease"] = None):
+        if not 0 <= worker_id <= MAX_WORKER_ID:
+            raise ValueError(f"Order number worker id must be between 0 and {MAX_WORKER_ID}.")
+        self.worker_id = worker_id
+        self._clock = clock
+        self._lease = lease  # Арендованный id; None - id задан в настройках
+        self._lock = threading.Lock()  # Синхронные эндпоинты выполняются в пуле потоков
+        self._last_ms = -1
+        self._counter = 0
+
+    def next_number(self, db: Optional[Session] = None) -> str:
+        # После переаренды id может смениться: новый id тоже только наш, уникальность тройки сохраняется
+        worker_id = self._lease.current_worker_id() if self._lease is not None else self.worker_id
+        with self._lock:
+            now_ms = self._clock()
+            if now_ms > self._last_ms:
+                self._last_ms, self._counter = now_ms, 0
+            elif self._counter < MAX_COUNTER:
+                self._counter += 1
+            else:
+                self._last_ms, self._counter = self._last_ms + 1, 0
+            timestamp_ms, counter = self._last_ms, self._counter
+
+        day = datetime.fromtimestamp(timestamp_ms // 1000, tz=timezone.utc).strftime("%Y%m%d")
+        suffix = (((timestamp_ms % MS_PER_DAY) << WORKER_ID_BITS | worker_id) << COUNTER_BITS) | counter
+        return f"{ORDER_NUMBER_PREFIX}-{day}-{encode_base32(suffix, SUFFIX_LENGTH)}"
+
+    def close(self) -> None:
+        if self._lease is not None:
+            self._lease.close()
+            self._lease = None
+
+
+def lease_worker_id():
+    """
+    Занимает свободный id воркера рекомендательной блокировкой на отдельном соединении.
+    Блокировка живет, пока живо соединение: id упавшего процесса освобождается автоматически.
+    Возвращает (id, соединение).
+    """
+    connection = engine.connect()
+    try:
+        start = os.getpid() % (MAX_WORKER_ID + 1)  # Разные процессы начинают перебор с разных id
+        for offset in range(MAX_WORKER_ID + 1):
+            worker_id = (start + offset) % (MAX_WORKER_ID + 1)
+            acquired = connection.execute(
+                text("SELECT pg_try_advisory_lock(:space, :worker_id)"),
+                {"space": WORKER_LEASE_LOCK_SPACE, "worker_id": worker_id}
+            ).scalar()
+            if acquired:
+                connection.commit()  # Блокировка сессионная, транзакция не нужна
+                return worker_id, connection
+    except Exception:
+        connection.close()
+        raise
+    connection.close()
+    raise RuntimeError(f"All {MAX_WORKER_ID + 1} order number worker ids are in use.")
+
+
+class WorkerIdLease:
+    """
+    Id воркера, занятый через lease_worker_id. Блокировка живет, пока живо ее соединение, а обрыв
+    соединения процесс сам не замечает - тогда id может занять другой процесс. Поэтому фоновый поток
+    раз в LEASE_CHECK_SECONDS проверяет по pg_locks, что блокировка все еще наша, и после потери
+    арендует id заново. Если подтверждения нет дольше LEASE_TTL_SECONDS (соединение разорвано,
+    проверка зависла, свободных id нет), номера не выдаются: лучше ошибка оформления, чем дубликат.
+    """
+
+    def __init__(self):
+        worker_id, self._connection = lease_worker_id()
+        self._state = (worker_id, time.monotonic())  # (id, время подтверждения) - подменяется целиком
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="order-number-lease", daemon=True)
+        self._thread.start()
+
+    @property
+    def worker_id(self) -> int:
+        return self._state[0]
+
+    def current_worker_id(self) -> int:
+        worker_id, confirmed_at = self._state
+        if time.monotonic() - confirmed_at > LEASE_TTL_SECONDS:
+            raise RuntimeError(f"Order number worker id {worker_id} lease is not confirmed. "
+                               "Refusing to issue order numbers.")
+        return worker_id
+
+    def close(self) -> None:
+        self._stopped.set()
+        self._thread.join(timeout=LEASE_CHECK_SECONDS + 5)
+        self._close_connection()  # Сессионная блокировка снимается вместе с соединением
+
+    def _run(self) -> None:
+        while not self._stopped.wait(LEASE_CHECK_SECONDS):
+            worker_id = self.worker_id
+            try:
+                if self._connection is None:
+                    raise RuntimeError("no lease connection")
+                held = self._connection.execute(
+                    LEASE_HELD_SQL, {"space": WORKER_LEASE_LOCK_SPACE, "worker_id": worker_id}
+                ).scalar()
+                self._connection.commit()
+                if not held:
+                    raise RuntimeError("advisory lock is no longer held")
+                self._state = (worker_id, time.monotonic())
+            except Exception as e:
+                self._state = (worker_id, float("-inf"))  # Потеря известна - не ждать истечения TTL
+                print(f"Order numbers: lease of worker id {worker_id} lost: {e}")
+                self._reacquire()
+
+    def _reacquire(self) -> None:
+        self._close_connection()
+        try:
+            worker_id, self._connection = lease_worker_id()
+        except Exception as e:  # До следующей попытки номера не выдаются (см. current_worker_id)
+            print(f"Order numbers: could not lease a worker id: {e}")
+            return
+        self._state = (worker_id, time.monotonic())
+        print(f"Order numbers: leased snowflake worker id {worker_id}")
+
+    def _close_connection(self) -> None:
+        if self._connection is not None:
+            try:
+                self._connection.close()
+            except Exception:  # Соединение уже разорвано
+                pass
+            self._connection = None
+
+
+def build_order_number_generator() -> OrderNumberGenerator:
+    strategy = settings.ORDER_NUMBER_STRATEGY
+    if strategy == "sequence":
+        return SequenceOrderNumberGenerator()
+    if strategy == "snowflake":
+        if settings.ORDER_NUMBER_WORKER_ID is not None:
+            return SnowflakeOrderNumberGenerator(settings.ORDER_NUMBER_WORKER_ID)
+        lease = WorkerIdLease()
+        print(f"Order numbers: leased snowflake worker id {lease.worker_id}")
+        return SnowflakeOrderNumberGenerator(lease.worker_id, lease=lease)
+    raise ValueError(f"Unknown ORDER_NUMBER_STRATEGY '{strategy}'. Use 'sequence' or 'snowflake'.")
+
+
+_generator: Optional[OrderNumberGenerator] = None
+_generator_lock = threading.Lock()
+
+
+def get_order_number_generator() -> OrderNumberGenerator:
+    # Создается при старте сервиса (lifespan) - в каждом воркере после fork; в скриптах - при первом заказе
+    global _generator
+    if _generator is None:
+        with _generator_lock:
+            if _generator is None:
+                _generator = build_order_number_generator()
+    return _generator
+
+
+def shutdown_order_number_generator() -> None:
+    global _generator
+    if _generator is not None:
+        _generator.close()
+        _generator = None
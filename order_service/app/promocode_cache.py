@@ -0,0 +1,146 @@
+import select as select_module
+import threading
+import time
+import uuid
+from datetime import datetime
+from decimal import Decimal
+from types import MappingProxyType
+from typing import Mapping, NamedTuple, Optional
+
+from sqlalchemy import create_engine, select
+from sqlalchemy.pool import NullPool
+
+from . import models
+from .config import settings
+from .db import DATABASE_URL, SessionLocal
+
+# Промокоды в памяти процесса (ORDER_PROMOCODE_CACHE_ENABLED): имя -> неизменяемый снимок строки.
+# Оформление заказа и GET /promocodes/name/{name} обходятся без запросов к promocodes.
+#
+# Таблица крошечная, поэтому любое изменение перечитывает ее целиком и подменяет словарь одной ссылкой.
+# Источники перечитывания:
+#   - CRUD промокодов в этом процессе - сразу после COMMIT (свои изменения видны немедленно);
+#   - NOTIFY promocodes_changed из триггера на promocodes - изменения других воркеров и ручные правки в БД.
+#     Уведомления приходят после COMMIT, поэтому другие процессы отстают на время доставки уведомления.
+# Кэш публикуется только пока LISTEN-соединение живо: иначе пропущенные уведомления оставили бы его устаревшим.
+# До подписки и после потери соединения промокоды читаются из БД.
+#
+# Полуоткрытое соединение (роутер/NAT сбросил TCP без RST) не дает ошибок само по себе: select просто молчит.
+# Поэтому у соединения слушателя включены TCP keepalive, а в тишине раз в HEARTBEAT_SECONDS
+# по нему выполняется SELECT 1 - мертвое соединение падает с ошибкой, и слушатель переподключается.
+
+NOTIFY_CHANNEL = "promocodes_changed"
+POLL_SECONDS = 1.0  # Как часто поток слушателя проверяет остановку
+HEARTBEAT_SECONDS = 30.0
+RECONNECT_SECONDS = 5.0
+LISTENER_CONNECT_ARGS = {  # Параметры libpq: обрыв обнаруживается примерно за минуту
+    "keepalives": 1,
+    "keepalives_idle": 30,
+    "keepalives_interval": 10,
+    "keepalives_count": 3,
+    "tcp_user_timeout": 60000,  # мс; SELECT 1 без ответа сервера не висит дольше
+}
+
+
+class PromocodeSnapshot(NamedTuple):
+    # Те же атрибуты, что у models.Promocode: подходит для calculate_order_totals и schemas.Promocode
+    promocode_id: uuid.UUID
+    promocode_name: str
+    percent: Optional[int]
+    value: Optional[Decimal]
+    min_order_cost: Optional[Decimal]
+    is_active: bool
+    created_at: datetime
+
+
+class PromocodeCache:
+    def __init__(self, enabled: bool):
+        self.enabled = enabled
+        self._promocodes: Optional[Mapping[str, PromocodeSnapshot]] = None
+        self._reload_lock = threading.Lock()  # Перечитывания по очереди: последним устанавливается самое свежее
+        self._listening = False  # Меняется только под _reload_lock
+        self._stopped = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def promocodes(self) -> Optional[Mapping[str, PromocodeSnapshot]]:
+        """Текущий снимок (имя -> промокод) или None, если кэш не загружен - тогда читать из БД."""
+        return self._promocodes
+
+    # --- Жизненный цикл ---
+    def start(self) -> None:
+        if not self.enabled:
+            return
+        # Первая загрузка - в потоке слушателя после LISTEN; до нее запросы читают промокоды из БД
+        self._thread = threading.Thread(target=self._listen, name="promocode-cache", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join(timeout=POLL_SECONDS + 5)
+
+    def _set_listening(self, listening: bool) -> None:
+        # Под _reload_lock: перечитывание из потока запроса, начатое до обрыва, уже завершилось
+        # и не опубликует снимок после сброса
+        with self._reload_lock:
+            self._listening = listening
+            if not listening:
+                self._promocodes = None
+
+    # --- Загрузка ---
+    def reload(self) -> None:
+        if not self.enabled:
+            return
+        with self._reload_lock:
+            if not self._listening:  # Без подписки снимок нельзя держать согласованным - читать из БД
+                return
+            try:
+                with SessionLocal() as db:
+                    rows = db.execute(select(*[getattr(models.Promocode, field)
+                                               for field in PromocodeSnapshot._fields])).all()
+            except Exception as e:  # Ошибка БД не ломает запись промокода; до следующей загрузки - чтение из БД
+                self._promocodes = None
+                print(f"PROMOCODE CACHE: reload failed: {e}")
+                return
+            self._promocodes = MappingProxyType({row.promocode_name: PromocodeSnapshot(*row) for row in rows})
+
+    def _listen(self) -> None:
+        # Отдельный движок без пула: соединение с keepalive живет, пока жив слушатель
+        listener_engine = create_engine(DATABASE_URL, poolclass=NullPool, connect_args=LISTENER_CONNECT_ARGS)
+        while not self._stopped.is_set():
+            connection = None
+            try:
+                connection = listener_engine.connect().execution_options(isolation_level="AUTOCOMMIT")
+                connection.exec_driver_sql(f"LISTEN {NOTIFY_CHANNEL}")
+                dbapi_connection = connection.connection.dbapi_connection
+                self._set_listening(True)
+                self.reload()  # Уведомления, отправленные до LISTEN, не придут - перечитать после подписки
+                last_activity = time.monotonic()
+                while not self._stopped.is_set():
+                    readable, _, _ = select_module.select([dbapi_connection], [], [], POLL_SECONDS)
+                    if readable:
+                        dbapi_connection.poll()
+                        last_activity = time.monotonic()
+                    elif time.monotonic() - last_activity >= HEARTBEAT_SECONDS:
+                        connection.exec_driver_sql("SELECT 1")  # Ошибка здесь - переподключение
+                        last_activity = time.monotonic()
+                        if self._promocodes is None:  # Прошлое перечитывание не удалось - повторить
+                            self.reload()
+                    if dbapi_connection.notifies:
+                        dbapi_connection.notifies.clear()  # Одно перечитывание на любое число уведомлений
+                        self.reload()
+            except Exception as e:
+                self._set_listening(False)  # Без подписки изменения других процессов не видны - читать из БД
+                print(f"PROMOCODE CACHE: listener failed: {e}")
+                self._stopped.wait(RECONNECT_SECONDS)
+            finally:
+                if connection is not None:
+                    try:
+                        connection.close()
+                    except Exception:  # Соединение уже разорвано - закрывать нечего, поток не должен упасть
+                        pass
+        self._set_listening(False)
+        listener_engine.dispose()
+
+
+promocode_cache = PromocodeCache(enabled=settings.ORDER_PROMOCODE_CACHE_ENABLED)
@@ -1,5 +1,6 @@
 from pydantic import BaseModel, Field, EmailStr
 from typing import List, Optional
+import enum
 import uuid
 from decimal import Decimal
 from datetime import datetime
@@ -97,6 +98,44 @@ class OrderInList(BaseModel):
 class OrderListResponse(BaseModel):
     items: List[OrderInList]
     total_count: int
+    total_count_is_approximate: bool = False # Оценка планировщика или значение из кэша (см. counting.py)
     page: Optional[int] = None
     limit: Optional[int] = None
     pages: Optional[int] = None
+
+
+# --- Order Quote Schemas ---
+class PromocodeQuoteStatus(str, enum.Enum):
+    APPLIED = "APPLIED"
+    NOT_PROVIDED = "NOT_PROVIDED"  # Промокод не указан
+    NOT_FOUND = "NOT_FOUND"
+    INACTIVE = "INACTIVE"
+    BELOW_MIN_ORDER_COST = "BELOW_MIN_ORDER_COST"  # Сумма корзины меньше min_order_cost промокода
+
+
+class OrderQuoteItem(BaseModel):
+    product_id: uuid.UUID
+    quantity: int = Field(gt=0)
+    price_per_one: Decimal = Field(gt=0, decimal_places=2)
+
+
+class OrderQuoteCart(BaseModel):
+    items: List[OrderQuoteItem] = Field(..., min_length=1)
+    promocode_name: Optional[str] = None
+
+
+class OrderQuoteRequest(BaseModel):
+    carts: List[OrderQuoteCart] = Field(..., min_length=1, max_length=100)
+
+
+class OrderQuote(BaseModel):
+    total_cost: Decimal
+    total_cost_with_promo: Decimal
+    discount: Decimal
+    promocode_name: Optional[str] = None
+    promocode_status: PromocodeQuoteStatus
+    promocode_min_order_cost: Optional[Decimal] = None  # Для BELOW_MIN_ORDER_COST - сколько нужно набрать
+
+
+class OrderQuoteResponse(BaseModel):
+    quotes: List[OrderQuote]  # В порядке carts запроса
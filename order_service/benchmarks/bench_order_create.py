@@ -0,0 +1,100 @@
+"""
+Бенчмарк оформления заказа: прежний путь записи (flush + refresh заказа, db.add на каждую позицию,
+commit, refresh заказа и каждой позиции - 3+N обращений к БД) против crud.create_order
+(заказ и позиции одним INSERT ... RETURNING через CTE + COMMIT).
+
+Меряются заказы/сек и медиана задержки для корзин из 1, 10 и 50 позиций, заказы создаются последовательно
+в одном потоке - как один воркер, обрабатывающий оформления друг за другом.
+
+Запуск из каталога order_service (БД - тестовая: заказы создаются и затем удаляются):
+    ORDER_DATABASE_URL=postgresql+psycopg2://... python -m benchmarks.bench_order_create --orders 500
+"""
+import argparse
+import statistics
+import time
+import uuid
+from decimal import Decimal
+
+from sqlalchemy import text
+
+from app import crud, models, schemas
+from app.db import SessionLocal
+from app.order_numbers import get_order_number_generator
+
+CLEANUP_SQL = text("DELETE FROM orders WHERE customer_email LIKE :pattern")
+
+
+def make_order(run_id: str, number: int, cart_size: int) -> schemas.OrderCreate:
+    return schemas.OrderCreate(
+        customer_surname="Bench", customer_first_name="Order", customer_email=f"bench-{run_id}-{number}@example.com",
+        customer_phone_number="+70000000000",
+        items=[
+            schemas.OrderItemCreate(product_id=uuid.uuid4(), quantity=1 + index % 3, name=f"Bench lamp {index}",
+                                    price_per_one=Decimal("99.90"))
+            for index in range(cart_size)
+        ]
+    )
+
+
+def legacy_create_order(db, order_data: schemas.OrderCreate) -> schemas.Order:
+    # Путь записи до изменения (без промокода); номер - тем же генератором, чтобы сравнивать только запись
+    total_cost, total_cost_with_promo, _ = crud.calculate_order_totals(order_data.items)
+    db_order = models.Order(
+        **order_data.model_dump(exclude={"items", "promocode_name_applied"}),
+        number=get_order_number_generator().next_number(db), total_cost=total_cost,
+        total_cost_with_promo=total_cost_with_promo, status=models.OrderStatusPythonEnum.NEW
+    )
+    db.add(db_order)
+    db.flush()
+    db.refresh(db_order)
+    item_models = []
+    for item_data in order_data.items:
+        db_item = models.OrderItem(order_id=db_order.order_id, **item_data.model_dump())
+        db.add(db_item)
+        item_models.append(db_item)
+    db.commit()
+    db.refresh(db_order)
+    for item_model in item_models:
+        db.refresh(item_model)
+    return schemas.Order.model_validate(db_order)
+
+
+def measure(create, run_id: str, label: str, orders: int, cart_size: int) -> tuple[float, float]:
+    # Каждый заказ - в новой сессии, как запрос к API
+    timings = []
+    for number in range(orders):
+        order_data = make_order(run_id, f"{label}-{cart_size}-{number}", cart_size)
+        with SessionLocal() as db:
+            started = time.perf_counter()
+            create(db, order_data)
+            timings.append(time.perf_counter() - started)
+    return len(timings) / sum(timings), statistics.median(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--orders", type=int, default=500, help="Orders per cart size and write path")
+    parser.add_argument("--cart-sizes", type=int, nargs="+", default=[1, 10, 50])
+    args = parser.parse_args()
+
+    run_id = uuid.uuid4().hex[:8]
+    paths = {"legacy ORM": legacy_create_order, "INSERT RETURNING": crud.create_order}
+    try:
+        for label, create in paths.items():  # Прогрев соединений и кэша планов
+            measure(create, run_id, f"warmup-{label[0]}", 20, 10)
+        print(f"{args.orders} orders per cart size")
+        for cart_size in args.cart_sizes:
+            results = {label: measure(create, run_id, label[0], args.orders, cart_size) for label, create in paths.items()}
+            for label, (orders_per_sec, median) in results.items():
+                print(f"{cart_size:>3} items | {label:<16} {orders_per_sec:8.0f} orders/s | median {median * 1000:6.2f} ms")
+            legacy, bulk = results["legacy ORM"][0], results["INSERT RETURNING"][0]
+            print(f"{cart_size:>3} items | speedup x{bulk / legacy:.1f}")
+    finally:
+        with SessionLocal() as db:
+            deleted = db.execute(CLEANUP_SQL, {"pattern": f"bench-{run_id}-%"}).rowcount
+            db.commit()
+        print(f"Cleanup: deleted {deleted} orders")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,127 @@
+"""
+Проверка уникальности номеров заказов (app/order_numbers.py) под параллельной нагрузкой:
+несколько процессов одновременно генерируют миллионы номеров, затем все номера сверяются на дубликаты.
+
+snowflake: процессы получают разные id воркера (как при аренде в БД) и генерируют номера без БД.
+    --clock-jitter-ms подмешивает случайный откат часов (как при коррекции NTP).
+    --same-ms заставляет все номера процесса приходиться на несколько миллисекунд (переполнение счетчика).
+sequence: номера берутся из БД пачками (SELECT next_order_number() FROM generate_series(...)),
+    нужен ORDER_DATABASE_URL со схемой из db_init_scripts/order_service.
+
+Номера каждого процесса сортируются и пишутся во временный файл; проверка - слиянием файлов,
+поэтому все номера одновременно в памяти не держатся.
+
+Запуск из каталога order_service:
+    python -m benchmarks.check_order_numbers --processes 8 --per-process 500000
+    python -m benchmarks.check_order_numbers --strategy sequence --processes 4 --per-process 100000
+"""
+import argparse
+import heapq
+import os
+import random
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from itertools import count
+
+SEQUENCE_BATCH_SIZE = 10_000
+
+
+def jittery_clock(jitter_ms: int, seed: int):
+    from app.order_numbers import current_time_ms
+    rng = random.Random(seed)
+
+    def clock() -> int:
+        return current_time_ms() - (rng.randrange(jitter_ms + 1) if rng.random() < 0.01 else 0)
+    return clock
+
+
+def frozen_clock(milliseconds: int):
+    # Каждые 4096 * 4 вызова время сдвигается на 1 мс: счетчик переполняется постоянно
+    calls = count()
+    start = int(time.time() * 1000)
+    return lambda: start + next(calls) // (4096 * 4) % milliseconds
+
+
+def generate_snowflake(worker_id: int, amount: int, clock_jitter_ms: int, same_ms: int) -> list[str]:
+    from app.order_numbers import SnowflakeOrderNumberGenerator, current_time_ms
+    clock = current_time_ms
+    if same_ms:
+        clock = frozen_clock(same_ms)
+    elif clock_jitter_ms:
+        clock = jittery_clock(clock_jitter_ms, seed=worker_id)
+    generator = SnowflakeOrderNumberGenerator(worker_id, clock=clock)
+    return [generator.next_number() for _ in range(amount)]
+
+
+def generate_sequence(amount: int) -> list[str]:
+    from sqlalchemy import text
+    from app.db import SessionLocal
+    numbers = []
+    with SessionLocal() as db:
+        while len(numbers) < amount:
+            batch = min(SEQUENCE_BATCH_SIZE, amount - len(numbers))
+            numbers.extend(db.execute(text("SELECT next_order_number() FROM generate_series(1, :n)"), {"n": batch}).scalars())
+            db.commit()
+    return numbers
+
+
+def worker(index: int, args, directory: str) -> tuple[str, int, float]:
+    started = time.perf_counter()
+    if args.strategy == "snowflake":
+        numbers = generate_snowflake(index, args.per_process, args.clock_jitter_ms, args.same_ms)
+    else:
+        numbers = generate_sequence(args.per_process)
+    elapsed = time.perf_counter() - started
+    numbers.sort()
+    path = os.path.join(directory, f"numbers-{index}.txt")
+    with open(path, "w") as output:
+        output.writelines(number + "\n" for number in numbers)
+    return path, max(len(number) for number in numbers), elapsed
+
+
+def find_duplicates(paths: list[str], limit: int = 10) -> tuple[int, int, list[str]]:
+    files = [open(path) for path in paths]
+    try:
+        total, duplicates, examples, previous = 0, 0, [], None
+        for line in heapq.merge(*files):
+            total += 1
+            if line == previous:
+                duplicates += 1
+                if len(examples) < limit:
+                    examples.append(line.strip())
+            previous = line
+        return total, duplicates, examples
+    finally:
+        for file in files:
+            file.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--strategy", choices=("snowflake", "sequence"), default="snowflake")
+    parser.add_argument("--processes", type=int, default=8)
+    parser.add_argument("--per-process", type=int, default=500_000)
+    parser.add_argument("--clock-jitter-ms", type=int, default=0, help="snowflake: random clock steps back, ms")
+    parser.add_argument("--same-ms", type=int, default=0, help="snowflake: squeeze every process into N milliseconds")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        started = time.perf_counter()
+        with ProcessPoolExecutor(max_workers=args.processes) as executor:
+            results = list(executor.map(worker, range(args.processes), [args] * args.processes,
+                                        [directory] * args.processes))
+        elapsed = time.perf_counter() - started
+        generation = sum(result[2] for result in results)
+        total, duplicates, examples = find_duplicates([result[0] for result in results])
+
+    print(f"{args.strategy}: {total:,} numbers from {args.processes} processes in {elapsed:.1f} s "
+          f"({total / generation * args.processes:,.0f} numbers/s overall), max length {max(r[1] for r in results)}")
+    if duplicates:
+        print(f"RESULT: {duplicates} DUPLICATE(S), e.g. {examples}")
+        raise SystemExit(1)
+    print("RESULT: no collisions")
+
+
+if __name__ == "__main__":
+    main()
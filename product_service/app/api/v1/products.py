@@ -1,12 +1,21 @@
-from fastapi import APIRouter, Depends, HTTPException, status, Query, File, UploadFile
+from fastapi import APIRouter, Depends, HTTPException, status, Query, File, UploadFile, Header, Response, Request
+from fastapi.responses import StreamingResponse
 from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 from typing import List, Optional
 import uuid
 from math import ceil
-
-from app import crud, models, schemas
-from app.db import get_db
-from app.utils_uploads import save_upload_file_sync, save_upload_file_async, delete_physical_image
+from datetime import datetime
+
+from app import crud, crud_async, models, schemas
+from app.db import get_db, get_async_db
+from app.utils_uploads import stage_upload_files_concurrently
+from app.product_import import detect_import_format, import_products
+from app.product_export import EXPORT_MEDIA_TYPES, iter_export
+from app.cache import product_cache
+from app.catalog_snapshot import catalog_snapshot, render_list_response
+from app.config import settings
+from app.http_cache import make_etag, product_etag, etag_matches, set_validators, not_modified, prerendered_json
 
 router = APIRouter(
     prefix="/products",
@@ -18,7 +27,7 @@ router = APIRouter(
 async def api_create_product_with_images(
         product_form_data: schemas.ProductCreateForm = Depends(schemas.ProductCreateForm.as_form),
         images: Optional[List[UploadFile]] = File(None, description="Файлы изображений товара (опционально)"),
-        db: Session = Depends(get_db)
+        db: AsyncSession = Depends(get_async_db)
 ):
     product_create_schema = schemas.ProductCreate(**product_form_data.model_dump())
     print(f"Product Service: Received product data: {product_create_schema.model_dump(exclude={'description'})}") # Логируем часть данных
@@ -28,7 +37,7 @@ async def api_create_product_with_images(
         print("Product Service: No image files received.")
     try:
         # Вызываем обновленный CRUD, который сам обрабатывает файлы
-        db_product = crud.create_product(
+        db_product = await crud_async.create_product(
             db=db,
             product_data=product_create_schema,
             image_files=images if images else []
@@ -46,42 +55,234 @@ async def api_create_product_with_images(
     return db_product
 
 
+@router.post("/import", response_model=schemas.ProductImportReport)
+async def api_import_products(
+        request: Request,
+        import_format: Optional[str] = Query(None, alias="format", pattern="^(csv|ndjson)$",
+                                             description="csv или ndjson; по умолчанию - по Content-Type"),
+        delimiter: str = Query(",", min_length=1, max_length=1, description="Разделитель полей CSV"),
+        db: AsyncSession = Depends(get_async_db)
+):
+    """
+    Массовый импорт/обновление товаров из прайс-листа (CSV с заголовком или NDJSON), ключ - article.
+    Тело читается потоком; строки проверяются схемой ProductCreate и пишутся пачками.
+    Ошибочные строки не прерывают импорт - они перечисляются в отчете.
+    """
+    import_format = import_format or detect_import_format(request.headers.get("content-type"))
+    if import_format is None:
+        raise HTTPException(status_code=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE,
+                            detail="Send text/csv or application/x-ndjson, or pass ?format=csv|ndjson.")
+    try:
+        return await import_products(db, request.stream(), import_format, delimiter)
+    except UnicodeDecodeError:
+        # Пачки до ошибки уже записаны - повторный импорт того же файла безопасен (upsert по article)
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Import body must be UTF-8 encoded.")
+
+
+@router.post("/batch", response_model=schemas.ProductBatchResponse)
+def api_read_products_batch(batch: schemas.ProductBatchRequest, db: Session = Depends(get_db)):
+    """
+    Актуальные данные N товаров (корзина, оформление заказа) за один запрос к API вместо N вызовов GET /{product_id}.
+    Ненайденные id и артикулы перечисляются явно в missing_ids / missing_articles.
+    """
+    requested_ids = list(dict.fromkeys(batch.ids))
+    requested_articles = list(dict.fromkeys(batch.articles))
+    db_products = crud.get_products_batch(db, product_ids=requested_ids, articles=requested_articles)
+    by_id = {p.product_id: p for p in db_products}
+    by_article = {p.article: p for p in db_products}
+
+    items, seen = [], set()
+    for db_product in [by_id.get(i) for i in requested_ids] + [by_article.get(a) for a in requested_articles]:
+        if db_product is not None and db_product.product_id not in seen:
+            seen.add(db_product.product_id)
+            items.append(schemas.Product.model_validate(db_product))
+    return schemas.ProductBatchResponse(
+        items=items,
+        missing_ids=[i for i in requested_ids if i not in by_id],
+        missing_articles=[a for a in requested_articles if a not in by_article]
+    )
+
+
+@router.patch("/bulk", response_model=schemas.ProductBulkUpdateReport)
+def api_bulk_update_products(bulk: schemas.ProductBulkUpdate, db: Session = Depends(get_db)):
+    """
+    Массовое изменение цены, остатка и активности (прайс от поставщика, инвентаризация) одним запросом к БД.
+    Результат - по каждой позиции: updated, unchanged, not_found или superseded.
+    """
+    return crud.bulk_update_products(db, bulk.items)
+
+
 @router.get("/", response_model=schemas.ProductListResponse)  # Используем новую схему ответа
 def api_read_products(
+        response: Response,
         skip: int = Query(0, ge=0, description="Количество пропускаемых записей"),
         limit: int = Query(20, ge=1, le=100, description="Максимальное количество записей"),
-        search: Optional[str] = Query(None, description="Строка для поиска по названию или артикулу"),  # Для поиска
-        technology: Optional[models.LampTechnologyEnum] = Query(None, description="Фильтр по технологии лампы (например, Светодиодная, Накаливания)"),
+        filters: schemas.ProductFilters = Depends(schemas.ProductFilters.as_query),  # search, technology, socket, ...
+        cursor: Optional[str] = Query(None, description="Курсор из next_cursor предыдущего ответа (keyset-пагинация, skip игнорируется)"),
+        include_facets: bool = Query(False, description="Добавить в ответ счетчики по значениям фильтров"),
+        count_strategy: Optional[str] = Query(None, alias="count", pattern="^(exact|cached|estimate)$",
+                                              description="Как считать total_count: exact, cached или estimate"),
+        if_none_match: Optional[str] = Header(None),
+        db: Session = Depends(get_db)
+):
+    count_strategy = count_strategy or settings.PRODUCT_LIST_COUNT_STRATEGY
+    # Нормализованные параметры - ключ кэша списка (skip не влияет на выдачу по курсору)
+    cache_params = {
+        "skip": None if cursor else skip, "limit": limit, "cursor": cursor,
+        "filters": filters.cache_key(), "include_facets": include_facets, "count": count_strategy,
+    }
+    if catalog_snapshot.ready and not include_facets:
+        # Режим снимка: страница собирается из заранее сериализованных товаров, количество - точное
+        try:
+            snapshot_page = catalog_snapshot.list_page(filters, skip=skip, limit=limit, cursor=cursor)
+        except ValueError as e:  # Некорректный курсор
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+        if snapshot_page is not None:
+            list_etag = make_etag("products", sorted(cache_params.items()), snapshot_page.total_count,
+                                  snapshot_page.max_updated_at, None)
+            if etag_matches(if_none_match, list_etag):
+                return not_modified(list_etag)
+            return prerendered_json(render_list_response(snapshot_page, skip, limit, cursor), list_etag)
+
+    cached_entry = product_cache.get_list(cache_params)
+    if cached_entry is not None:
+        if etag_matches(if_none_match, cached_entry["etag"]):
+            return not_modified(cached_entry["etag"])
+        set_validators(response, cached_entry["etag"])
+        return cached_entry["payload"]
+    cache_generation = product_cache.generation()
+
+    # ETag списка: параметры запроса + версия выборки. Версия берется ДО чтения страницы,
+    # поэтому при гонке с записью ETag окажется "старее" данных, а не наоборот.
+    # Курсорная страница не отдает total_count, поэтому COUNT(*) для нее не выполняется.
+    list_count, max_updated_at, last_deleted_at = crud.get_products_list_version(
+        db, filters=filters, count_strategy=None if cursor else count_strategy
+    )
+    list_etag = make_etag("products", sorted(cache_params.items()), list_count.value if list_count else None,
+                          max_updated_at, last_deleted_at)
+    if etag_matches(if_none_match, list_etag):
+        return not_modified(list_etag)
+
+    try:
+        product_rows, total_count, next_cursor = crud.get_all_products(
+            db, skip=skip, limit=limit, filters=filters, cursor=cursor,
+            total_count=list_count.value if list_count else None
+        )
+    except ValueError as e:  # Некорректный курсор
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+
+    items_response = [schemas.ProductInList.from_row(row) for row in product_rows]
+
+    if cursor:
+        # В курсорном режиме номер страницы и общее количество не вычисляются
+        list_response = schemas.ProductListResponse(items=items_response, limit=limit, next_cursor=next_cursor)
+    else:
+        current_page = (skip // limit) + 1 if limit > 0 else 1
+        total_pages = ceil(total_count / limit) if limit > 0 else 1
+
+        list_response = schemas.ProductListResponse(
+            items=items_response,
+            total_count=total_count,
+            page=current_page,
+            limit=limit,
+            pages=total_pages,
+            next_cursor=next_cursor,
+            total_count_is_approximate=list_count.approximate
+        )
+
+    if include_facets:
+        # Один сгруппированный запрос на все фасеты (см. crud.get_product_facets)
+        list_response.facets = crud.get_product_facets(db, filters=filters)
+
+    response_payload = list_response.model_dump(mode="json")
+    product_cache.set_list(cache_params, {"etag": list_etag, "payload": response_payload}, cache_generation)
+    set_validators(response, list_etag)
+    return response_payload
+
+
+@router.get("/cache/stats", response_model=schemas.CacheStats)
+def api_read_cache_stats():
+    # Счетчики попаданий/промахов кэша текущего процесса (воркера)
+    return product_cache.stats()
+
+
+@router.get("/changes", response_model=schemas.ProductChangesResponse)  # Объявлен до /{product_id}
+def api_read_product_changes(
+        since: Optional[str] = Query(None, description="next_watermark из предыдущего ответа; без него - с начала"),
+        limit: int = Query(500, ge=1, le=5000),
         db: Session = Depends(get_db)
 ):
-    products_models, total_count = crud.get_all_products(db, skip=skip, limit=limit, search_term=search, technology=technology)
-
-    items_response = []
-    for p in products_models:
-        main_image_url = p.images[0].image_url if p.images else None
-        items_response.append(schemas.ProductInList(
-            product_id=p.product_id, name=p.name, article=p.article, stock_quantity=p.stock_quantity,
-            price=p.price, main_image_url=main_image_url
-        ))
-
-    current_page = (skip // limit) + 1 if limit > 0 else 1
-    total_pages = ceil(total_count / limit) if limit > 0 else 1
-
-    return schemas.ProductListResponse(
-        items=items_response,
-        total_count=total_count,
-        page=current_page,
-        limit=limit,
-        pages=total_pages
+    """
+    Лента изменений каталога для инкрементальной синхронизации кэшей и индексов:
+    id созданных/измененных и удаленных товаров после водяного знака.
+    """
+    try:
+        changes, next_watermark, has_more = crud.get_product_changes(db, since=since, limit=limit)
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    return schemas.ProductChangesResponse(
+        upserted=[change.product_id for change in changes if not change.deleted],
+        deleted=[change.product_id for change in changes if change.deleted],
+        next_watermark=next_watermark,
+        has_more=has_more
+    )
+
+
+@router.get("/export")  # Объявлен до /{product_id}, иначе "export" разбирался бы как UUID
+def api_export_products(
+        export_format: str = Query("ndjson", alias="format", pattern="^(ndjson|csv)$"),
+        include_images: bool = Query(False, description="Добавить URL изображений товара"),
+        filters: schemas.ProductFilters = Depends(schemas.ProductFilters.as_query)
+):
+    """
+    Выгрузка всего каталога (или его части по фильтрам) одним потоковым ответом.
+    Данные читаются серверным курсором и отдаются по мере чтения; COUNT(*) не выполняется.
+    """
+    filename = f"products-{datetime.now().strftime('%Y%m%d-%H%M%S')}.{export_format}"
+    return StreamingResponse(
+        iter_export(export_format, filters=filters, include_images=include_images),
+        media_type=EXPORT_MEDIA_TYPES[export_format],
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'}
     )
 
 
 @router.get("/{product_id}", response_model=schemas.Product)
-def api_read_product(product_id: uuid.UUID, db: Session = Depends(get_db)):
+def api_read_product(
+        product_id: uuid.UUID,
+        response: Response,
+        if_none_match: Optional[str] = Header(None),
+        db: Session = Depends(get_db)
+):
+    snapshot_entry = catalog_snapshot.get_product(product_id)
+    if snapshot_entry is not None:
+        etag = product_etag(product_id, snapshot_entry.updated_at)
+        if etag_matches(if_none_match, etag):
+            return not_modified(etag)
+        return prerendered_json(snapshot_entry.detail_json, etag)
+
+    cached_product = product_cache.get_product(product_id)
+    if cached_product is not None:
+        etag = product_etag(product_id, datetime.fromisoformat(cached_product["updated_at"]))
+        if etag_matches(if_none_match, etag):
+            return not_modified(etag)
+        set_validators(response, etag)
+        return cached_product
+    cache_generation = product_cache.generation()
+
+    if if_none_match:
+        # Условный запрос: сверяем только updated_at, товар и изображения не загружаем
+        updated_at = crud.get_product_updated_at(db, product_id=product_id)
+        if updated_at is not None and etag_matches(if_none_match, product_etag(product_id, updated_at)):
+            return not_modified(product_etag(product_id, updated_at))
+
     db_product = crud.get_product_by_id(db, product_id=product_id)
     if db_product is None:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Product not found")
-    return db_product
+
+    product_payload = schemas.Product.model_validate(db_product).model_dump(mode="json")
+    product_cache.set_product(product_id, product_payload, cache_generation)
+    set_validators(response, product_etag(product_id, db_product.updated_at))
+    return product_payload
 
 
 @router.put("/{product_id}", response_model=schemas.Product)
@@ -112,8 +313,8 @@ def api_delete_product(product_id: uuid.UUID, db: Session = Depends(get_db)):
     deleted_product_from_db = crud.delete_product_by_id(db=db, product_id=product_id)
 
     if deleted_product_from_db:
-        for url in image_urls_to_delete:
-            delete_physical_image(url)
+        # Файл удаляется, только если других товаров с той же картинкой не осталось
+        crud.release_physical_images(db, image_urls_to_delete)
 
     return db_product
 
@@ -123,31 +324,34 @@ def api_delete_product(product_id: uuid.UUID, db: Session = Depends(get_db)):
 async def api_upload_additional_images(
         product_id: uuid.UUID,
         files: List[UploadFile] = File(...),
-        db: Session = Depends(get_db)
+        db: AsyncSession = Depends(get_async_db)
 ):
-    db_product = crud.get_product_by_id(db, product_id=product_id)
+    db_product = await crud_async.get_product_by_id(db, product_id=product_id)
     if not db_product:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Product not found")
 
     created_db_images = []
-    physically_saved_image_urls_for_cleanup = []
+    staged_files = []
+    saved_files = []  # Файлы, перенесенные в хранилище этим запросом (для очистки при ошибке)
 
     try:
-        for file_to_upload in files:
-            public_url = await save_upload_file_async(file_to_upload, product_id)
-            physically_saved_image_urls_for_cleanup.append(public_url)
-
-            image_schema = schemas.ProductImageCreate(image_url=public_url)
+        await crud_async.touch_product(db, product_id)  # Новые изображения меняют представление товара (ETag)
+        staged_files = await stage_upload_files_concurrently(files)
+        await crud_async.store_staged_uploads(db, staged_files, saved_files)
+        variants_ready = await crud_async.generate_variants_for(saved_files)
+        for saved_image, has_variants in zip(saved_files, variants_ready):
+            image_schema = schemas.ProductImageCreate(image_url=saved_image.url, content_hash=saved_image.content_hash,
+                                                      has_variants=has_variants)
             img_model = crud.create_db_product_image(db=db, image_data=image_schema, product_id=product_id)
             created_db_images.append(img_model)
 
-        db.commit()
+        await db.commit()
+        product_cache.invalidate_product(product_id)
         for img_model in created_db_images:  # Обновляем каждую модель, чтобы получить сгенерированные БД поля (product_image_id, upload_at)
-            db.refresh(img_model)
+            await db.refresh(img_model)
     except (ValueError, IOError) as e:
-        db.rollback()
-        for url in physically_saved_image_urls_for_cleanup:
-            delete_physical_image(url)
+        await db.rollback()
+        await crud_async.discard_failed_upload(db, staged_files, saved_files)
         detail_msg = str(e)
         if isinstance(e, ValueError):  # Ошибка валидации типа файла
             raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=detail_msg)
@@ -155,9 +359,8 @@ async def api_upload_additional_images(
             raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
                                 detail=f"Failed to save image: {detail_msg}")
     except Exception as e_db:  # Другие ошибки БД
-        db.rollback()
-        for url in physically_saved_image_urls_for_cleanup:
-            delete_physical_image(url)
+        await db.rollback()
+        await crud_async.discard_failed_upload(db, staged_files, saved_files)
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
                             detail=f"Database or unexpected error: {str(e_db)}")
 
@@ -171,10 +374,13 @@ def api_delete_image(image_id: uuid.UUID, db: Session = Depends(get_db)):
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Image not found")
 
     image_url_to_delete = db_image.image_url
+    owner_product_id = db_image.product_id
 
     crud.delete_db_product_image(db=db, product_image_id=image_id)
+    crud.touch_product(db, owner_product_id)
     db.commit()
+    product_cache.invalidate_product(owner_product_id)
 
-    delete_physical_image(image_url_to_delete)
+    crud.release_physical_images(db, [image_url_to_delete])  # Файл мог быть общим с другими записями
 
     return db_image
\ No newline at end of file
@@ -0,0 +1,49 @@
+from fastapi import APIRouter, Depends, HTTPException, status, Response
+from sqlalchemy.orm import Session
+
+from app import schemas
+from app.db import get_db
+from app.stock_reservations import (
+    reserve_stock, release_stock, get_reservation, InsufficientStockError, ReservationKeyConflictError
+)
+
+router = APIRouter(
+    prefix="/stock",
+    tags=["Stock"],
+)
+
+
+@router.post("/reservations", response_model=schemas.StockReservation, status_code=status.HTTP_201_CREATED)
+def api_reserve_stock(reservation: schemas.StockReservationCreate, response: Response, db: Session = Depends(get_db)):
+    """
+    Списывает остатки по списку товаров одной транзакцией: либо все позиции, либо ни одной (409 со списком нехватки).
+    Повтор с тем же reservation_key безопасен: возвращается уже созданное резервирование (200).
+    """
+    try:
+        db_reservation, created = reserve_stock(db, reservation)
+    except InsufficientStockError as e:
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail={
+            "message": str(e), "shortages": [shortage.model_dump(mode="json") for shortage in e.shortages]
+        })
+    except ReservationKeyConflictError as e:
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=str(e))
+    if not created:
+        response.status_code = status.HTTP_200_OK
+    return db_reservation
+
+
+@router.get("/reservations/{reservation_key}", response_model=schemas.StockReservation)
+def api_read_reservation(reservation_key: str, db: Session = Depends(get_db)):
+    db_reservation = get_reservation(db, reservation_key)
+    if db_reservation is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Reservation not found")
+    return db_reservation
+
+
+@router.post("/reservations/{reservation_key}/release", response_model=schemas.StockReservation)
+def api_release_reservation(reservation_key: str, db: Session = Depends(get_db)):
+    # Идемпотентно: для уже отмененного резервирования просто возвращает его
+    db_reservation = release_stock(db, reservation_key)
+    if db_reservation is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Reservation not found")
+    return db_reservation
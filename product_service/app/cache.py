@@ -0,0 +1,304 @@
+import hashlib
+import json
+import threading
+import time
+import uuid
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import Any, Optional
+
+from .config import settings
+
+
+# --- Бэкенды кэша ---
+# Значения - JSON-совместимые структуры (dict/list), уже готовые к отдаче клиенту.
+class CacheBackend(ABC):
+    name = "base"
+
+    @abstractmethod
+    def get(self, key: str) -> Optional[Any]:
+        ...
+
+    @abstractmethod
+    def set(self, key: str, value: Any, ttl_seconds: int) -> None:
+        ...
+
+    @abstractmethod
+    def delete(self, *keys: str) -> None:
+        ...
+
+    @abstractmethod
+    def get_counter(self, key: str) -> int:
+        ...
+
+    @abstractmethod
+    def incr(self, key: str) -> int:
+        ...
+
+
+class NullCacheBackend(CacheBackend):
+    # Кэш выключен: всегда промах
+    name = "none"
+
+    def get(self, key: str) -> Optional[Any]:
+        return None
+
+    def set(self, key: str, value: Any, ttl_seconds: int) -> None:
+        pass
+
+    def delete(self, *keys: str) -> None:
+        pass
+
+    def get_counter(self, key: str) -> int:
+        return 0
+
+    def incr(self, key: str) -> int:
+        return 0
+
+
+class InMemoryLRUCacheBackend(CacheBackend):
+    # LRU с TTL в памяти процесса. Счетчики хранятся отдельно, чтобы LRU их не вытеснял.
+    name = "memory"
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, tuple[float, Any]]" = OrderedDict()
+        self._counters: dict[str, int] = {}
+        self._lock = threading.Lock()  # Синхронные эндпоинты выполняются в пуле потоков
+
+    def get(self, key: str) -> Optional[Any]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at < time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key: str, value: Any, ttl_seconds: int) -> None:
+        with self._lock:
+            self._entries[key] = (time.monotonic() + ttl_seconds, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def delete(self, *keys: str) -> None:
+        with self._lock:
+            for key in keys:
+                self._entries.pop(key, None)
+
+    def get_counter(self, key: str) -> int:
+        with self._lock:
+            return self._counters.get(key, 0)
+
+    def incr(self, key: str) -> int:
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + 1
+            return self._counters[key]
+
+
+class RedisCacheBackend(CacheBackend):
+    # Общий кэш для нескольких воркеров/реплик сервиса
+    name = "redis"
+
+    def __init__(self, url: str):
+        try:
+            import redis
+        except ImportError as e:
+            raise RuntimeError("PRODUCT_CACHE_BACKEND=redis requires the 'redis' package.") from e
+        self._client = redis.Redis.from_url(url, socket_timeout=0.5, socket_connect_timeout=0.5)
+
+    def get(self, key: str) -> Optional[Any]:
+        raw = self._client.get(key)
+        return json.loads(raw) if raw is not None else None
+
+    def set(self, key: str, value: Any, ttl_seconds: int) -> None:
+        self._client.set(key, json.dumps(value, separators=(",", ":")), ex=ttl_seconds)
+
+    def delete(self, *keys: str) -> None:
+        if keys:
+            self._client.delete(*keys)
+
+    def get_counter(self, key: str) -> int:
+        raw = self._client.get(key)
+        return int(raw) if raw is not None else 0
+
+    def incr(self, key: str) -> int:
+        return int(self._client.incr(key))
+
+
+# --- Кэш товаров поверх бэкенда ---
+class ProductCache:
+    """
+    Read-through кэш для GET /products/{id} и GET /products/.
+
+    Ключи: товар - по product_id, список - по нормализованным параметрам запроса.
+    Все ключи включают "поколение" кэша. Любая запись увеличивает поколение,
+    поэтому закэшированные страницы списков становятся недоступны разом.
+    Значение, прочитанное из БД до инвалидации, не записывается (проверка поколения в set_*).
+    Ошибки бэкенда (например, недоступный Redis) не ломают запрос - считаются промахом.
+    Количества для списков (counting.py, стратегия cached) от поколения не зависят и живут свой TTL.
+    """
+
+    GENERATION_KEY = "products:generation"
+
+    def __init__(self, backend: CacheBackend, ttl_seconds: int):
+        self.backend = backend
+        self.ttl_seconds = ttl_seconds
+        self.hits = 0
+        self.misses = 0
+        self.errors = 0
+        self._stats_lock = threading.Lock()
+        self._invalidation_listeners = []
+
+    # --- Чтение ---
+    def generation(self) -> int:
+        try:
+            return self.backend.get_counter(self.GENERATION_KEY)
+        except Exception as e:
+            self._on_error("generation", e)
+            return -1
+
+    def get_product(self, product_id: uuid.UUID) -> Optional[dict]:
+        return self._get(self._product_key(product_id))
+
+    def get_list(self, params: dict) -> Optional[dict]:
+        generation = self.generation()
+        if generation < 0:
+            self._count(hit=False)
+            return None
+        return self._get(self._list_key(params, generation))
+
+    def get_count(self, params: dict) -> Optional[int]:
+        # Мимо _get: счетчики попаданий/промахов (/products/cache/stats) относятся к карточкам и страницам
+        try:
+            return self.backend.get(self._count_key(params))
+        except Exception as e:
+            self._on_error("get", e)
+            return None
+
+    # --- Запись ---
+    def set_product(self, product_id: uuid.UUID, payload: dict, generation: int) -> None:
+        if generation >= 0 and self.generation() == generation:
+            self._set(self._product_key(product_id), payload)
+
+    def set_list(self, params: dict, payload: dict, generation: int) -> None:
+        if generation >= 0 and self.generation() == generation:
+            self._set(self._list_key(params, generation), payload)
+
+    def set_count(self, params: dict, count: int, ttl_seconds: int) -> None:
+        try:
+            self.backend.set(self._count_key(params), count, ttl_seconds)
+        except Exception as e:
+            self._on_error("set", e)
+
+    # --- Инвалидация ---
+    def add_invalidation_listener(self, listener) -> None:
+        # listener(product_ids) вызывается после каждой инвалидации; None - изменились все товары (invalidate_lists)
+        self._invalidation_listeners.append(listener)
+
+    def invalidate_product(self, product_id: uuid.UUID) -> None:
+        # Изменение товара влияет и на его карточку, и на любые страницы списка
+        try:
+            self.backend.delete(self._product_key(product_id))
+            self.backend.incr(self.GENERATION_KEY)
+        except Exception as e:
+            self._on_error("invalidate", e)
+        self._notify_listeners([product_id])
+
+    def invalidate_products(self, product_ids) -> None:
+        # Массовые изменения (импорт): все ключи одним вызовом бэкенда, поколение - один раз
+        product_ids = list(product_ids)
+        keys = [self._product_key(product_id) for product_id in product_ids]
+        try:
+            if keys:
+                self.backend.delete(*keys)
+            self.backend.incr(self.GENERATION_KEY)
+        except Exception as e:
+            self._on_error("invalidate", e)
+        self._notify_listeners(product_ids)
+
+    def invalidate_lists(self) -> None:
+        try:
+            self.backend.incr(self.GENERATION_KEY)
+        except Exception as e:
+            self._on_error("invalidate", e)
+        self._notify_listeners(None)
+
+    def stats(self) -> dict:
+        with self._stats_lock:
+            total = self.hits + self.misses
+            return {
+                "backend": self.backend.name,
+                "hits": self.hits,
+                "misses": self.misses,
+                "errors": self.errors,
+                "hit_ratio": round(self.hits / total, 4) if total else 0.0,
+            }
+
+    # --- Внутреннее ---
+    @staticmethod
+    def _product_key(product_id: uuid.UUID) -> str:
+        return f"products:item:{product_id}"
+
+    @staticmethod
+    def _list_key(params: dict, generation: int) -> str:
+        normalized = json.dumps(params, sort_keys=True, default=str, separators=(",", ":"))
+        digest = hashlib.sha1(normalized.encode("utf-8")).hexdigest()
+        return f"products:list:{generation}:{digest}"
+
+    @staticmethod
+    def _count_key(params: dict) -> str:
+        normalized = json.dumps(params, sort_keys=True, default=str, separators=(",", ":"))
+        return f"products:count:{hashlib.sha1(normalized.encode('utf-8')).hexdigest()}"
+
+    def _notify_listeners(self, product_ids) -> None:
+        for listener in self._invalidation_listeners:
+            try:
+                listener(product_ids)
+            except Exception as e:
+                print(f"CACHE: invalidation listener failed: {e}")
+
+    def _get(self, key: str) -> Optional[Any]:
+        try:
+            value = self.backend.get(key)
+        except Exception as e:
+            self._on_error("get", e)
+            value = None
+        self._count(hit=value is not None)
+        return value
+
+    def _set(self, key: str, value: Any) -> None:
+        try:
+            self.backend.set(key, value, self.ttl_seconds)
+        except Exception as e:
+            self._on_error("set", e)
+
+    def _count(self, hit: bool) -> None:
+        with self._stats_lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    def _on_error(self, operation: str, error: Exception) -> None:
+        with self._stats_lock:
+            self.errors += 1
+        print(f"CACHE: {operation} failed on {self.backend.name} backend: {type(error).__name__} - {error}")
+
+
+def build_cache_backend() -> CacheBackend:
+    backend_name = settings.PRODUCT_CACHE_BACKEND.lower()
+    if backend_name == "memory":
+        return InMemoryLRUCacheBackend(max_entries=settings.PRODUCT_CACHE_MAX_ENTRIES)
+    if backend_name == "redis":
+        return RedisCacheBackend(url=settings.PRODUCT_CACHE_REDIS_URL)
+    if backend_name == "none":
+        return NullCacheBackend()
+    raise ValueError(f"Unknown PRODUCT_CACHE_BACKEND '{settings.PRODUCT_CACHE_BACKEND}'. Use memory, redis or none.")
+
+
+product_cache = ProductCache(backend=build_cache_backend(), ttl_seconds=settings.PRODUCT_CACHE_TTL_SECONDS)
@@ -0,0 +1,298 @@
+import json
+import threading
+import uuid
+from bisect import bisect_left
+from datetime import datetime, timedelta
+from math import ceil
+from typing import NamedTuple, Optional
+
+from sqlalchemy import func as sqlalchemy_func, select
+from sqlalchemy.orm import Session
+
+from . import crud, models, schemas
+from .cache import product_cache
+from .config import settings
+from .db import SessionLocal
+from .image_variant_paths import variant_urls
+from .pagination import decode_cursor, encode_watermark, next_cursor_for
+
+# Снимок каталога в памяти процесса (PRODUCT_SNAPSHOT_ENABLED): для каждого товара заранее сериализованы
+# JSON плитки списка (ProductInList) и карточки (Product). Ответы GET /products/ и GET /products/{id}
+# собираются склейкой готовых байтов - без запросов к БД, ORM-объектов и Pydantic на каждый товар.
+#
+# Снимок неизменяем: обновление собирает новое состояние и подменяет ссылку, читатели не блокируются.
+# Обновление инкрементальное, в фоновом потоке:
+#   - товары, инвалидированные в этом процессе (product_cache), перечитываются сразу после записи;
+#     пока новое состояние не опубликовано, такие карточки (и списки целиком) отдаются из БД,
+#     поэтому GET после PUT/DELETE в том же воркере не получает устаревшие байты и ETag;
+#   - записи других воркеров и реплик приходят из ленты изменений (crud.get_product_changes) - с задержкой
+#     до PRODUCT_CHANGES_SAFETY_LAG_SECONDS + PRODUCT_SNAPSHOT_REFRESH_SECONDS.
+# Поиск (ранжирование pg_trgm) и фасеты снимок не обслуживает - такие запросы идут обычным путем через БД.
+# Как и список из БД, снимок содержит все товары, а не только активные.
+
+
+class SnapshotEntry(NamedTuple):
+    product_id: uuid.UUID
+    created_at: datetime
+    updated_at: datetime
+    product_technology: Optional[str]
+    socket: Optional[str]
+    manufacturer: Optional[str]
+    class_energy_efficiency: Optional[str]
+    power: Optional[object]
+    lumens: Optional[int]
+    color_temperature: Optional[int]
+    price: object
+    list_json: bytes  # ProductInList
+    detail_json: bytes  # Product (с изображениями)
+
+
+class SnapshotState(NamedTuple):
+    entries: dict  # product_id -> SnapshotEntry
+    order: tuple  # Порядок списка: (created_at, product_id) по убыванию
+    ascending_keys: list  # Те же ключи по возрастанию - для bisect по курсору
+    max_updated_at: Optional[datetime]
+
+
+class SnapshotListPage(NamedTuple):
+    items: list
+    total_count: int
+    max_updated_at: Optional[datetime]
+    next_cursor: Optional[str]
+
+
+FILTER_ATTRIBUTES = {
+    "technology": "product_technology", "socket": "socket",
+    "manufacturer": "manufacturer", "energy_class": "class_energy_efficiency",
+}
+RANGE_ATTRIBUTES = ("power", "lumens", "color_temperature", "price")
+
+
+def build_entry(db_product: models.Product) -> SnapshotEntry:
+    main_image = db_product.images[0] if db_product.images else None  # images упорядочены как в списке
+    list_item = schemas.ProductInList(
+        product_id=db_product.product_id, name=db_product.name, article=db_product.article,
+        price=db_product.price, stock_quantity=db_product.stock_quantity,
+        main_image_url=main_image.image_url if main_image else None,
+        main_image_variants=variant_urls(main_image.image_url) if main_image and main_image.has_variants else None
+    )
+    return SnapshotEntry(
+        product_id=db_product.product_id, created_at=db_product.created_at, updated_at=db_product.updated_at,
+        product_technology=db_product.product_technology, socket=db_product.socket,
+        manufacturer=db_product.manufacturer, class_energy_efficiency=db_product.class_energy_efficiency,
+        power=db_product.power, lumens=db_product.lumens, color_temperature=db_product.color_temperature,
+        price=db_product.price,
+        list_json=list_item.model_dump_json().encode("utf-8"),
+        detail_json=schemas.Product.model_validate(db_product).model_dump_json().encode("utf-8"),
+    )
+
+
+def build_state(entries: dict) -> SnapshotState:
+    order = tuple(sorted(entries.values(), key=lambda entry: (entry.created_at, entry.product_id), reverse=True))
+    return SnapshotState(
+        entries=entries,
+        order=order,
+        ascending_keys=[(entry.created_at, entry.product_id) for entry in reversed(order)],
+        max_updated_at=max((entry.updated_at for entry in order), default=None),
+    )
+
+
+def matches(entry: SnapshotEntry, filters: schemas.ProductFilters) -> bool:
+    # Те же условия, что crud.product_filter_conditions (кроме поиска); NULL не проходит диапазон, как в SQL
+    for name, attribute in FILTER_ATTRIBUTES.items():
+        values = getattr(filters, name)
+        if values and getattr(entry, attribute) not in values:
+            return False
+    for name in RANGE_ATTRIBUTES:
+        low, high = getattr(filters, f"min_{name}"), getattr(filters, f"max_{name}")
+        if low is None and high is None:
+            continue
+        value = getattr(entry, name)
+        if value is None or (low is not None and value < low) or (high is not None and value > high):
+            return False
+    return True
+
+
+def render_list_response(page: SnapshotListPage, skip: int, limit: int, cursor: Optional[str]) -> bytes:
+    # Поля и их порядок - как в schemas.ProductListResponse
+    if cursor:
+        tail = {"total_count": None, "total_count_is_approximate": False, "page": None, "limit": limit,
+                "pages": None, "next_cursor": page.next_cursor, "facets": None}
+    else:
+        tail = {"total_count": page.total_count, "total_count_is_approximate": False, "page": skip // limit + 1,
+                "limit": limit, "pages": ceil(page.total_count / limit), "next_cursor": page.next_cursor,
+                "facets": None}
+    tail_json = json.dumps(tail, ensure_ascii=False, separators=(",", ":"))
+    return b'{"items":[' + b",".join(entry.list_json for entry in page.items) + b"]," + tail_json[1:].encode("utf-8")
+
+
+class CatalogSnapshot:
+    def __init__(self, refresh_seconds: float):
+        self.refresh_seconds = refresh_seconds
+        self._state: Optional[SnapshotState] = None
+        self._watermark: Optional[str] = None
+        self._changed_ids: set = set()
+        self._refreshing_ids: set = set()  # Взяты в текущее обновление, но еще не опубликованы
+        self._full_reload = False
+        self._reloading = False  # Идет полная загрузка по mark_changed(None)
+        self._lock = threading.Lock()  # Защищает множества id и флаги; состояние подменяется целиком
+        self._wakeup = threading.Event()
+        self._stopped = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def ready(self) -> bool:
+        return self._state is not None
+
+    # --- Жизненный цикл ---
+    def start(self) -> None:
+        product_cache.add_invalidation_listener(self.mark_changed)
+        self._thread = threading.Thread(target=self._run, name="catalog-snapshot", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stopped.set()
+        self._wakeup.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+
+    def clear(self) -> None:
+        # Запросы снова обслуживаются из БД до следующей загрузки (load)
+        self._state = None
+
+    def mark_changed(self, product_ids) -> None:
+        # Вызывается после коммита записи в этом процессе; None - изменилось неизвестно что
+        with self._lock:
+            if product_ids is None:
+                self._full_reload = True
+            else:
+                self._changed_ids.update(product_ids)
+        self._wakeup.set()
+
+    def _run(self) -> None:
+        while not self._stopped.is_set():
+            self._wakeup.clear()  # Сигналы, пришедшие во время обновления, разбудят следующую итерацию
+            try:
+                with SessionLocal() as db:
+                    if self._state is None or self._take_full_reload():
+                        self.load(db)
+                    else:
+                        self.refresh(db)
+            except Exception as e:  # Ошибка БД не останавливает поток; до первой загрузки запросы идут в БД
+                print(f"SNAPSHOT: refresh failed: {e}")
+            self._wakeup.wait(self.refresh_seconds)
+
+    def _take_full_reload(self) -> bool:
+        with self._lock:
+            full_reload, self._full_reload = self._full_reload, False
+            self._reloading = full_reload
+            return full_reload
+
+    def _begin_update(self) -> set:
+        # Накопленные id переходят в обновляемые: для читателей они остаются ожидающими до _end_update
+        with self._lock:
+            self._refreshing_ids, self._changed_ids = self._changed_ids, set()
+            return set(self._refreshing_ids)
+
+    def _end_update(self, published: bool) -> None:
+        # Вызывается после подмены состояния; при ошибке изменения вернутся в очередь следующей попытки
+        with self._lock:
+            if not published:
+                self._changed_ids.update(self._refreshing_ids)
+                self._full_reload = self._full_reload or self._reloading
+            self._refreshing_ids = set()
+            self._reloading = False
+
+    def _is_pending(self, product_id: Optional[uuid.UUID] = None) -> bool:
+        # Запись этого процесса еще не попала в снимок; без product_id - есть ли такие записи вообще
+        with self._lock:
+            if self._full_reload or self._reloading:
+                return True
+            if product_id is None:
+                return bool(self._changed_ids or self._refreshing_ids)
+            return product_id in self._changed_ids or product_id in self._refreshing_ids
+
+    # --- Загрузка и обновление ---
+    def load(self, db: Session) -> None:
+        # Водяной знак берется до чтения: изменения во время загрузки придут повторно из ленты (это безопасно)
+        start_at = db.execute(select(sqlalchemy_func.now())).scalar()
+        watermark = encode_watermark(start_at - timedelta(seconds=settings.PRODUCT_CHANGES_SAFETY_LAG_SECONDS),
+                                     uuid.UUID(int=0))
+        self._begin_update()  # Полное чтение покроет и записи, накопленные до него
+        try:
+            entries = {db_product.product_id: build_entry(db_product)
+                       for db_product in db.query(models.Product).all()}
+            self._state, self._watermark = build_state(entries), watermark
+        except Exception:
+            self._end_update(published=False)
+            raise
+        self._end_update(published=True)
+        print(f"SNAPSHOT: loaded {len(entries)} products")
+
+    def refresh(self, db: Session) -> None:
+        changed_ids = self._begin_update()
+        try:
+            watermark = self._watermark
+            while True:
+                changes, watermark, has_more = crud.get_product_changes(db, since=watermark, limit=1000)
+                changed_ids.update(change.product_id for change in changes)
+                if not has_more:
+                    break
+            if changed_ids:
+                # Товары перечитываются по id: удаленные не найдутся и будут убраны из снимка
+                db_products = crud.get_products_batch(db, product_ids=list(changed_ids), articles=[])
+                entries = dict(self._state.entries)
+                for product_id in changed_ids:
+                    entries.pop(product_id, None)
+                for db_product in db_products:
+                    entries[db_product.product_id] = build_entry(db_product)
+                self._state = build_state(entries)
+        except Exception:
+            self._end_update(published=False)  # Не потерять изменения до следующей попытки
+            raise
+        self._watermark = watermark
+        self._end_update(published=True)
+
+    # --- Чтение ---
+    def get_product(self, product_id: uuid.UUID) -> Optional[SnapshotEntry]:
+        if self._is_pending(product_id):  # Проверка до чтения состояния: ожидание снимается после публикации
+            return None
+        state = self._state
+        return state.entries.get(product_id) if state is not None else None
+
+    def list_page(self, filters: schemas.ProductFilters, skip: int, limit: int,
+                  cursor: Optional[str]) -> Optional[SnapshotListPage]:
+        """None - запрос снимком не обслуживается (снимок не загружен, задан поиск или есть неопубликованные записи)."""
+        if filters.search or self._is_pending():
+            return None
+        state = self._state
+        if state is None:
+            return None
+
+        if filters.cache_key():
+            matched = [entry for entry in state.order if matches(entry, filters)]
+            max_updated_at = max((entry.updated_at for entry in matched), default=None)
+        else:
+            matched, max_updated_at = state.order, state.max_updated_at
+
+        if cursor:
+            cursor_created_at, cursor_product_id, cursor_rank = decode_cursor(cursor)  # ValueError - некорректный курсор
+            if cursor_rank is not None:
+                raise ValueError("Pagination cursor does not match the search parameters.")
+            cursor_key = (cursor_created_at, cursor_product_id)
+            if matched is state.order:
+                start = len(matched) - bisect_left(state.ascending_keys, cursor_key)
+            else:
+                start = next((index for index, entry in enumerate(matched)
+                              if (entry.created_at, entry.product_id) < cursor_key), len(matched))
+        else:
+            start = skip
+
+        items = list(matched[start:start + limit + 1])
+        has_more = len(items) > limit
+        items = items[:limit]
+        return SnapshotListPage(items=items, total_count=len(matched), max_updated_at=max_updated_at,
+                                next_cursor=next_cursor_for(items, has_more))
+
+
+catalog_snapshot = CatalogSnapshot(refresh_seconds=settings.PRODUCT_SNAPSHOT_REFRESH_SECONDS)
@@ -1,6 +1,7 @@
 from pydantic_settings import BaseSettings, SettingsConfigDict
 import os
 from pathlib import Path
+from typing import Optional
 
 APP_BASE_DIR = Path(__file__).parent.resolve()
 STATIC_FILES_DIR = APP_BASE_DIR / "static"
@@ -9,9 +10,58 @@ PRODUCT_IMAGES_DIR = STATIC_FILES_DIR / "product_images"
 
 class Settings(BaseSettings):
     PRODUCT_DATABASE_URL: str
+    # Если не задан, строится из PRODUCT_DATABASE_URL с драйвером asyncpg
+    PRODUCT_ASYNC_DATABASE_URL: Optional[str] = None
 
     APP_NAME: str = "Product Service"
 
+    # Кэш чтения товаров: "memory" (LRU+TTL в процессе), "redis" (общий для воркеров) или "none"
+    PRODUCT_CACHE_BACKEND: str = "memory"
+    PRODUCT_CACHE_TTL_SECONDS: int = 60
+    PRODUCT_CACHE_MAX_ENTRIES: int = 2048
+    PRODUCT_CACHE_REDIS_URL: str = "redis://redis:6379/0"
+
+    # Загрузка изображений
+    PRODUCT_IMAGE_MAX_BYTES: int = 10 * 1024 * 1024  # Лимит на один файл
+    PRODUCT_UPLOAD_MAX_REQUEST_BYTES: int = 64 * 1024 * 1024  # Лимит на весь multipart-запрос
+    PRODUCT_UPLOAD_PARALLEL_WRITES: int = 4  # Сколько файлов одного запроса пишется одновременно
+
+    # Уменьшенные копии изображений (максимальная сторона, px) и пул процессов для их генерации
+    PRODUCT_IMAGE_THUMB_SIZE: int = 320
+    PRODUCT_IMAGE_MEDIUM_SIZE: int = 1024
+    PRODUCT_IMAGE_WEBP_QUALITY: int = 80
+    PRODUCT_IMAGE_VARIANT_WORKERS: int = 2  # 0 - без пула процессов (ресайз в пуле потоков)
+
+    # Сборка мусора в product_images (app/scripts/gc_orphan_images.py): файлы моложе grace-периода не трогаются
+    PRODUCT_IMAGE_GC_GRACE_HOURS: float = 24
+    PRODUCT_IMAGE_GC_QUARANTINE_DIR: Optional[str] = None  # Вне static: содержимое static раздается публично
+
+    # Массовый импорт товаров (POST /products/import)
+    PRODUCT_IMPORT_BATCH_SIZE: int = 1000  # Строк в одном INSERT ... ON CONFLICT (14 параметров на строку)
+    PRODUCT_IMPORT_MAX_REPORTED_ERRORS: int = 1000  # Остальные ошибки только считаются
+
+    # Общее количество в списке товаров (см. counting.py): exact, cached или estimate
+    PRODUCT_LIST_COUNT_STRATEGY: str = "exact"
+    PRODUCT_COUNT_CACHE_TTL_SECONDS: int = 30
+    PRODUCT_COUNT_ESTIMATE_MIN_ROWS: int = 10000
+
+    # Лента изменений (GET /products/changes): изменения моложе задержки не отдаются (см. crud.get_product_changes)
+    PRODUCT_CHANGES_SAFETY_LAG_SECONDS: int = 5
+
+    # Раздача /static (см. static_files.py). Файлы с хэшем в имени кэшируются как immutable независимо от max-age
+    PRODUCT_STATIC_MAX_AGE_SECONDS: int = 3600
+    # Если задан (например, "/internal-static/"), файлы отдает nginx по X-Accel-Redirect
+    PRODUCT_STATIC_ACCEL_REDIRECT_PREFIX: Optional[str] = None
+
+    # Снимок каталога в памяти воркера (см. catalog_snapshot.py): список и карточки без обращения к БД
+    PRODUCT_SNAPSHOT_ENABLED: bool = False
+    PRODUCT_SNAPSHOT_REFRESH_SECONDS: float = 2.0  # Период опроса ленты изменений (записи других воркеров)
+
+    # Пакетная выборка товаров (POST /products/batch): ids + articles в одном запросе
+    PRODUCT_BATCH_MAX_ITEMS: int = 500
+    # Массовое изменение цены/остатка (PATCH /products/bulk): позиций в одном запросе
+    PRODUCT_BULK_UPDATE_MAX_ITEMS: int = 5000
+
     model_config = SettingsConfigDict(env_file=".env", env_file_encoding='utf-8', extra='ignore')
 
 
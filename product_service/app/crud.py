@@ -1,24 +1,83 @@
 from sqlalchemy.orm import Session
 from sqlalchemy.exc import IntegrityError
-from sqlalchemy import func as sqlalchemy_func
+from sqlalchemy import func as sqlalchemy_func, tuple_, literal, cast, Boolean, select, true, and_, or_, case, any_, bindparam, String, \
+    Integer, update
+from sqlalchemy.dialects.postgresql import ARRAY, DOUBLE_PRECISION, UUID
+from sqlalchemy.engine import Row
 from typing import List, Optional
 import uuid
-import os
+import heapq
+from datetime import datetime, timedelta
 from fastapi import UploadFile
 
 from . import models, schemas
-from .utils_uploads import save_upload_file_sync
+from .utils_uploads import (stage_upload_file_sync, store_staged_upload, discard_staged_uploads, delete_physical_image,
+                            StagedUpload, SavedImage)
+from .image_variants import generate_variants_sync
+from .pagination import decode_cursor, next_cursor_for, decode_watermark, encode_watermark
+from .cache import product_cache
+from .counting import CountResult, RowCounter
+from .config import settings
+
+# total_count списков товаров: стратегии - в counting.py, кэш и пороги - настройки сервиса
+row_counter = RowCounter(cache=product_cache, cache_ttl_seconds=settings.PRODUCT_COUNT_CACHE_TTL_SECONDS,
+                         estimate_min_rows=settings.PRODUCT_COUNT_ESTIMATE_MIN_ROWS)
 
 
 # --- ProductImage CRUD ---
 def create_db_product_image(db: Session, image_data: schemas.ProductImageCreate,
                             product_id: uuid.UUID) -> models.ProductImage:
     # Эта функция только создает объект модели и добавляет в сессию, НЕ коммитит.
-    db_image = models.ProductImage(product_id=product_id, image_url=image_data.image_url)
+    db_image = models.ProductImage(
+        product_id=product_id, image_url=image_data.image_url, content_hash=image_data.content_hash,
+        has_variants=image_data.has_variants
+    )
     db.add(db_image)
     return db_image
 
 
+def image_file_lock(image_url: str):
+    # Транзакционная advisory-блокировка файла изображения (файлы общие для одинакового содержимого).
+    # Загрузка держит ее от решения "переиспользовать или записать файл" до коммита строки product_images,
+    # удаление - от подсчета оставшихся ссылок до unlink. Ключ - URL: он однозначно задает файл.
+    return select(sqlalchemy_func.pg_advisory_xact_lock(sqlalchemy_func.hashtextextended(f"product_image:{image_url}", 0)))
+
+
+def lock_image_files(db: Session, image_urls: List[str]) -> None:
+    # Блокировки берутся в одном порядке (по URL) - без взаимных блокировок между параллельными запросами
+    for image_url in sorted(set(image_urls)):
+        db.execute(image_file_lock(image_url))
+
+
+def count_image_references(db: Session, image_urls: List[str]) -> dict[str, int]:
+    # Сколько записей product_images ссылается на каждый URL (файлы общие для одинакового содержимого)
+    if not image_urls:
+        return {}
+    rows = (
+        db.query(models.ProductImage.image_url, sqlalchemy_func.count())
+        .filter(models.ProductImage.image_url.in_(set(image_urls)))
+        .group_by(models.ProductImage.image_url)
+        .all()
+    )
+    counts = {url: 0 for url in image_urls}
+    counts.update({url: count for url, count in rows})
+    return counts
+
+
+def release_physical_images(db: Session, image_urls: List[str]) -> None:
+    # Вызывать ПОСЛЕ commit/rollback: удаляет с диска файлы, на которые больше нет ссылок в БД.
+    # Ссылки считаются под блокировкой файлов, поэтому загрузка, переиспользующая файл, либо уже закоммитила
+    # свою строку (файл останется), либо дождется блокировки и запишет файл заново. Коммит снимает блокировки.
+    if not image_urls:
+        return
+    lock_image_files(db, image_urls)
+    try:
+        for url, remaining_references in count_image_references(db, image_urls).items():
+            delete_physical_image(url, remaining_references)
+    finally:
+        db.commit()
+
+
 def get_db_product_image(db: Session, product_image_id: uuid.UUID) -> Optional[models.ProductImage]:
     return db.query(models.ProductImage).filter(models.ProductImage.product_image_id == product_image_id).first()
 
@@ -35,6 +94,18 @@ def get_product_by_id(db: Session, product_id: uuid.UUID) -> Optional[models.Pro
     return db.query(models.Product).filter(models.Product.product_id == product_id).first()
 
 
+def get_product_updated_at(db: Session, product_id: uuid.UUID) -> Optional[datetime]:
+    # Легкий запрос для проверки If-None-Match: без загрузки товара и изображений
+    return db.query(models.Product.updated_at).filter(models.Product.product_id == product_id).scalar()
+
+
+def touch_product(db: Session, product_id: uuid.UUID) -> None:
+    # Изменение набора изображений - изменение товара: двигаем updated_at (ETag, кэши). НЕ коммитит.
+    db.query(models.Product).filter(models.Product.product_id == product_id).update(
+        {models.Product.updated_at: sqlalchemy_func.now()}, synchronize_session=False
+    )
+
+
 def get_product_by_article(db: Session, article: str) -> Optional[models.Product]:
     return db.query(models.Product).filter(models.Product.article == article).first()
 
@@ -43,32 +114,319 @@ def get_product_by_name(db: Session, name: str) -> Optional[models.Product]:
     return db.query(models.Product).filter(models.Product.name == name).first()
 
 
-def get_all_products(
+def get_products_batch(db: Session, product_ids: List[uuid.UUID], articles: List[str]) -> List[models.Product]:
+    """
+    Товары по списку id и/или артикулов одним запросом: product_id = ANY(:ids) OR article = ANY(:articles).
+    Каждый список - один параметр-массив, поэтому текст запроса не зависит от их длины.
+    Изображения всех найденных товаров подгружаются вторым запросом (lazy="selectin" на relationship).
+    """
+    conditions = []
+    if product_ids:
+        conditions.append(models.Product.product_id == any_(
+            bindparam("product_ids", product_ids, type_=ARRAY(UUID(as_uuid=True)))
+        ))
+    if articles:
+        conditions.append(models.Product.article == any_(bindparam("articles", articles, type_=ARRAY(String))))
+    if not conditions:
+        return []
+    return db.query(models.Product).filter(or_(*conditions)).all()
+
+
+def product_filter_conditions(filters: schemas.ProductFilters) -> dict:
+    # Условия фильтров по имени фасета (для подсчета фасетов каждое нужно отдельно)
+    conditions = {}
+    if filters.search:
+        # Поиск подстроки по имени и артикулу. ILIKE без lower() и с экранированием
+        # спецсимволов обслуживается GIN-индексами pg_trgm (idx_products_*_trgm)
+        search_filter = f"%{escape_like(filters.search)}%"
+        conditions["search"] = (
+            models.Product.name.ilike(search_filter, escape="\\") |
+            models.Product.article.ilike(search_filter, escape="\\")
+        )
+    if filters.technology:
+        conditions["technology"] = models.Product.product_technology.in_(filters.technology)
+    if filters.socket:
+        conditions["socket"] = models.Product.socket.in_(filters.socket)
+    if filters.manufacturer:
+        conditions["manufacturer"] = models.Product.manufacturer.in_(filters.manufacturer)
+    if filters.energy_class:
+        conditions["energy_class"] = models.Product.class_energy_efficiency.in_(filters.energy_class)
+
+    range_columns = {
+        "power": models.Product.power, "lumens": models.Product.lumens,
+        "color_temperature": models.Product.color_temperature, "price": models.Product.price,
+    }
+    for name, column in range_columns.items():
+        bounds = []
+        if getattr(filters, f"min_{name}") is not None:
+            bounds.append(column >= getattr(filters, f"min_{name}"))
+        if getattr(filters, f"max_{name}") is not None:
+            bounds.append(column <= getattr(filters, f"max_{name}"))
+        if bounds:
+            conditions[name] = and_(*bounds)
+    return conditions
+
+
+def _search_rank(filters: schemas.ProductFilters):
+    # Результаты поиска ранжируются по триграммной похожести; без поиска - None.
+    # similarity() возвращает real; ранг сразу приводится к double precision, чтобы сортировка, значение
+    # в курсоре (float Python) и сравнение с ним шли в одном типе - иначе при сравнении real с параметром
+    # значение 0.3 превращается в 0.30000001192092896 и товары с равным рангом теряются или повторяются
+    if not filters.search:
+        return None
+    return cast(sqlalchemy_func.greatest(
+        sqlalchemy_func.similarity(models.Product.name, filters.search),
+        sqlalchemy_func.similarity(models.Product.article, filters.search)
+    ), DOUBLE_PRECISION)
+
+
+def _apply_product_filters(query, filters: Optional[schemas.ProductFilters] = None):
+    # Возвращает (отфильтрованный запрос, выражение ранга поиска или None)
+    filters = filters or schemas.ProductFilters()
+    conditions = product_filter_conditions(filters)
+    if conditions:
+        query = query.filter(*conditions.values())
+    return query, _search_rank(filters)
+
+
+def get_products_list_version(
         db: Session,
-        skip: int = 0,
-        limit: int = 20,
-        search_term: Optional[str] = None,
-        technology: Optional[models.LampTechnologyEnum] = None
-) -> tuple[List[models.Product], int]:  # Возвращаем кортеж: (список_товаров, общее_количество)
-
-    query = db.query(models.Product)
-
-    if search_term:
-        # Простой поиск по имени и артикулу
-        search_filter = f"%{search_term.lower()}%"
-        query = query.filter(
-            (sqlalchemy_func.lower(models.Product.name).ilike(search_filter)) |
-            (sqlalchemy_func.lower(models.Product.article).ilike(search_filter))
+        filters: Optional[schemas.ProductFilters] = None,
+        count_strategy: Optional[str] = "exact"
+) -> tuple[Optional[CountResult], Optional[datetime], Optional[datetime]]:
+    # Версия выборки для ETag списка: (количество, max(updated_at), время последнего удаления).
+    # Любая вставка/изменение двигает max(updated_at), удаление - max(product_tombstones.deleted_at)
+    # (таблица общая для всех фильтров, поэтому удаление любого товара меняет версию всех списков).
+    # Количество заодно служит total_count страницы: в режиме exact оно считается тем же запросом,
+    # в режимах cached/estimate - по стратегии из counting.py (удаление отражается в нем с задержкой,
+    # но версию меняет сразу через tombstone).
+    # count_strategy=None - без подсчета (курсорные страницы total_count не отдают).
+    filters = filters or schemas.ProductFilters()
+    last_deleted_at = select(sqlalchemy_func.max(models.ProductTombstone.deleted_at)).scalar_subquery()
+    if count_strategy == "exact":
+        query, _ = _apply_product_filters(
+            db.query(sqlalchemy_func.count(models.Product.product_id), sqlalchemy_func.max(models.Product.updated_at),
+                     last_deleted_at),
+            filters=filters
+        )
+        count, max_updated_at, max_deleted_at = query.one()
+        return CountResult(count, approximate=False), max_updated_at, max_deleted_at
+
+    max_query, _ = _apply_product_filters(
+        db.query(sqlalchemy_func.max(models.Product.updated_at), last_deleted_at), filters=filters
+    )
+    max_updated_at, max_deleted_at = max_query.one()
+    if count_strategy is None:
+        return None, max_updated_at, max_deleted_at
+    count_query, _ = _apply_product_filters(db.query(models.Product.product_id), filters=filters)
+    list_count = row_counter.count(
+        db, count_query, count_strategy, table_name="products",
+        filtered=bool(product_filter_conditions(filters)), signature=filters.cache_key()
+    )
+    return list_count, max_updated_at, max_deleted_at
+
+
+# Фасеты со списком значений: имя фасета -> колонка
+FACET_COLUMNS = {
+    "technology": models.Product.product_technology,
+    "socket": models.Product.socket,
+    "manufacturer": models.Product.manufacturer,
+    "energy_class": models.Product.class_energy_efficiency,
+}
+RANGE_FACET_COLUMNS = {
+    "power": models.Product.power,
+    "lumens": models.Product.lumens,
+    "color_temperature": models.Product.color_temperature,
+    "price": models.Product.price,
+}
+
+
+def get_product_facets(db: Session, filters: Optional[schemas.ProductFilters] = None) -> schemas.ProductFacets:
+    """
+    Счетчики фасетов одним запросом: GROUP BY GROUPING SETS ((technology), (socket), (manufacturer),
+    (energy_class), ()). В WHERE - только фильтры, общие для всех фасетов (поиск и диапазоны);
+    фильтр по самому фасету исключается из его счетчика через count(*) FILTER (WHERE ...),
+    поэтому выбор одного цоколя не "схлопывает" список остальных цоколей.
+    Пустой набор группировки () дает диапазоны (min/max) по товарам, прошедшим все фильтры.
+    """
+    filters = filters or schemas.ProductFilters()
+    conditions = product_filter_conditions(filters)
+    common = [condition for name, condition in conditions.items() if name not in FACET_COLUMNS]
+    facet_conditions = {name: conditions[name] for name in FACET_COLUMNS if name in conditions}
+
+    def matches_all_except(excluded: Optional[str]):
+        selected = [condition for name, condition in facet_conditions.items() if name != excluded]
+        return and_(true(), *selected)
+
+    # grouping(col) = 0 - строка относится к набору группировки по этой колонке
+    count_expression = case(
+        *(
+            (sqlalchemy_func.grouping(column) == 0,
+             sqlalchemy_func.count().filter(matches_all_except(name)))
+            for name, column in FACET_COLUMNS.items()
+        ),
+        else_=sqlalchemy_func.count().filter(matches_all_except(None))
+    )
+    range_expressions = []
+    for name, column in RANGE_FACET_COLUMNS.items():
+        range_expressions.append(sqlalchemy_func.min(column).filter(matches_all_except(None)).label(f"min_{name}"))
+        range_expressions.append(sqlalchemy_func.max(column).filter(matches_all_except(None)).label(f"max_{name}"))
+
+    query = db.query(
+        *(column.label(name) for name, column in FACET_COLUMNS.items()),
+        *(sqlalchemy_func.grouping(column).label(f"grouping_{name}") for name, column in FACET_COLUMNS.items()),
+        count_expression.label("count"),
+        *range_expressions
+    )
+    if common:
+        query = query.filter(*common)
+    rows = query.group_by(
+        sqlalchemy_func.grouping_sets(*(tuple_(column) for column in FACET_COLUMNS.values()), tuple_())
+    ).all()
+
+    facets = schemas.ProductFacets()
+    for row in rows:
+        facet_name = next((name for name in FACET_COLUMNS if getattr(row, f"grouping_{name}") == 0), None)
+        if facet_name is None:  # Итоговая строка набора ()
+            for name in RANGE_FACET_COLUMNS:
+                setattr(facets, name, schemas.RangeFacet(min=getattr(row, f"min_{name}"), max=getattr(row, f"max_{name}")))
+            continue
+        value = getattr(row, facet_name)
+        if value is None or not row.count:  # NULL в необязательной колонке и значения без товаров не показываем
+            continue
+        getattr(facets, facet_name).append(
+            schemas.FacetValue(value=value.value if hasattr(value, "value") else str(value), count=row.count)
         )
 
-    if technology:
-        query = query.filter(models.Product.product_technology == technology)
+    for name in FACET_COLUMNS:
+        getattr(facets, name).sort(key=lambda facet: (-facet.count, facet.value))
+    return facets
+
+
+# Колонки товара для ProductInList (+ created_at - ключ курсора)
+PRODUCT_LIST_COLUMNS = (
+    models.Product.product_id,
+    models.Product.name,
+    models.Product.article,
+    models.Product.price,
+    models.Product.stock_quantity,
+    models.Product.created_at,
+)
 
-    total_count = query.count()  # Получаем общее количество до применения offset/limit
 
-    products = query.order_by(models.Product.created_at.desc()).offset(skip).limit(limit).all()
+def _main_image_lateral():
+    # Главное изображение - самое раннее загруженное. LATERAL + LIMIT 1 по индексу
+    # idx_product_images_product_upload: одна короткая выборка на товар страницы
+    return (
+        select(models.ProductImage.image_url, models.ProductImage.has_variants)
+        .where(models.ProductImage.product_id == models.Product.product_id)
+        .order_by(models.ProductImage.upload_at, models.ProductImage.product_image_id)
+        .limit(1)
+        .lateral("main_image")
+    )
 
-    return products, total_count
+
+def get_all_products(
+        db: Session,
+        skip: int = 0,
+        limit: int = 20,
+        filters: Optional[schemas.ProductFilters] = None,
+        cursor: Optional[str] = None,
+        total_count: Optional[int] = None
+) -> tuple[List[Row], Optional[int], Optional[str]]:
+    # Возвращаем кортеж: (строки_товаров, общее_количество, курсор_следующей_страницы).
+    # Строки - легкие Row с колонками PRODUCT_LIST_COLUMNS, main_image_url и main_image_has_variants,
+    # а не ORM-объекты: для плитки каталога не нужны ни полные товары, ни все их изображения.
+    # Если передан cursor - работаем в режиме keyset-пагинации: skip игнорируется,
+    # COUNT(*) не выполняется (total_count = None).
+    # Уже известное количество (см. get_products_list_version) передается в total_count и не пересчитывается.
+
+    query, rank = _apply_product_filters(db.query(*PRODUCT_LIST_COLUMNS), filters=filters)
+
+    offset = 0
+    if cursor:
+        # Seek по (created_at, product_id) - использует индекс idx_products_created_at_id;
+        # при поиске ключ сортировки дополняется рангом похожести
+        cursor_created_at, cursor_product_id, cursor_rank = decode_cursor(cursor)
+        if (rank is None) != (cursor_rank is None):
+            raise ValueError("Pagination cursor does not match the search parameters.")
+        cursor_key = (literal(cursor_created_at, models.Product.created_at.type), cursor_product_id)
+        if rank is not None:
+            query = query.filter(
+                tuple_(rank, models.Product.created_at, models.Product.product_id) <
+                tuple_(literal(cursor_rank, DOUBLE_PRECISION), *cursor_key)
+            )
+        else:
+            query = query.filter(tuple_(models.Product.created_at, models.Product.product_id) < tuple_(*cursor_key))
+        total_count = None
+    else:
+        if total_count is None:
+            total_count = query.count()  # Получаем общее количество до применения offset/limit
+        offset = skip
+
+    # Главное изображение присоединяется после COUNT(*) - подсчету оно не нужно
+    main_image = _main_image_lateral()
+    query = query.outerjoin(main_image, true()).add_columns(
+        main_image.c.image_url.label("main_image_url"),
+        main_image.c.has_variants.label("main_image_has_variants"),
+    )
+
+    # product_id - тай-брейкер: у товаров, вставленных одной транзакцией, created_at совпадает
+    order_by = [models.Product.created_at.desc(), models.Product.product_id.desc()]
+    if rank is not None:
+        query = query.add_columns(rank.label("rank"))
+        order_by.insert(0, rank.desc())
+
+    rows = query.order_by(*order_by).offset(offset).limit(limit + 1).all()  # Одна лишняя запись - признак наличия следующей страницы
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+
+    last_rank = rows[-1].rank if rank is not None and rows else None
+    return rows, total_count, next_cursor_for(rows, has_more, last_rank)
+
+
+def _changes_upper_bound():
+    # updated_at - время начала транзакции: транзакция, начатая раньше, может зафиксироваться позже уже отданных
+    # изменений. Изменения моложе задержки не отдаются, чтобы водяной знак не "перепрыгнул" через такие записи.
+    return sqlalchemy_func.now() - timedelta(seconds=settings.PRODUCT_CHANGES_SAFETY_LAG_SECONDS)
+
+
+def get_product_changes(
+        db: Session,
+        since: Optional[str] = None,
+        limit: int = 500
+) -> tuple[List[Row], Optional[str], bool]:
+    """
+    Изменения каталога после водяного знака since (None - с самого начала).
+    Возвращает (строки (changed_at, product_id, deleted) по возрастанию ключа, следующий водяной знак, есть ли еще).
+    Изменения - из products по индексу idx_products_updated_at_id, удаления - из product_tombstones.
+    """
+    watermark = decode_watermark(since) if since else None  # ValueError для некорректного знака
+    upper_bound = _changes_upper_bound()
+
+    def stream(timestamp_column, id_column, deleted: bool):
+        query = db.query(
+            timestamp_column.label("changed_at"), id_column.label("product_id"), literal(deleted, Boolean).label("deleted")
+        ).filter(timestamp_column <= upper_bound)
+        if watermark is not None:
+            query = query.filter(tuple_(timestamp_column, id_column) > tuple_(
+                literal(watermark[0], timestamp_column.type), literal(watermark[1], id_column.type)
+            ))
+        return query.order_by(timestamp_column, id_column).limit(limit + 1).all()
+
+    upserts = stream(models.Product.updated_at, models.Product.product_id, deleted=False)
+    deletes = stream(models.ProductTombstone.deleted_at, models.ProductTombstone.product_id, deleted=True)
+    changes = list(heapq.merge(upserts, deletes, key=lambda row: (row.changed_at, row.product_id)))
+
+    has_more = len(changes) > limit
+    changes = changes[:limit]
+    next_watermark = encode_watermark(changes[-1].changed_at, changes[-1].product_id) if changes else since
+    return changes, next_watermark, has_more
+
+
+def escape_like(value: str) -> str:
+    # Экранирует спецсимволы LIKE, чтобы '%' и '_' в строке поиска искались буквально
+    return value.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
 
 
 def create_product(db: Session, product_data: schemas.ProductCreate,
@@ -82,7 +440,8 @@ def create_product(db: Session, product_data: schemas.ProductCreate,
     db_product = models.Product(**product_data.model_dump())
     db.add(db_product)
 
-    physically_saved_files_info: List[tuple[Path, str]] = []  # (path, url)
+    staged_files: List[StagedUpload] = []
+    physically_saved_files_info: List[SavedImage] = []
     created_image_models_in_session = []
 
     try:
@@ -95,14 +454,20 @@ def create_product(db: Session, product_data: schemas.ProductCreate,
             print(f"CRUD: Processing {len(image_files)} image files for product {db_product.product_id}")
             for file_to_upload in image_files:
                 print(f"CRUD: Saving file {file_to_upload.filename}")
-                full_file_path, public_url = save_upload_file_sync(
-                    file=file_to_upload,
-                    entity_id_for_filename=db_product.product_id
+                staged_files.append(stage_upload_file_sync(file=file_to_upload))
+
+            # Файлы переносятся в хранилище под блокировками, которые держатся до коммита (см. lock_image_files)
+            lock_image_files(db, [staged.url for staged in staged_files])
+            for staged in staged_files:
+                saved_image = store_staged_upload(staged)
+                physically_saved_files_info.append(saved_image)
+                public_url = saved_image.url
+                print(f"CRUD: File saved to {saved_image.path}, URL: {public_url}")
+
+                image_schema = schemas.ProductImageCreate(
+                    image_url=public_url, content_hash=saved_image.content_hash,
+                    has_variants=generate_variants_sync(saved_image.path)
                 )
-                physically_saved_files_info.append((full_file_path, public_url))
-                print(f"CRUD: File {file_to_upload.filename} saved to {full_file_path}, URL: {public_url}")
-
-                image_schema = schemas.ProductImageCreate(image_url=public_url)
                 img_model = create_db_product_image(db=db, image_data=image_schema, product_id=db_product.product_id)
                 created_image_models_in_session.append(img_model)
                 print(f"CRUD: ProductImage model for {public_url} added to session.")
@@ -110,6 +475,7 @@ def create_product(db: Session, product_data: schemas.ProductCreate,
         print("CRUD: Committing transaction for product and images.")
         db.commit()
         print("CRUD: Transaction committed.")
+        product_cache.invalidate_product(db_product.product_id)
 
         db.refresh(db_product)
         for img_model in created_image_models_in_session:
@@ -118,36 +484,41 @@ def create_product(db: Session, product_data: schemas.ProductCreate,
 
     except Exception as e:
         print(f"CRUD: EXCEPTION OCCURRED: {type(e).__name__} - {str(e)}")
-        db.rollback()  # Откатываем транзакцию БД
+        db.rollback()  # Откатываем транзакцию БД (и снимаем блокировки файлов)
         print("CRUD: Transaction rolled back.")
 
-        for f_path, _ in physically_saved_files_info:
-            if f_path.exists():
-                try:
-                    os.remove(f_path)
-                    print(f"CRUD: Cleaned up physical file {f_path}")
-                except Exception as e_del:
-                    print(f"CRUD: ERROR cleaning up file {f_path}: {e_del}")
-
-        if isinstance(e, IntegrityError):
-            detail = "Database integrity error (e.g., duplicate article/name)."
-            # Попытка получить более конкретную информацию об ошибке уникальности
-            if hasattr(e.orig, 'diag') and hasattr(e.orig.diag, 'constraint_name'):
-                constraint_name = e.orig.diag.constraint_name
-                detail += f" Violated constraint: {constraint_name}."
-            elif "products_article_key" in str(e.orig).lower():
-                detail = f"Product article '{product_data.article}' already exists."
-            elif "products_name_key" in str(e.orig).lower():
-                detail = f"Product name '{product_data.name}' already exists."
-            raise ValueError(detail) from e
-        elif isinstance(e, (IOError, ValueError)):  # Ошибки от save_upload_file_sync
-            raise ValueError(f"Error processing product/image data: {str(e)}") from e
-        else:  # Другие непредвиденные ошибки
-            raise RuntimeError(f"An unexpected error occurred during product creation: {str(e)}") from e
+        # Удаляем только файлы, созданные этой операцией, и только если на них никто не сослался
+        try:
+            discard_staged_uploads(staged_files)
+            release_physical_images(db, [saved.url for saved in physically_saved_files_info if saved.created])
+        except Exception as e_del:
+            print(f"CRUD: ERROR cleaning up files: {e_del}")
+
+        raise product_creation_error(e, product_data) from e
 
     return db_product
 
 
+def product_creation_error(e: Exception, product_data: schemas.ProductCreate) -> Exception:
+    # Переводит исключение при создании товара в ValueError/RuntimeError для API слоя
+    # (общая логика для синхронного crud и crud_async)
+    if isinstance(e, IntegrityError):
+        detail = "Database integrity error (e.g., duplicate article/name)."
+        # Попытка получить более конкретную информацию об ошибке уникальности
+        if hasattr(e.orig, 'diag') and hasattr(e.orig.diag, 'constraint_name'):
+            constraint_name = e.orig.diag.constraint_name
+            detail += f" Violated constraint: {constraint_name}."
+        elif "products_article_key" in str(e.orig).lower():
+            detail = f"Product article '{product_data.article}' already exists."
+        elif "products_name_key" in str(e.orig).lower():
+            detail = f"Product name '{product_data.name}' already exists."
+        return ValueError(detail)
+    elif isinstance(e, (IOError, ValueError)):  # Ошибки от stage_upload_file_sync/store_staged_upload
+        return ValueError(f"Error processing product/image data: {str(e)}")
+    else:  # Другие непредвиденные ошибки
+        return RuntimeError(f"An unexpected error occurred during product creation: {str(e)}")
+
+
 def update_existing_product(db: Session, product_id: uuid.UUID, product_update_data: schemas.ProductUpdate) -> Optional[
     models.Product]:
     db_product = get_product_by_id(db, product_id=product_id)
@@ -173,13 +544,112 @@ def update_existing_product(db: Session, product_id: uuid.UUID, product_update_d
         db.rollback()
         # ... (обработка IntegrityError как в create_product) ...
         raise ValueError("Could not update product due to DB integrity error.") from e
+    product_cache.invalidate_product(product_id)
     return db_product
 
 
+def _resolve_bulk_update_targets(db: Session, items: List[schemas.ProductBulkUpdateItem]) -> dict:
+    # Товары позиций по id и артикулу одним запросом. Строки блокируются в порядке product_id, как при
+    # резервировании остатков: параллельные массовые изменения и резервирования не взаимоблокируются
+    product_ids = [item.product_id for item in items if item.product_id is not None]
+    articles = [item.article for item in items if item.article is not None]
+    conditions = []
+    if product_ids:
+        conditions.append(models.Product.product_id == any_(
+            bindparam("product_ids", product_ids, type_=ARRAY(UUID(as_uuid=True)))
+        ))
+    if articles:
+        conditions.append(models.Product.article == any_(bindparam("articles", articles, type_=ARRAY(String))))
+    rows = db.execute(
+        select(models.Product.product_id, models.Product.article)
+        .where(or_(*conditions))
+        .order_by(models.Product.product_id)
+        .with_for_update()
+    ).all()
+    targets = {("id", row.product_id): row.product_id for row in rows}
+    targets.update({("article", row.article): row.product_id for row in rows})
+    return targets
+
+
+def _bulk_update_rows(rows: List[tuple]):
+    # unnest(:ids, :prices, :stocks, :is_active) AS requested(...); NULL в массиве - поле не передано
+    return sqlalchemy_func.unnest(
+        bindparam("bulk_ids", [product_id for product_id, _ in rows], type_=ARRAY(UUID(as_uuid=True))),
+        bindparam("bulk_prices", [item.price for _, item in rows], type_=ARRAY(models.Product.price.type)),
+        bindparam("bulk_stocks", [item.stock_quantity for _, item in rows], type_=ARRAY(Integer)),
+        bindparam("bulk_is_active", [item.is_active for _, item in rows], type_=ARRAY(Boolean)),
+    ).table_valued("product_id", "price", "stock_quantity", "is_active").render_derived(name="requested")
+
+
+def bulk_update_products(db: Session, items: List[schemas.ProductBulkUpdateItem]) -> schemas.ProductBulkUpdateReport:
+    """
+    Цена, остаток и активность многих товаров одним UPDATE ... FROM unnest(...): значения передаются
+    параметрами-массивами, поэтому текст запроса не зависит от числа позиций. Не переданное поле (NULL)
+    сохраняет текущее значение (COALESCE). Строки, в которых ничего не меняется, не обновляются -
+    их updated_at не сдвигается, и они не попадают в ленту изменений.
+    Если товар встречается в запросе несколько раз, применяется последняя позиция (как при импорте).
+    """
+    targets = _resolve_bulk_update_targets(db, items)
+
+    results: List[schemas.ProductBulkUpdateResult] = []
+    applied: dict[uuid.UUID, int] = {}  # product_id -> индекс позиции, которая будет применена
+    for index, item in enumerate(items):
+        key = ("id", item.product_id) if item.product_id is not None else ("article", item.article)
+        product_id = targets.get(key)
+        results.append(schemas.ProductBulkUpdateResult(
+            index=index, product_id=product_id, article=item.article,
+            status="not_found" if product_id is None else "unchanged"
+        ))
+        if product_id is not None:
+            if product_id in applied:
+                results[applied[product_id]].status = "superseded"
+            applied[product_id] = index
+
+    updated_ids = []
+    if applied:
+        rows = [(product_id, items[index]) for product_id, index in sorted(applied.items(), key=lambda pair: str(pair[0]))]
+        requested = _bulk_update_rows(rows)
+        new_price = sqlalchemy_func.coalesce(requested.c.price, models.Product.price)
+        new_stock = sqlalchemy_func.coalesce(requested.c.stock_quantity, models.Product.stock_quantity)
+        new_is_active = sqlalchemy_func.coalesce(requested.c.is_active, models.Product.is_active)
+        try:
+            updated_ids = db.execute(
+                update(models.Product)
+                .where(models.Product.product_id == requested.c.product_id,
+                       or_(new_price.is_distinct_from(models.Product.price),
+                           new_stock.is_distinct_from(models.Product.stock_quantity),
+                           new_is_active.is_distinct_from(models.Product.is_active)))
+                .values(price=new_price, stock_quantity=new_stock, is_active=new_is_active,
+                        updated_at=sqlalchemy_func.now())
+                .returning(models.Product.product_id)
+            ).scalars().all()
+        except Exception:
+            db.rollback()
+            raise
+    db.commit()  # Снимает блокировки и в случае, когда обновлять нечего
+
+    for product_id in updated_ids:
+        results[applied[product_id]].status = "updated"
+    if updated_ids:
+        product_cache.invalidate_products(updated_ids)  # Одна инвалидация на весь пакет
+
+    report = schemas.ProductBulkUpdateReport(
+        updated=len(updated_ids),
+        unchanged=sum(1 for result in results if result.status == "unchanged"),
+        failed=sum(1 for result in results if result.status == "not_found"),
+        superseded=sum(1 for result in results if result.status == "superseded"),
+        results=results,
+    )
+    print(f"BULK UPDATE: {len(items)} item(s): {report.updated} updated, {report.unchanged} unchanged, "
+          f"{report.failed} not found, {report.superseded} superseded")
+    return report
+
+
 def delete_product_by_id(db: Session, product_id: uuid.UUID) -> Optional[models.Product]:
     db_product = get_product_by_id(db, product_id)
     if db_product:
-        # Физическое удаление файлов изображений должно происходить в API слое до вызова этого
+        # Файлы изображений удаляет API слой после коммита (release_physical_images)
         db.delete(db_product)  # SQLAlchemy cascade удалит записи из product_images
         db.commit()
+        product_cache.invalidate_product(product_id)
     return db_product
\ No newline at end of file
@@ -0,0 +1,181 @@
+# Асинхронные версии CRUD-функций товара (AsyncSession + asyncpg) для async-эндпоинтов.
+# Логика и сообщения об ошибках совпадают с синхронным crud.py.
+from sqlalchemy import select, update, func as sqlalchemy_func, literal_column, Boolean
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import List, Optional
+import asyncio
+import uuid
+from fastapi import UploadFile
+
+from . import models, schemas
+from .crud import create_db_product_image, product_creation_error, image_file_lock
+from .utils_uploads import (stage_upload_files_concurrently, store_staged_upload_async, discard_staged_uploads,
+                            delete_physical_image, StagedUpload, SavedImage)
+from .image_variants import generate_variants
+from .cache import product_cache
+
+
+# --- ProductImage CRUD ---
+async def get_db_product_image(db: AsyncSession, product_image_id: uuid.UUID) -> Optional[models.ProductImage]:
+    result = await db.execute(
+        select(models.ProductImage).where(models.ProductImage.product_image_id == product_image_id)
+    )
+    return result.scalars().first()
+
+
+async def lock_image_files(db: AsyncSession, image_urls: List[str]) -> None:
+    # См. crud.lock_image_files
+    for image_url in sorted(set(image_urls)):
+        await db.execute(image_file_lock(image_url))
+
+
+async def count_image_references(db: AsyncSession, image_urls: List[str]) -> dict[str, int]:
+    # См. crud.count_image_references
+    if not image_urls:
+        return {}
+    result = await db.execute(
+        select(models.ProductImage.image_url, sqlalchemy_func.count())
+        .where(models.ProductImage.image_url.in_(set(image_urls)))
+        .group_by(models.ProductImage.image_url)
+    )
+    counts = {url: 0 for url in image_urls}
+    counts.update({url: count for url, count in result.all()})
+    return counts
+
+
+async def release_physical_images(db: AsyncSession, image_urls: List[str]) -> None:
+    # См. crud.release_physical_images: вызывать ПОСЛЕ commit/rollback
+    if not image_urls:
+        return
+    await lock_image_files(db, image_urls)
+    try:
+        for url, remaining_references in (await count_image_references(db, image_urls)).items():
+            delete_physical_image(url, remaining_references)
+    finally:
+        await db.commit()
+
+
+async def store_staged_uploads(db: AsyncSession, staged_files: List[StagedUpload],
+                               saved_files: List[SavedImage]) -> None:
+    # Переносит записанные файлы в хранилище под блокировками до коммита (см. crud.lock_image_files).
+    # saved_files пополняется по ходу: при ошибке вызывающий код знает, какие файлы уже созданы. НЕ коммитит.
+    await lock_image_files(db, [staged.url for staged in staged_files])
+    for staged in staged_files:
+        saved_files.append(await store_staged_upload_async(staged))
+
+
+async def discard_failed_upload(db: AsyncSession, staged_files: List[StagedUpload],
+                                saved_files: List[SavedImage]) -> None:
+    # Вызывать после rollback: удаляет временные файлы и файлы, созданные этой операцией, если на них никто не сослался
+    try:
+        discard_staged_uploads(staged_files)
+        await release_physical_images(db, [saved.url for saved in saved_files if saved.created])
+    except Exception as e_del:
+        print(f"CRUD(async): ERROR cleaning up files: {e_del}")
+
+
+async def generate_variants_for(saved_images: List[SavedImage]) -> List[bool]:
+    # Уменьшенные копии всех файлов запроса - параллельно в пуле процессов
+    return list(await asyncio.gather(*(generate_variants(saved.path) for saved in saved_images)))
+
+
+# --- Product CRUD ---
+async def get_product_by_id(db: AsyncSession, product_id: uuid.UUID,
+                            populate_existing: bool = False) -> Optional[models.Product]:
+    # Изображения подгружаются тем же вызовом (lazy="selectin" на relationship)
+    stmt = select(models.Product).where(models.Product.product_id == product_id)
+    if populate_existing:
+        stmt = stmt.execution_options(populate_existing=True)
+    result = await db.execute(stmt)
+    return result.scalars().first()
+
+
+async def get_product_by_article(db: AsyncSession, article: str) -> Optional[models.Product]:
+    result = await db.execute(select(models.Product).where(models.Product.article == article))
+    return result.scalars().first()
+
+
+async def get_product_by_name(db: AsyncSession, name: str) -> Optional[models.Product]:
+    result = await db.execute(select(models.Product).where(models.Product.name == name))
+    return result.scalars().first()
+
+
+async def touch_product(db: AsyncSession, product_id: uuid.UUID) -> None:
+    # См. crud.touch_product. НЕ коммитит.
+    await db.execute(
+        update(models.Product)
+        .where(models.Product.product_id == product_id)
+        .values(updated_at=sqlalchemy_func.now())
+        .execution_options(synchronize_session=False)
+    )
+
+
+async def create_product(db: AsyncSession, product_data: schemas.ProductCreate,
+                         image_files: Optional[List[UploadFile]] = None) -> models.Product:
+    # Предварительные проверки уникальности
+    if await get_product_by_article(db, article=product_data.article):
+        raise ValueError(f"Product with article '{product_data.article}' already exists (pre-check).")
+    if await get_product_by_name(db, name=product_data.name):
+        raise ValueError(f"Product with name '{product_data.name}' already exists (pre-check).")
+
+    db_product = models.Product(**product_data.model_dump())
+    db.add(db_product)
+
+    staged_files: List[StagedUpload] = []
+    physically_saved_files_info: List[SavedImage] = []
+
+    try:
+        await db.flush()  # product_id генерируется на клиенте, flush проверяет ограничения до записи файлов
+        print(f"CRUD(async): Product {db_product.article} flushed, product_id: {db_product.product_id}")
+
+        if image_files:
+            # Файлы пишутся параллельно и вне event loop; при ошибке одного из них
+            # stage_upload_files_concurrently сама удаляет временные файлы остальных
+            staged_files = await stage_upload_files_concurrently(image_files)
+            await store_staged_uploads(db, staged_files, physically_saved_files_info)
+            variants_ready = await generate_variants_for(physically_saved_files_info)
+            for saved_image, has_variants in zip(physically_saved_files_info, variants_ready):
+                image_schema = schemas.ProductImageCreate(image_url=saved_image.url,
+                                                          content_hash=saved_image.content_hash,
+                                                          has_variants=has_variants)
+                create_db_product_image(db=db, image_data=image_schema, product_id=db_product.product_id)
+
+        await db.commit()
+        print("CRUD(async): Transaction committed.")
+        product_cache.invalidate_product(db_product.product_id)
+
+    except Exception as e:
+        print(f"CRUD(async): EXCEPTION OCCURRED: {type(e).__name__} - {str(e)}")
+        await db.rollback()
+        await discard_failed_upload(db, staged_files, physically_saved_files_info)
+        raise product_creation_error(e, product_data) from e
+
+    # Перечитываем товар вместе с изображениями и серверными полями (created_at, updated_at)
+    return await get_product_by_id(db, db_product.product_id, populate_existing=True)
+
+
+# Колонки, которые импорт перезаписывает у существующего товара (created_at и product_id сохраняются)
+UPSERT_UPDATE_COLUMNS = [
+    column.name for column in models.Product.__table__.columns
+    if column.name not in ("product_id", "article", "created_at", "updated_at")
+]
+
+
+async def upsert_products(db: AsyncSession, products: List[schemas.ProductCreate]) -> list:
+    """
+    Многострочный INSERT ... ON CONFLICT (article) DO UPDATE - одна команда на пачку товаров.
+    Возвращает строки (product_id, article, inserted); inserted = (xmax = 0): строка вставлена, а не обновлена.
+    Артикулы в пачке должны быть уникальны (иначе Postgres отклонит команду). НЕ коммитит.
+    """
+    if not products:
+        return []
+    stmt = pg_insert(models.Product).values([product.model_dump() for product in products])
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[models.Product.article],
+        set_={**{name: stmt.excluded[name] for name in UPSERT_UPDATE_COLUMNS}, "updated_at": sqlalchemy_func.now()}
+    ).returning(
+        models.Product.product_id, models.Product.article, literal_column("xmax = 0", Boolean).label("inserted")
+    )
+    result = await db.execute(stmt)
+    return result.all()
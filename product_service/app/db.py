@@ -1,4 +1,6 @@
 from sqlalchemy import create_engine
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
 from sqlalchemy.orm import sessionmaker
 from sqlalchemy.ext.declarative import declarative_base
 
@@ -10,6 +12,21 @@ SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 Base = declarative_base()
 
 
+def _make_async_database_url(sync_url: str) -> str:
+    # postgresql+psycopg2://... -> postgresql+asyncpg://... (та же БД, асинхронный драйвер)
+    url = make_url(sync_url)
+    if url.get_backend_name() == "postgresql":
+        url = url.set(drivername="postgresql+asyncpg")
+    return url.render_as_string(hide_password=False)
+
+
+# Асинхронный движок для async-эндпоинтов: не блокирует event loop на время запросов к БД
+ASYNC_DATABASE_URL = settings.PRODUCT_ASYNC_DATABASE_URL or _make_async_database_url(DATABASE_URL)
+async_engine = create_async_engine(ASYNC_DATABASE_URL, echo=False)
+# expire_on_commit=False: после commit атрибуты не перезагружаются неявно (ленивая загрузка в async недоступна)
+AsyncSessionLocal = async_sessionmaker(bind=async_engine, autoflush=False, expire_on_commit=False)
+
+
 def get_db():
     db = SessionLocal()
     try:
@@ -18,6 +35,11 @@ def get_db():
         db.close()
 
 
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
+
+
 def create_db_tables(): # Не используется для основного запуска, если таблицы создаются скриптами
     from .models import Base
-    Base.metadata.create_all(bind=engine)
\ No newline at end of file
+    Base.metadata.create_all(bind=engine)
@@ -0,0 +1,54 @@
+import hashlib
+import uuid
+from datetime import datetime, timedelta, timezone
+from typing import Optional
+
+from fastapi import Response, status
+
+_EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+# Ответы можно хранить, но перед использованием клиент обязан перепроверить их по ETag
+REVALIDATE_CACHE_CONTROL = "no-cache"
+
+
+def make_etag(*parts) -> str:
+    # Сильный ETag: хэш от частей, однозначно определяющих представление ресурса
+    raw = "|".join(str(part) for part in parts)
+    return f'"{hashlib.sha1(raw.encode("utf-8")).hexdigest()}"'
+
+
+def product_etag(product_id: uuid.UUID, updated_at: datetime) -> str:
+    # Микросекунды от эпохи - не зависят от формата сериализации даты и часового пояса
+    if updated_at.tzinfo is None:
+        updated_at = updated_at.replace(tzinfo=timezone.utc)
+    updated_at_us = (updated_at - _EPOCH) // timedelta(microseconds=1)
+    return make_etag("product", product_id, updated_at_us)
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    # If-None-Match сравнивается "слабо" (RFC 9110): префикс W/ игнорируется
+    if not if_none_match:
+        return False
+    candidates = [candidate.strip() for candidate in if_none_match.split(",")]
+    if "*" in candidates:
+        return True
+    return any(candidate.removeprefix("W/") == etag for candidate in candidates)
+
+
+def set_validators(response: Response, etag: str) -> None:
+    response.headers["ETag"] = etag
+    response.headers["Cache-Control"] = REVALIDATE_CACHE_CONTROL
+
+
+def prerendered_json(content: bytes, etag: str) -> Response:
+    # Уже сериализованный JSON (снимок каталога) отдается как есть, без повторной валидации и кодирования
+    response = Response(content=content, media_type="application/json")
+    set_validators(response, etag)
+    return response
+
+
+def not_modified(etag: str) -> Response:
+    return Response(
+        status_code=status.HTTP_304_NOT_MODIFIED,
+        headers={"ETag": etag, "Cache-Control": REVALIDATE_CACHE_CONTROL}
+    )
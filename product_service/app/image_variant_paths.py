@@ -0,0 +1,38 @@
+from pathlib import Path
+
+from .config import settings
+
+# Имена и URL уменьшенных копий изображений товара (сами копии создает image_variants.py).
+# Модуль без Pillow: его импортируют модели, схемы и раздача статики.
+#
+# Имя варианта -> максимальная сторона в пикселях.
+# Файлы лежат рядом с оригиналом: <hash>.png -> <hash>_thumb.png, <hash>_thumb.webp, <hash>_medium.png, ...
+VARIANT_SIZES = {
+    "thumb": settings.PRODUCT_IMAGE_THUMB_SIZE,
+    "medium": settings.PRODUCT_IMAGE_MEDIUM_SIZE,
+}
+
+# Формат "совместимой" копии по расширению оригинала (GIF уменьшается до первого кадра в PNG)
+_FALLBACK_EXTENSIONS = {".jpg": ".jpg", ".jpeg": ".jpg", ".png": ".png", ".gif": ".png", ".webp": ".webp"}
+
+
+def is_variant_file(path: Path) -> bool:
+    return path.stem.rsplit("_", 1)[-1] in VARIANT_SIZES
+
+
+def variant_paths(original_path: Path) -> dict[str, Path]:
+    # Ключи: "thumb", "thumb_webp", "medium", "medium_webp"
+    fallback_extension = _FALLBACK_EXTENSIONS.get(original_path.suffix.lower())
+    if fallback_extension is None:
+        return {}
+    paths = {}
+    for variant in VARIANT_SIZES:
+        paths[variant] = original_path.with_name(f"{original_path.stem}_{variant}{fallback_extension}")
+        paths[f"{variant}_webp"] = original_path.with_name(f"{original_path.stem}_{variant}.webp")
+    return paths
+
+
+def variant_urls(image_url: str) -> dict[str, str]:
+    # URL вариантов вычисляются из URL оригинала, без обращения к диску и БД
+    base_url, _, filename = image_url.rpartition("/")
+    return {key: f"{base_url}/{path.name}" for key, path in variant_paths(Path(filename)).items()}
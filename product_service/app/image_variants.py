@@ -0,0 +1,110 @@
+import asyncio
+import os
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Optional
+
+from PIL import Image, ImageOps
+from starlette.concurrency import run_in_threadpool
+
+from .config import STATIC_FILES_DIR, settings
+from .image_variant_paths import VARIANT_SIZES, variant_paths
+
+# Формат Pillow по расширению файла копии (имена копий - см. image_variant_paths.py)
+_PIL_FORMATS = {".jpg": "JPEG", ".png": "PNG", ".webp": "WEBP"}
+
+# Пул процессов: ресайз нагружает CPU и держит GIL, в пуле потоков он тормозил бы обработку запросов
+_executor: Optional[ProcessPoolExecutor] = None
+
+
+def image_path_from_url(image_url: str) -> Optional[Path]:
+    if not image_url or not image_url.startswith("/static/"):
+        return None
+    return Path(STATIC_FILES_DIR) / image_url.replace("/static/", "", 1)
+
+
+def render_variants(original_path: str) -> bool:
+    """
+    Создает недостающие варианты изображения. Выполняется в процессе пула (или напрямую - в скриптах).
+    Уже существующие варианты не пересоздаются: у файлов с одинаковым содержимым общие варианты.
+    Возвращает True, если все варианты на месте.
+    """
+    source = Path(original_path)
+    targets = variant_paths(source)
+    if not targets:
+        return False
+    missing = {key: path for key, path in targets.items() if not path.exists()}
+    if not missing:
+        return True
+
+    with Image.open(source) as opened:
+        image = ImageOps.exif_transpose(opened)  # Поворот по EXIF, иначе фото с телефона окажутся "на боку"
+        if image.mode not in ("RGB", "RGBA"):
+            image = image.convert("RGBA" if "transparency" in image.info or image.mode in ("LA", "PA") else "RGB")
+
+        for variant, max_side in VARIANT_SIZES.items():
+            keys = [key for key in (variant, f"{variant}_webp") if key in missing]
+            if not keys:
+                continue
+            resized = image.copy()
+            resized.thumbnail((max_side, max_side), Image.Resampling.LANCZOS)  # Только уменьшает, пропорции сохраняются
+            for path in {missing[key] for key in keys}:  # Для WebP-оригинала обе копии - один файл
+                _save_atomically(resized, path)
+    return True
+
+
+def _save_atomically(image: Image.Image, destination: Path) -> None:
+    pil_format = _PIL_FORMATS[destination.suffix]
+    if pil_format == "JPEG" and image.mode != "RGB":
+        image = image.convert("RGB")
+    partial_path = destination.with_name(f".variant-{uuid.uuid4().hex}.part")
+    try:
+        if pil_format == "WEBP":
+            image.save(partial_path, format=pil_format, quality=settings.PRODUCT_IMAGE_WEBP_QUALITY, method=4)
+        elif pil_format == "JPEG":
+            image.save(partial_path, format=pil_format, quality=85, optimize=True, progressive=True)
+        else:
+            image.save(partial_path, format=pil_format)  # optimize=True для PNG в разы медленнее при малом выигрыше
+        os.replace(partial_path, destination)
+    finally:
+        if partial_path.exists():
+            os.remove(partial_path)
+
+
+def start_variant_pool() -> None:
+    global _executor
+    if _executor is None and settings.PRODUCT_IMAGE_VARIANT_WORKERS > 0:
+        _executor = ProcessPoolExecutor(max_workers=settings.PRODUCT_IMAGE_VARIANT_WORKERS)
+        print(f"Image variant pool started with {settings.PRODUCT_IMAGE_VARIANT_WORKERS} worker process(es)")
+
+
+def shutdown_variant_pool() -> None:
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=True, cancel_futures=True)
+        _executor = None
+
+
+async def generate_variants(original_path: Path) -> bool:
+    # Ошибка ресайза (битый или экзотический файл) не ломает загрузку: товар останется с оригиналом
+    try:
+        if _executor is not None:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(_executor, render_variants, str(original_path))
+        return await run_in_threadpool(render_variants, str(original_path))  # Пул не запущен (скрипты, отладка)
+    except Exception as e:
+        print(f"Image variants for {original_path} failed: {type(e).__name__} - {e}")
+        return False
+
+
+def generate_variants_sync(original_path: Path) -> bool:
+    # Синхронный путь (crud.create_product): ресайз тоже в пуле, поток запроса только ждет без GIL.
+    # Без пула (скрипты, процессы пула backfill_image_variants) - на месте
+    try:
+        if _executor is not None:
+            return _executor.submit(render_variants, str(original_path)).result()
+        return render_variants(str(original_path))
+    except Exception as e:
+        print(f"Image variants for {original_path} failed: {type(e).__name__} - {e}")
+        return False
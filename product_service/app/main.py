@@ -1,22 +1,32 @@
 from fastapi import FastAPI
-from fastapi.staticfiles import StaticFiles
 from fastapi.middleware.cors import CORSMiddleware
 from contextlib import asynccontextmanager
 import uvicorn
 
 from app.api.v1 import products as api_products
-from app.db import engine, Base
+from app.api.v1 import stock as api_stock
+from app.db import engine, async_engine, Base
 from app.config import settings, STATIC_FILES_DIR
+from app.utils_uploads import UploadSizeLimitMiddleware
+from app.image_variants import start_variant_pool, shutdown_variant_pool
+from app.static_files import ProductStaticFiles
+from app.catalog_snapshot import catalog_snapshot
 
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     print(f"Starting up {settings.APP_NAME}...")
+    start_variant_pool()
+    if settings.PRODUCT_SNAPSHOT_ENABLED:
+        catalog_snapshot.start()  # Загрузка в фоне: пока снимок не готов, запросы обслуживаются из БД
     print("Startup complete.")
     yield
     print(f"Shutting down {settings.APP_NAME}...")
+    catalog_snapshot.stop()
     if hasattr(engine, 'dispose'): # Для синхронного движка
         engine.dispose()
+    await async_engine.dispose()
+    shutdown_variant_pool()
     print("Shutdown complete.")
 
 app = FastAPI(
@@ -42,8 +52,14 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-app.mount("/static", StaticFiles(directory=STATIC_FILES_DIR), name="static")
+# Слишком большие multipart-запросы отклоняются до разбора тела и записи файлов во временное хранилище
+app.add_middleware(UploadSizeLimitMiddleware, max_body_bytes=settings.PRODUCT_UPLOAD_MAX_REQUEST_BYTES)
+
+app.mount("/static", ProductStaticFiles(directory=STATIC_FILES_DIR,
+                                        accel_redirect_prefix=settings.PRODUCT_STATIC_ACCEL_REDIRECT_PREFIX),
+          name="static")
 app.include_router(api_products.router, prefix="/api/v1")
+app.include_router(api_stock.router, prefix="/api/v1")
 
 
 @app.get("/health", tags=["Health Check"])
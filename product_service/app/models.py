@@ -1,11 +1,14 @@
 import enum
 import uuid
+from typing import Optional
 from sqlalchemy import Column, String, Text, DECIMAL, Integer, Boolean, ForeignKey, TIMESTAMP
 from sqlalchemy.types import Enum as SQLAlchemyEnum
-from sqlalchemy.dialects.postgresql import UUID
+from sqlalchemy.dialects.postgresql import UUID, JSONB
 from sqlalchemy.orm import relationship, declarative_base
 from sqlalchemy.sql import func
 
+from .image_variant_paths import variant_urls
+
 
 class LampTechnologyEnum(str, enum.Enum):
     LED = "Светодиодная"
@@ -15,6 +18,11 @@ class LampTechnologyEnum(str, enum.Enum):
     OTHER = "Другая"
 
 
+class ReservationStatusEnum(str, enum.Enum):
+    RESERVED = "reserved"
+    RELEASED = "released"
+
+
 class EnergyEfficiencyClassEnum(str, enum.Enum):
     A_PLUS_PLUS = "A++"
     A_PLUS = "A+"
@@ -69,7 +77,9 @@ class Product(Base):
     created_at = Column(TIMESTAMP(timezone=True), server_default=func.now(), nullable=False)
     updated_at = Column(TIMESTAMP(timezone=True), server_default=func.now(), onupdate=func.now(), nullable=False)
 
-    images = relationship("ProductImage", back_populates="product", cascade="all, delete-orphan", lazy="selectin")
+    # Порядок как в списке товаров: первое изображение - главное (см. crud._main_image_lateral)
+    images = relationship("ProductImage", back_populates="product", cascade="all, delete-orphan", lazy="selectin",
+                          order_by="[ProductImage.upload_at, ProductImage.product_image_id]")
 
     def __repr__(self):
         return f"<Product(name='{self.name}', article='{self.article}')>"
@@ -81,9 +91,42 @@ class ProductImage(Base):
     product_image_id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
     product_id = Column(UUID(as_uuid=True), ForeignKey("products.product_id", ondelete="CASCADE"), nullable=False)
     image_url = Column(String(512), nullable=False)  # Храним относительный URL как строку
+    # sha256 содержимого: один файл на диске может быть общим для нескольких записей (и товаров).
+    # Число записей с данным image_url - счетчик ссылок на файл. NULL - файлы, загруженные до дедупликации.
+    content_hash = Column(String(64), nullable=True)
+    # Созданы ли уменьшенные копии (thumb/medium + WebP), см. image_variants.py
+    has_variants = Column(Boolean, nullable=False, server_default="FALSE", default=False)
     upload_at = Column(TIMESTAMP(timezone=True), server_default=func.now(), nullable=False)
 
     product = relationship("Product", back_populates="images")
 
+    @property
+    def variants(self) -> Optional[dict]:
+        # URL уменьшенных копий; None - копий еще нет, клиенту следует использовать оригинал
+        return variant_urls(self.image_url) if self.has_variants else None
+
+    def __repr__(self):
+        return f"<ProductImage(url='{self.image_url}')>"
+
+
+class ProductTombstone(Base):
+    # Удаленные товары для ленты изменений. Записи создает триггер trg_products_tombstone (см. SQL)
+    __tablename__ = "product_tombstones"
+
+    product_id = Column(UUID(as_uuid=True), primary_key=True)
+    deleted_at = Column(TIMESTAMP(timezone=True), server_default=func.now(), nullable=False)
+
+
+class StockReservation(Base):
+    __tablename__ = "stock_reservations"
+
+    # Ключ идемпотентности от клиента: повтор запроса с тем же ключом не списывает остаток второй раз
+    reservation_key = Column(String(64), primary_key=True)
+    status = Column(String(16), nullable=False, server_default=ReservationStatusEnum.RESERVED.value)  # CHECK в SQL
+    # [{"product_id": "...", "quantity": N}, ...] - по возрастанию product_id, без повторов
+    items = Column(JSONB, nullable=False)
+    created_at = Column(TIMESTAMP(timezone=True), server_default=func.now(), nullable=False)
+    released_at = Column(TIMESTAMP(timezone=True), nullable=True)
+
     def __repr__(self):
-        return f"<ProductImage(url='{self.image_url}')>"
\ No newline at end of file
+        return f"<StockReservation(key='{self.reservation_key}', status='{self.status}')>"
@@ -0,0 +1,50 @@
+import base64
+import json
+import uuid
+from datetime import datetime
+from typing import Optional
+
+
+# Курсор для keyset-пагинации: непрозрачная для клиента строка (base64url от JSON).
+# Хранит ключ последней отданной записи: (created_at, product_id),
+# а для поиска - еще и ранг похожести (rank), по которому идет сортировка.
+def encode_cursor(created_at: datetime, product_id: uuid.UUID, rank: Optional[float] = None) -> str:
+    payload = {"c": created_at.isoformat(), "id": str(product_id)}
+    if rank is not None:
+        payload["r"] = rank
+    raw = json.dumps(payload, separators=(",", ":")).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str) -> tuple[datetime, uuid.UUID, Optional[float]]:
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode("ascii")))
+        rank = payload.get("r")
+        return datetime.fromisoformat(payload["c"]), uuid.UUID(payload["id"]), float(rank) if rank is not None else None
+    except Exception as e:
+        raise ValueError("Invalid pagination cursor.") from e
+
+
+def next_cursor_for(items: list, has_more: bool, last_rank: Optional[float] = None) -> Optional[str]:
+    # items - объекты с атрибутами created_at и product_id (модели или строки результата)
+    if not has_more or not items:
+        return None
+    last = items[-1]
+    return encode_cursor(last.created_at, last.product_id, last_rank)
+
+
+# Водяной знак ленты изменений (GET /products/changes): ключ последнего отданного изменения (время, product_id).
+# Изменения и удаления упорядочены по одному ключу, поэтому одного знака достаточно для обоих потоков.
+def encode_watermark(changed_at: datetime, product_id: uuid.UUID) -> str:
+    raw = json.dumps({"t": changed_at.isoformat(), "id": str(product_id)}, separators=(",", ":")).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def decode_watermark(watermark: str) -> tuple[datetime, uuid.UUID]:
+    try:
+        padded = watermark + "=" * (-len(watermark) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode("ascii")))
+        return datetime.fromisoformat(payload["t"]), uuid.UUID(payload["id"])
+    except Exception as e:
+        raise ValueError("Invalid change feed watermark.") from e
@@ -0,0 +1,104 @@
+import csv
+import io
+import json
+from datetime import datetime
+from decimal import Decimal
+from typing import Iterator, Optional
+
+from sqlalchemy import select, func as sqlalchemy_func
+from sqlalchemy.dialects.postgresql import aggregate_order_by
+
+from . import models, schemas
+from .crud import product_filter_conditions
+from .db import SessionLocal
+
+# Выгрузка каталога потоком: строки читаются серверным курсором (stream_results) пачками по EXPORT_YIELD_PER,
+# каждая пачка сразу сериализуется и отдается клиенту - память не растет с размером каталога.
+EXPORT_YIELD_PER = 1000
+
+# Порядок колонок CSV совпадает с полями импорта: выгрузку можно загрузить обратно через POST /products/import
+EXPORT_COLUMNS = [
+    "product_id", "name", "article", "description", "price", "stock_quantity", "is_active", "manufacturer",
+    "product_technology", "socket", "power", "lumens", "color_temperature", "voltage", "class_energy_efficiency",
+    "created_at", "updated_at",
+]
+CSV_IMAGE_SEPARATOR = " "  # URL изображений не содержат пробелов
+
+EXPORT_MEDIA_TYPES = {"ndjson": "application/x-ndjson", "csv": "text/csv; charset=utf-8"}
+
+
+def build_export_query(filters: Optional[schemas.ProductFilters], include_images: bool):
+    columns = [getattr(models.Product, name) for name in EXPORT_COLUMNS]
+    if include_images:
+        # Изображения - массивом в той же строке (коррелированный подзапрос по idx_product_images_product_upload)
+        images = (
+            select(sqlalchemy_func.array_agg(aggregate_order_by(
+                models.ProductImage.image_url, models.ProductImage.upload_at, models.ProductImage.product_image_id
+            )))
+            .where(models.ProductImage.product_id == models.Product.product_id)
+            .scalar_subquery()
+        )
+        columns.append(images.label("images"))
+    stmt = select(*columns)
+    if filters is not None:
+        conditions = product_filter_conditions(filters)
+        if conditions:
+            stmt = stmt.where(*conditions.values())
+    # Стабильный порядок выгрузки - по индексу idx_products_created_at_id
+    return stmt.order_by(models.Product.created_at, models.Product.product_id)
+
+
+def _json_default(value):
+    if isinstance(value, Decimal):
+        return str(value)
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return str(value)  # UUID
+
+
+def _to_csv_value(value) -> str:
+    if value is None:
+        return ""
+    if isinstance(value, datetime):
+        return value.isoformat()
+    if isinstance(value, bool):
+        return "true" if value else "false"
+    if isinstance(value, list):
+        return CSV_IMAGE_SEPARATOR.join(value)
+    return str(getattr(value, "value", value))  # Enum -> значение
+
+
+def iter_export(export_format: str, filters: Optional[schemas.ProductFilters] = None,
+                include_images: bool = False) -> Iterator[bytes]:
+    """
+    Синхронный генератор для StreamingResponse (Starlette выполняет его в пуле потоков).
+    Своя сессия БД: зависимость get_db закрылась бы раньше, чем закончится отдача ответа.
+    """
+    stmt = build_export_query(filters, include_images).execution_options(
+        stream_results=True, yield_per=EXPORT_YIELD_PER
+    )
+    header = EXPORT_COLUMNS + (["images"] if include_images else [])
+    exported = 0
+    with SessionLocal() as db:
+        result = db.execute(stmt)
+        if export_format == "csv":
+            buffer = io.StringIO()
+            writer = csv.writer(buffer, lineterminator="\n")
+            writer.writerow(header)
+            for partition in result.partitions():
+                writer.writerows([_to_csv_value(value) for value in row] for row in partition)
+                exported += len(partition)
+                yield buffer.getvalue().encode("utf-8")
+                buffer.seek(0)
+                buffer.truncate()
+            if exported == 0:
+                yield buffer.getvalue().encode("utf-8")  # Только заголовок
+        else:
+            for partition in result.partitions():
+                chunk = "".join(
+                    json.dumps(dict(zip(header, row)), ensure_ascii=False, default=_json_default) + "\n"
+                    for row in partition
+                )
+                exported += len(partition)
+                yield chunk.encode("utf-8")
+    print(f"EXPORT: {exported} products streamed as {export_format}")
@@ -0,0 +1,218 @@
+import codecs
+import csv
+import json
+import time
+from typing import AsyncIterator, List, Optional
+
+from pydantic import ValidationError
+from sqlalchemy.exc import DBAPIError, DataError, IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from . import crud_async, schemas
+from .cache import product_cache
+from .config import settings
+
+# Разбор и валидация идут по мере чтения тела запроса: файл прайс-листа целиком в память не загружается.
+# Запись - пачками по PRODUCT_IMPORT_BATCH_SIZE строк, каждая пачка - одна команда upsert и свой commit.
+
+# Классы SQLSTATE ошибок из-за данных строки: 22 - data_exception, 23 - integrity_constraint_violation.
+# Сбои самой БД (соединение, таймауты) к ним не относятся и прерывают импорт.
+ROW_ERROR_SQLSTATE_CLASSES = ("22", "23")
+
+IMPORT_FORMATS = {
+    "text/csv": "csv",
+    "application/csv": "csv",
+    "application/x-ndjson": "ndjson",
+    "application/ndjson": "ndjson",
+    "application/jsonl": "ndjson",
+}
+
+
+def detect_import_format(content_type: Optional[str]) -> Optional[str]:
+    media_type = (content_type or "").split(";", 1)[0].strip().lower()
+    return IMPORT_FORMATS.get(media_type)
+
+
+async def iter_text_lines(chunks: AsyncIterator[bytes]) -> AsyncIterator[str]:
+    # UTF-8 (BOM от Excel отбрасывается); кусок может оборваться посреди многобайтного символа
+    decoder = codecs.getincrementaldecoder("utf-8-sig")()
+    buffer = ""
+    async for chunk in chunks:
+        buffer += decoder.decode(chunk)
+        *lines, buffer = buffer.split("\n")
+        for line in lines:
+            yield line.rstrip("\r")
+    buffer += decoder.decode(b"", final=True)
+    if buffer:
+        yield buffer.rstrip("\r")
+
+
+async def iter_csv_records(lines: AsyncIterator[str], delimiter: str = ","):
+    # Выдает (номер строки данных, dict или None, ошибка или None). Первая строка - заголовок с именами полей.
+    # Поле в кавычках может содержать перевод строки: запись собирается, пока число кавычек нечетное.
+    header = None
+    pending: List[str] = []
+    row_number = 0
+    async for line in lines:
+        pending.append(line)
+        if sum(part.count('"') for part in pending) % 2:
+            continue
+        record_text = "\n".join(pending)
+        pending = []
+        values = next(csv.reader([record_text], delimiter=delimiter))
+        if header is None:
+            header = [name.strip() for name in values]
+            continue
+        if not any(value.strip() for value in values):
+            continue  # Пустые строки пропускаем
+        row_number += 1
+        if len(values) != len(header):
+            yield row_number, None, f"Expected {len(header)} columns, got {len(values)}."
+            continue
+        # Пустая ячейка CSV - отсутствующее значение: поле не передается, и действует значение по умолчанию
+        # из схемы (пустой is_active - True, пустой lumens - None)
+        yield row_number, {name: value for name, value in zip(header, values) if value != ""}, None
+    if pending:
+        yield row_number + 1, None, "Unterminated quoted field at the end of input."
+
+
+async def iter_ndjson_records(lines: AsyncIterator[str]):
+    row_number = 0
+    async for line in lines:
+        if not line.strip():
+            continue
+        row_number += 1
+        try:
+            record = json.loads(line)
+        except json.JSONDecodeError as e:
+            yield row_number, None, f"Invalid JSON: {e.msg}."
+            continue
+        if not isinstance(record, dict):
+            yield row_number, None, "Each line must be a JSON object."
+            continue
+        yield row_number, record, None
+
+
+def validation_messages(error: ValidationError) -> List[str]:
+    return [f"{'.'.join(str(part) for part in item['loc']) or 'row'}: {item['msg']}" for item in error.errors()]
+
+
+def is_row_error(error: DBAPIError) -> bool:
+    # asyncpg отдает часть ошибок данных как DBAPIError без подкласса, поэтому решает SQLSTATE
+    if isinstance(error, (IntegrityError, DataError)):
+        return True
+    sqlstate = getattr(error.orig, "sqlstate", None) or getattr(error.orig, "pgcode", None)
+    return sqlstate is not None and sqlstate[:2] in ROW_ERROR_SQLSTATE_CLASSES
+
+
+def integrity_message(error: DBAPIError, product: schemas.ProductCreate) -> str:
+    # Уникальность article обеспечивает сам upsert, остается конфликт по name
+    if "products_name_key" in str(error.orig).lower():
+        return f"Product name '{product.name}' already exists for another article."
+    if not isinstance(error, IntegrityError):
+        # Значение, прошедшее валидацию схемы, не подошло колонке
+        return f"Database rejected the row: {str(error.orig).splitlines()[0]}"
+    return "Database integrity error."
+
+
+class ProductImporter:
+    """Собирает отчет импорта: счетчики и ошибки по строкам (не больше PRODUCT_IMPORT_MAX_REPORTED_ERRORS)."""
+
+    def __init__(self, db: AsyncSession):
+        self.db = db
+        self.batch: List[tuple[int, schemas.ProductCreate]] = []
+        self.total_rows = 0
+        self.inserted = 0
+        self.updated = 0
+        self.failed = 0
+        self.errors: List[schemas.ImportRowError] = []
+        self.started = time.perf_counter()
+
+    async def add(self, row_number: int, record: Optional[dict], error: Optional[str]) -> None:
+        self.total_rows += 1
+        if error is not None:
+            self.report_error(row_number, None, [error])
+            return
+        try:
+            product = schemas.ProductCreate.model_validate(record)
+        except ValidationError as e:
+            article = record.get("article")
+            self.report_error(row_number, str(article) if article is not None else None, validation_messages(e))
+            return
+        self.batch.append((row_number, product))
+        if len(self.batch) >= settings.PRODUCT_IMPORT_BATCH_SIZE:
+            await self.flush()
+
+    async def flush(self) -> None:
+        if not self.batch:
+            return
+        batch, self.batch = self._deduplicate(self.batch), []
+        try:
+            rows = await crud_async.upsert_products(self.db, [product for _, product in batch])
+            await self.db.commit()
+            self._count(rows)
+        except DBAPIError as e:
+            if not is_row_error(e):
+                raise
+            # Пачка отклонена целиком (name уже занят другим артикулом, значение не влезает в колонку) -
+            # повторяем построчно, чтобы записать корректные строки и точно указать ошибочные
+            await self.db.rollback()
+            await self._flush_row_by_row(batch)
+
+    async def _flush_row_by_row(self, batch: List[tuple[int, schemas.ProductCreate]]) -> None:
+        for row_number, product in batch:
+            try:
+                rows = await crud_async.upsert_products(self.db, [product])
+                await self.db.commit()
+                self._count(rows)
+            except DBAPIError as e:
+                if not is_row_error(e):
+                    raise
+                await self.db.rollback()
+                self.report_error(row_number, product.article, [integrity_message(e, product)])
+
+    def _deduplicate(self, batch: List[tuple[int, schemas.ProductCreate]]) -> List[tuple[int, schemas.ProductCreate]]:
+        # Один артикул дважды в одной команде ON CONFLICT недопустим: побеждает последняя строка
+        last_row_by_article = {product.article: row_number for row_number, product in batch}
+        unique = []
+        for row_number, product in batch:
+            if last_row_by_article[product.article] == row_number:
+                unique.append((row_number, product))
+            else:
+                self.report_error(row_number, product.article, [
+                    f"Duplicate article '{product.article}' in import, superseded by row {last_row_by_article[product.article]}."
+                ])
+        return unique
+
+    def _count(self, rows) -> None:
+        for row in rows:
+            if row.inserted:
+                self.inserted += 1
+            else:
+                self.updated += 1
+        product_cache.invalidate_products([row.product_id for row in rows])
+
+    def report_error(self, row_number: int, article: Optional[str], messages: List[str]) -> None:
+        self.failed += 1
+        if len(self.errors) < settings.PRODUCT_IMPORT_MAX_REPORTED_ERRORS:
+            self.errors.append(schemas.ImportRowError(row=row_number, article=article, errors=messages))
+
+    def report(self) -> schemas.ProductImportReport:
+        return schemas.ProductImportReport(
+            total_rows=self.total_rows, inserted=self.inserted, updated=self.updated, failed=self.failed,
+            errors=sorted(self.errors, key=lambda error: error.row), errors_truncated=self.failed > len(self.errors),
+            duration_seconds=round(time.perf_counter() - self.started, 3)
+        )
+
+
+async def import_products(db: AsyncSession, chunks: AsyncIterator[bytes], import_format: str,
+                          delimiter: str = ",") -> schemas.ProductImportReport:
+    lines = iter_text_lines(chunks)
+    records = iter_csv_records(lines, delimiter) if import_format == "csv" else iter_ndjson_records(lines)
+    importer = ProductImporter(db)
+    async for row_number, record, error in records:
+        await importer.add(row_number, record, error)
+    await importer.flush()
+    print(f"IMPORT: {importer.total_rows} rows, inserted {importer.inserted}, updated {importer.updated}, "
+          f"failed {importer.failed}")
+    return importer.report()
@@ -1,11 +1,16 @@
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, Field, ValidationError, model_validator
 from typing import List, Optional
 import uuid
 from decimal import Decimal
 from datetime import datetime
-from fastapi import Form # Для принятия данных формы вместе с файлами
+from fastapi import Form, Query # Для принятия данных формы вместе с файлами
+from fastapi.exceptions import RequestValidationError
 
-from .models import LampTechnologyEnum, EnergyEfficiencyClassEnum # Импортируем Python Enum
+from .models import LampTechnologyEnum, EnergyEfficiencyClassEnum, ReservationStatusEnum # Импортируем Python Enum
+from .image_variant_paths import variant_urls
+from .config import settings
+
+MAX_DB_INTEGER = 2 ** 31 - 1  # INTEGER в PostgreSQL: большее значение БД не примет
 
 
 # --- Product Image Schemas ---
@@ -14,7 +19,15 @@ class ProductImageBase(BaseModel):
 
 
 class ProductImageCreate(ProductImageBase): # Используется для создания записи в БД
-    pass
+    content_hash: Optional[str] = None # sha256 содержимого файла
+    has_variants: bool = False
+
+
+class ImageVariants(BaseModel): # Уменьшенные копии изображения: в формате оригинала и в WebP
+    thumb: str
+    thumb_webp: str
+    medium: str
+    medium_webp: str
 
 
 class ProductImage(ProductImageBase): # Схема для ответа API
@@ -22,6 +35,7 @@ class ProductImage(ProductImageBase): # Схема для ответа API
     product_id: uuid.UUID
     image_url: str
     upload_at: datetime
+    variants: Optional[ImageVariants] = None # None - копии еще не созданы, использовать image_url
 
     class Config:
         from_attributes = True
@@ -32,15 +46,15 @@ class ProductBase(BaseModel): # Общие поля для товара
     name: str = Field(min_length=3, max_length=128)
     article: str = Field(min_length=3, max_length=32, pattern=r"^[a-zA-Z0-9_/-]+$") # Разрешил / и -
     description: Optional[str] = None
-    price: Decimal = Field(gt=0, decimal_places=2)
-    stock_quantity: int = Field(ge=0)
+    price: Decimal = Field(gt=0, max_digits=10, decimal_places=2)  # DECIMAL(10, 2)
+    stock_quantity: int = Field(ge=0, le=MAX_DB_INTEGER)
     is_active: bool = True
     manufacturer: str = Field(min_length=2, max_length=128)
     product_technology: LampTechnologyEnum
     socket: str = Field(min_length=1, max_length=32)
-    power: Decimal = Field(gt=0, decimal_places=1)
-    lumens: Optional[int] = Field(None, ge=0)
-    color_temperature: Optional[int] = Field(None, ge=1000)
+    power: Decimal = Field(gt=0, max_digits=5, decimal_places=1)  # DECIMAL(5, 1)
+    lumens: Optional[int] = Field(None, ge=0, le=MAX_DB_INTEGER)
+    color_temperature: Optional[int] = Field(None, ge=1000, le=MAX_DB_INTEGER)
     voltage: Optional[str] = Field(None, max_length=32)
     class_energy_efficiency: Optional[EnergyEfficiencyClassEnum] = None
 
@@ -111,14 +125,237 @@ class ProductInList(BaseModel): # Упрощенная схема для спи
     price: Decimal
     stock_quantity: int
     main_image_url: Optional[str] = None # URL главного изображения
+    main_image_variants: Optional[ImageVariants] = None # Уменьшенные копии главного изображения (для плитки)
 
     class Config:
         from_attributes = True
 
+    @classmethod
+    def from_row(cls, row) -> "ProductInList":
+        # Строка из crud.get_all_products (колонки товара + main_image_url, main_image_has_variants)
+        return cls(
+            product_id=row.product_id, name=row.name, article=row.article, price=row.price,
+            stock_quantity=row.stock_quantity, main_image_url=row.main_image_url,
+            main_image_variants=variant_urls(row.main_image_url) if row.main_image_has_variants else None
+        )
+
+
+class ProductFilters(BaseModel): # Фильтры каталога; списковые - "любое из значений"
+    search: Optional[str] = None
+    technology: Optional[List[LampTechnologyEnum]] = None
+    socket: Optional[List[str]] = None
+    manufacturer: Optional[List[str]] = None
+    energy_class: Optional[List[EnergyEfficiencyClassEnum]] = None
+    min_power: Optional[Decimal] = Field(None, ge=0)
+    max_power: Optional[Decimal] = Field(None, ge=0)
+    min_lumens: Optional[int] = Field(None, ge=0)
+    max_lumens: Optional[int] = Field(None, ge=0)
+    min_color_temperature: Optional[int] = Field(None, ge=0)
+    max_color_temperature: Optional[int] = Field(None, ge=0)
+    min_price: Optional[Decimal] = Field(None, ge=0)
+    max_price: Optional[Decimal] = Field(None, ge=0)
+
+    @model_validator(mode="after")
+    def check_ranges(self):
+        for name in ("power", "lumens", "color_temperature", "price"):
+            low, high = getattr(self, f"min_{name}"), getattr(self, f"max_{name}")
+            if low is not None and high is not None and low > high:
+                raise ValueError(f"min_{name} must not be greater than max_{name}")
+        return self
+
+    @classmethod
+    def as_query(
+        cls,
+        search: Optional[str] = Query(None, description="Строка для поиска по названию или артикулу"),
+        technology: Optional[List[LampTechnologyEnum]] = Query(None, description="Технология лампы (можно несколько)"),
+        socket: Optional[List[str]] = Query(None, description="Цоколь (можно несколько)"),
+        manufacturer: Optional[List[str]] = Query(None, description="Производитель (можно несколько)"),
+        energy_class: Optional[List[EnergyEfficiencyClassEnum]] = Query(None, description="Класс энергоэффективности (можно несколько)"),
+        min_power: Optional[Decimal] = Query(None), max_power: Optional[Decimal] = Query(None),
+        min_lumens: Optional[int] = Query(None), max_lumens: Optional[int] = Query(None),
+        min_color_temperature: Optional[int] = Query(None), max_color_temperature: Optional[int] = Query(None),
+        min_price: Optional[Decimal] = Query(None), max_price: Optional[Decimal] = Query(None)
+    ):
+        try:
+            return cls(
+                search=search or None, technology=technology or None, socket=socket or None,
+                manufacturer=manufacturer or None, energy_class=energy_class or None,
+                min_power=min_power, max_power=max_power, min_lumens=min_lumens, max_lumens=max_lumens,
+                min_color_temperature=min_color_temperature, max_color_temperature=max_color_temperature,
+                min_price=min_price, max_price=max_price
+            )
+        except ValidationError as e:  # Ошибки фильтров - 422, как у обычных query-параметров
+            raise RequestValidationError(e.errors(include_url=False, include_context=False, include_input=False))
+
+    def cache_key(self) -> dict:
+        # Нормализованные значения для ключа кэша и ETag: порядок значений в списках не важен
+        normalized = self.model_dump(mode="json", exclude_none=True)
+        for key, value in normalized.items():
+            if isinstance(value, list):
+                normalized[key] = sorted(set(value))
+        if "search" in normalized:
+            normalized["search"] = normalized["search"].lower()
+        return normalized
+
+
+class FacetValue(BaseModel):
+    value: str
+    count: int
+
+
+class RangeFacet(BaseModel):
+    min: Optional[Decimal] = None
+    max: Optional[Decimal] = None
+
+
+class ProductFacets(BaseModel):
+    # Счетчики по значениям: для каждого фасета учитываются все фильтры, КРОМЕ фильтра по нему самому,
+    # чтобы покупатель видел, сколько товаров добавит выбор еще одного значения
+    technology: List[FacetValue] = []
+    socket: List[FacetValue] = []
+    manufacturer: List[FacetValue] = []
+    energy_class: List[FacetValue] = []
+    # Диапазоны значений среди найденных товаров (для слайдеров)
+    power: RangeFacet = RangeFacet()
+    lumens: RangeFacet = RangeFacet()
+    color_temperature: RangeFacet = RangeFacet()
+    price: RangeFacet = RangeFacet()
+
 
 class ProductListResponse(BaseModel):
     items: List[ProductInList]
-    total_count: int
+    total_count: Optional[int] = None # Не считается в режиме курсорной пагинации
+    total_count_is_approximate: bool = False # Оценка планировщика или значение из кэша (см. counting.py)
     page: Optional[int] = None # Текущая страница (если передаем skip/limit)
     limit: Optional[int] = None # Текущий лимит (если передаем skip/limit)
-    pages: Optional[int] = None # Общее количество страниц (если передаем skip/limit)
\ No newline at end of file
+    pages: Optional[int] = None # Общее количество страниц (если передаем skip/limit)
+    next_cursor: Optional[str] = None # Курсор следующей страницы (None - страниц больше нет)
+    facets: Optional[ProductFacets] = None # Только при include_facets=true
+
+
+class ProductBatchRequest(BaseModel):
+    ids: List[uuid.UUID] = []
+    articles: List[str] = []
+
+    @model_validator(mode="after")
+    def check_size(self):
+        requested = len(self.ids) + len(self.articles)
+        if requested == 0:
+            raise ValueError("At least one of ids or articles must be provided")
+        if requested > settings.PRODUCT_BATCH_MAX_ITEMS:
+            raise ValueError(f"Too many products requested: {requested} > {settings.PRODUCT_BATCH_MAX_ITEMS}")
+        return self
+
+
+class ProductBatchResponse(BaseModel):
+    items: List[Product] # В порядке запроса: сначала по ids, затем по articles, без повторов
+    missing_ids: List[uuid.UUID] = []
+    missing_articles: List[str] = []
+
+
+class ProductBulkUpdateItem(BaseModel):
+    # Товар - по product_id или по article; не переданные поля не меняются
+    product_id: Optional[uuid.UUID] = None
+    article: Optional[str] = Field(None, min_length=3, max_length=32)
+    price: Optional[Decimal] = Field(None, gt=0, max_digits=10, decimal_places=2)  # DECIMAL(10, 2)
+    stock_quantity: Optional[int] = Field(None, ge=0, le=MAX_DB_INTEGER)
+    is_active: Optional[bool] = None
+
+    @model_validator(mode="after")
+    def check_item(self):
+        if (self.product_id is None) == (self.article is None):
+            raise ValueError("Exactly one of product_id or article must be provided")
+        if self.price is None and self.stock_quantity is None and self.is_active is None:
+            raise ValueError("At least one of price, stock_quantity or is_active must be provided")
+        return self
+
+
+class ProductBulkUpdate(BaseModel):
+    items: List[ProductBulkUpdateItem] = Field(..., min_length=1)
+
+    @model_validator(mode="after")
+    def check_size(self):
+        if len(self.items) > settings.PRODUCT_BULK_UPDATE_MAX_ITEMS:
+            raise ValueError(f"Too many items: {len(self.items)} > {settings.PRODUCT_BULK_UPDATE_MAX_ITEMS}")
+        return self
+
+
+class ProductBulkUpdateResult(BaseModel):
+    index: int # Позиция в items запроса, с 0
+    product_id: Optional[uuid.UUID] = None
+    article: Optional[str] = None
+    status: str # updated, unchanged, not_found или superseded (товар указан в запросе еще раз ниже)
+
+
+class ProductBulkUpdateReport(BaseModel):
+    # updated + unchanged + failed + superseded = числу позиций запроса
+    updated: int
+    unchanged: int
+    failed: int # not_found
+    superseded: int
+    results: List[ProductBulkUpdateResult]
+
+
+class ProductChangesResponse(BaseModel):
+    upserted: List[uuid.UUID] # Созданы или изменены (актуальные данные - POST /products/batch)
+    deleted: List[uuid.UUID]
+    next_watermark: Optional[str] = None # Передать в since следующего запроса; None - изменений еще не было
+    has_more: bool # true - запросить следующую порцию сразу, false - можно подождать
+
+
+# --- Stock Reservation Schemas ---
+class StockReservationItem(BaseModel):
+    product_id: uuid.UUID
+    quantity: int = Field(..., gt=0)
+
+
+class StockReservationCreate(BaseModel):
+    reservation_key: str = Field(..., min_length=1, max_length=64, description="Ключ идемпотентности (например, id попытки оформления заказа)")
+    items: List[StockReservationItem] = Field(..., min_length=1)
+
+    @model_validator(mode="after")
+    def check_size(self):
+        if len(self.items) > settings.PRODUCT_BATCH_MAX_ITEMS:
+            raise ValueError(f"Too many items in reservation: {len(self.items)} > {settings.PRODUCT_BATCH_MAX_ITEMS}")
+        return self
+
+
+class StockReservation(BaseModel):
+    reservation_key: str
+    status: ReservationStatusEnum
+    items: List[StockReservationItem]
+    created_at: datetime
+    released_at: Optional[datetime] = None
+
+    class Config:
+        from_attributes = True
+
+
+class StockShortage(BaseModel):
+    product_id: uuid.UUID
+    requested: int
+    available: Optional[int] = None # None - товар не найден
+
+
+class ImportRowError(BaseModel):
+    row: int # Номер строки данных (без заголовка CSV), начиная с 1
+    article: Optional[str] = None
+    errors: List[str]
+
+
+class ProductImportReport(BaseModel):
+    total_rows: int
+    inserted: int
+    updated: int
+    failed: int
+    errors: List[ImportRowError] = []
+    errors_truncated: bool = False # В errors попали не все ошибочные строки
+    duration_seconds: float
+
+
+class CacheStats(BaseModel):
+    backend: str
+    hits: int
+    misses: int
+    errors: int
+    hit_ratio: float
@@ -0,0 +1,89 @@
+"""
+Создает уменьшенные копии (thumb/medium + WebP) для уже загруженных изображений
+в static/product_images и отмечает их в БД (product_images.has_variants).
+
+Запуск из каталога product_service:
+    python -m app.scripts.backfill_image_variants --workers 4
+
+Повторный запуск безопасен: существующие копии не пересоздаются.
+"""
+import argparse
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+from sqlalchemy import update, func as sqlalchemy_func
+
+from app import models
+from app.cache import product_cache
+from app.config import PRODUCT_IMAGES_DIR, settings
+from app.db import SessionLocal
+from app.image_variant_paths import is_variant_file, variant_paths
+from app.image_variants import generate_variants_sync
+from app.utils_uploads import public_url_for
+
+DB_BATCH_SIZE = 500
+
+
+def find_original_images(root: Path) -> list[Path]:
+    originals = []
+    for directory, _, filenames in os.walk(root):
+        for filename in filenames:
+            path = Path(directory) / filename
+            if filename.startswith(".") or is_variant_file(path) or not variant_paths(path):
+                continue  # Временные файлы, уже созданные копии и не изображения
+            originals.append(path)
+    return sorted(originals)
+
+
+def mark_variants_ready(image_urls: list[str]) -> int:
+    # updated_at товаров тоже сдвигается: меняется их представление, старые ETag должны стать невалидными
+    marked = 0
+    with SessionLocal() as db:
+        for start in range(0, len(image_urls), DB_BATCH_SIZE):
+            batch = image_urls[start:start + DB_BATCH_SIZE]
+            product_ids = db.execute(
+                update(models.ProductImage)
+                .where(models.ProductImage.image_url.in_(batch), models.ProductImage.has_variants.is_(False))
+                .values(has_variants=True)
+                .returning(models.ProductImage.product_id)
+            ).scalars().all()
+            if product_ids:
+                db.execute(
+                    update(models.Product)
+                    .where(models.Product.product_id.in_(set(product_ids)))
+                    .values(updated_at=sqlalchemy_func.now())
+                )
+            db.commit()
+            marked += len(product_ids)
+    return marked
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Backfill thumbnail/medium/WebP variants for product images.")
+    parser.add_argument("--workers", type=int, default=max(1, settings.PRODUCT_IMAGE_VARIANT_WORKERS))
+    parser.add_argument("--dry-run", action="store_true", help="Only list images that would be processed")
+    args = parser.parse_args()
+
+    originals = find_original_images(Path(PRODUCT_IMAGES_DIR))
+    print(f"Found {len(originals)} original image(s) in {PRODUCT_IMAGES_DIR}")
+    if args.dry_run or not originals:
+        for path in originals:
+            print(f"  {public_url_for(path)}")
+        return
+
+    started = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=args.workers) as executor:
+        results = list(executor.map(generate_variants_sync, originals, chunksize=8))
+    ready_urls = [public_url_for(path) for path, ok in zip(originals, results) if ok]
+    failed = len(originals) - len(ready_urls)
+    print(f"Variants ready for {len(ready_urls)} image(s), failed: {failed} ({time.perf_counter() - started:.1f}s)")
+
+    marked = mark_variants_ready(ready_urls)
+    product_cache.invalidate_lists()
+    print(f"Marked {marked} product_images row(s) as having variants.")
+
+
+if __name__ == "__main__":
+    main()
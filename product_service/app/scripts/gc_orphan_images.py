@@ -0,0 +1,180 @@
+"""
+Сборка мусора в static/product_images: файлы, на которые не ссылается ни одна запись product_images.
+Обычно файлы удаляют сами эндпоинты (crud.release_physical_images - под блокировкой файла, когда уходит
+последняя ссылка), а сборщик - страховка. Такие файлы остаются, если удаление файла не удалось
+(delete_physical_image только логирует ошибку) или процесс завершился посреди создания товара,
+а также от недописанных загрузок (.part).
+
+Каталог обходится os.scandir и сверяется с БД пачками (image_url = ANY(:urls) по idx_product_images_image_url),
+поэтому ни список файлов, ни множество URL целиком в памяти не держатся.
+Варианты (<имя>_thumb.png, <имя>_medium.webp, ...) считаются используемыми, пока используется их оригинал.
+Файлы моложе grace-периода не трогаются: файл загрузки записывается до коммита строки в БД, а при
+переиспользовании дубликата его mtime обновляется. Перед удалением mtime проверяется еще раз.
+
+Запуск из каталога product_service:
+    python -m app.scripts.gc_orphan_images                                  # только отчет
+    python -m app.scripts.gc_orphan_images --mode quarantine --quarantine-dir /var/lib/product_images_quarantine
+    python -m app.scripts.gc_orphan_images --mode delete --grace-hours 48
+"""
+import argparse
+import os
+import shutil
+import time
+from pathlib import Path
+from typing import Iterator, NamedTuple, Optional
+
+from sqlalchemy import any_, bindparam, select, String
+from sqlalchemy.dialects.postgresql import ARRAY
+
+from app import models
+from app.config import PRODUCT_IMAGES_DIR, STATIC_FILES_DIR, settings
+from app.db import SessionLocal
+from app.image_variant_paths import is_variant_file
+from app.utils_uploads import ALLOWED_EXTENSIONS, public_url_for
+
+TEMPORARY_PREFIXES = (".upload-", ".variant-")  # Недописанные файлы загрузки и ресайза
+
+
+class ImageFile(NamedTuple):
+    path: Path
+    size: int
+    modified_at: float
+
+
+class GcReport(NamedTuple):
+    scanned_files: int
+    scanned_bytes: int
+    orphan_files: int
+    orphan_bytes: int
+    young_orphan_files: int  # Не удалены: моложе grace-периода
+    reclaimed_bytes: int
+    errors: int
+
+
+def iter_files(root: Path) -> Iterator[ImageFile]:
+    # Обход в глубину через os.scandir: размер и mtime берутся из DirEntry без отдельного stat на файл
+    stack = [root]
+    while stack:
+        directory = stack.pop()
+        try:
+            with os.scandir(directory) as entries:
+                for entry in entries:
+                    if entry.is_dir(follow_symlinks=False):
+                        stack.append(Path(entry.path))
+                    elif entry.is_file(follow_symlinks=False):
+                        stat_result = entry.stat(follow_symlinks=False)
+                        yield ImageFile(Path(entry.path), stat_result.st_size, stat_result.st_mtime)
+        except OSError as e:
+            print(f"Cannot scan {directory}: {e}")
+
+
+def owner_urls(path: Path) -> list[str]:
+    # URL записей product_images, которые делают файл используемым
+    if not is_variant_file(path):
+        return [public_url_for(path)]
+    # Вариант: расширение оригинала неизвестно (у GIF-оригинала варианты .png) - проверяются все допустимые
+    original_stem = path.stem.rsplit("_", 1)[0]
+    return [public_url_for(path.with_name(original_stem + extension)) for extension in ALLOWED_EXTENSIONS]
+
+
+def find_orphans(files: list[ImageFile]) -> list[ImageFile]:
+    candidates = {}
+    for image_file in files:
+        if image_file.path.name.startswith(TEMPORARY_PREFIXES):
+            candidates[image_file] = []  # Временный файл не может быть нужен ни одной записи
+        else:
+            candidates[image_file] = owner_urls(image_file.path)
+    urls = sorted({url for owners in candidates.values() for url in owners})
+    if not urls:
+        return list(candidates)
+    with SessionLocal() as db:
+        referenced = set(db.execute(
+            select(models.ProductImage.image_url).distinct()
+            .where(models.ProductImage.image_url == any_(bindparam("urls", urls, type_=ARRAY(String))))
+        ).scalars())
+    return [image_file for image_file, owners in candidates.items() if not referenced.intersection(owners)]
+
+
+def dispose(image_file: ImageFile, mode: str, quarantine_dir: Path, deadline: float) -> bool:
+    try:
+        if os.stat(image_file.path).st_mtime > deadline:
+            return False  # Файл переиспользовала загрузка после обхода каталога
+        if mode == "delete":
+            os.remove(image_file.path)
+        else:  # quarantine: относительный путь сохраняется, файл можно вернуть на место
+            target = quarantine_dir / image_file.path.relative_to(PRODUCT_IMAGES_DIR)
+            target.parent.mkdir(parents=True, exist_ok=True)
+            shutil.move(image_file.path, target)  # Карантин может быть на другой файловой системе
+        return True
+    except FileNotFoundError:
+        return False  # Уже удален (например, параллельным запуском сборщика)
+    except OSError as e:
+        print(f"Cannot {mode} {image_file.path}: {e}")
+        raise
+
+
+def collect_garbage(mode: str, grace_seconds: float, quarantine_dir: Optional[Path] = None, batch_size: int = 1000,
+                    verbose: bool = False) -> GcReport:
+    root = Path(PRODUCT_IMAGES_DIR)
+    deadline = time.time() - grace_seconds
+    counters = dict.fromkeys(GcReport._fields, 0)
+
+    def process(batch: list[ImageFile]) -> None:
+        for orphan in find_orphans(batch):
+            counters["orphan_files"] += 1
+            counters["orphan_bytes"] += orphan.size
+            if orphan.modified_at > deadline:
+                counters["young_orphan_files"] += 1
+                continue
+            if verbose:
+                print(f"  orphan: {public_url_for(orphan.path)} ({orphan.size} bytes)")
+            if mode == "report":
+                continue
+            try:
+                if dispose(orphan, mode, quarantine_dir, deadline):
+                    counters["reclaimed_bytes"] += orphan.size
+            except OSError:
+                counters["errors"] += 1
+
+    batch = []
+    for image_file in iter_files(root):
+        counters["scanned_files"] += 1
+        counters["scanned_bytes"] += image_file.size
+        batch.append(image_file)
+        if len(batch) >= batch_size:
+            process(batch)
+            batch = []
+    if batch:
+        process(batch)
+    return GcReport(**counters)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--mode", choices=("report", "quarantine", "delete"), default="report")
+    parser.add_argument("--grace-hours", type=float, default=settings.PRODUCT_IMAGE_GC_GRACE_HOURS)
+    parser.add_argument("--quarantine-dir", type=Path, default=settings.PRODUCT_IMAGE_GC_QUARANTINE_DIR)
+    parser.add_argument("--batch-size", type=int, default=1000, help="Files checked against the DB per query")
+    parser.add_argument("--verbose", action="store_true", help="Print every orphan older than the grace period")
+    args = parser.parse_args()
+
+    quarantine_dir = args.quarantine_dir.resolve() if args.quarantine_dir else None
+    if args.mode == "quarantine" and quarantine_dir is None:
+        parser.error("--mode quarantine requires --quarantine-dir (or PRODUCT_IMAGE_GC_QUARANTINE_DIR)")
+    if quarantine_dir is not None and quarantine_dir.is_relative_to(STATIC_FILES_DIR):
+        parser.error("--quarantine-dir must be outside the static directory: files there are publicly served")
+
+    started = time.perf_counter()
+    report = collect_garbage(args.mode, args.grace_hours * 3600, quarantine_dir, args.batch_size, args.verbose)
+    print(f"Scanned {report.scanned_files} file(s), {report.scanned_bytes / 2 ** 20:.1f} MiB in {PRODUCT_IMAGES_DIR} "
+          f"({time.perf_counter() - started:.1f}s)")
+    print(f"Orphans: {report.orphan_files} file(s), {report.orphan_bytes / 2 ** 20:.1f} MiB; "
+          f"{report.young_orphan_files} younger than {args.grace_hours:g}h kept")
+    if args.mode == "report":
+        print("Report only: nothing was changed (use --mode quarantine or --mode delete)")
+    else:
+        print(f"Reclaimed {report.reclaimed_bytes / 2 ** 20:.1f} MiB ({args.mode}), errors: {report.errors}")
+
+
+if __name__ == "__main__":
+    main()
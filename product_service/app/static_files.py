@@ -0,0 +1,96 @@
+import os
+import re
+from typing import Optional
+
+import anyio
+from starlette.datastructures import Headers
+from starlette.responses import FileResponse, Response
+from starlette.staticfiles import NotModifiedResponse, StaticFiles
+from starlette.types import Scope
+
+from .config import settings
+from .image_variant_paths import VARIANT_SIZES
+
+# Раздача /static. Изображения, загруженные с дедупликацией, называются по sha256 содержимого
+# (<hash>.png, <hash>_thumb.webp, ...): содержимое файла с таким именем никогда не меняется,
+# поэтому браузер и CDN могут хранить его год без повторных проверок.
+# Диапазоны (Range/If-Range) и отдача через http.response.pathsend (если ее поддерживает ASGI-сервер)
+# уже реализованы в FileResponse. uvicorn pathsend не поддерживает - для отдачи файлов через sendfile
+# без участия воркеров предназначен режим X-Accel-Redirect (PRODUCT_STATIC_ACCEL_REDIRECT_PREFIX).
+
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+CONTENT_ADDRESSED_NAME = re.compile(r"^[0-9a-f]{64}(_(%s))?$" % "|".join(VARIANT_SIZES))
+WEBP_NEGOTIABLE_EXTENSIONS = (".png", ".jpg")  # "Совместимые" копии, у которых рядом лежит .webp
+
+
+def is_content_addressed(filename: str) -> bool:
+    stem, _ = os.path.splitext(filename)
+    return CONTENT_ADDRESSED_NAME.match(stem) is not None
+
+
+def _webp_alternative(path: str) -> Optional[str]:
+    # Только для вариантов (thumb/medium): у оригиналов WebP-копии нет
+    stem, extension = os.path.splitext(path)
+    match = CONTENT_ADDRESSED_NAME.match(os.path.basename(stem))
+    if match and match.group(1) and extension.lower() in WEBP_NEGOTIABLE_EXTENSIONS:
+        return stem + ".webp"
+    return None
+
+
+class ProductStaticFiles(StaticFiles):
+    """
+    StaticFiles с заголовками кэширования для изображений товаров:
+    - Cache-Control: immutable и сильный ETag по имени файла для файлов с хэшем содержимого в имени,
+      короткий max-age с обычной проверкой (ETag/Last-Modified) - для остальных;
+    - WebP вместо PNG/JPEG-варианта, если клиент его принимает (Accept: image/webp), с Vary: Accept;
+    - при заданном accel_redirect_prefix тело не отдается: ответ содержит X-Accel-Redirect,
+      файл с диска отдает nginx (sendfile, диапазоны), воркер uvicorn не занят передачей байтов.
+
+    Пример для nginx (accel_redirect_prefix="/internal-static/"):
+        location /internal-static/ { internal; alias /app/app/static/; sendfile on; tcp_nopush on; }
+    """
+
+    def __init__(self, *args, accel_redirect_prefix: Optional[str] = None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.accel_redirect_prefix = accel_redirect_prefix
+
+    async def get_response(self, path: str, scope: Scope) -> Response:
+        webp_path = _webp_alternative(path)
+        if webp_path is None:
+            return await super().get_response(path, scope)
+
+        if "image/webp" in Headers(scope=scope).get("accept", "") and scope["method"] in ("GET", "HEAD"):
+            full_path, stat_result = await anyio.to_thread.run_sync(self.lookup_path, webp_path)
+            if stat_result is not None:
+                response = self.file_response(full_path, stat_result, scope)
+                response.headers["vary"] = "Accept"
+                return response
+        response = await super().get_response(path, scope)
+        response.headers["vary"] = "Accept"  # Ответ по этому URL зависит от Accept - для кэшей по пути
+        return response
+
+    def file_response(self, full_path, stat_result: os.stat_result, scope: Scope, status_code: int = 200) -> Response:
+        filename = os.path.basename(full_path)
+        headers = {}
+        if is_content_addressed(filename):
+            headers["cache-control"] = IMMUTABLE_CACHE_CONTROL
+            headers["etag"] = f'"{filename}"'  # Имя определяется содержимым - валидатор сильный и одинаков на всех узлах
+        else:
+            headers["cache-control"] = f"public, max-age={settings.PRODUCT_STATIC_MAX_AGE_SECONDS}"
+
+        response = FileResponse(full_path, status_code=status_code, stat_result=stat_result, headers=headers)
+        if self.is_not_modified(response.headers, Headers(scope=scope)):
+            return NotModifiedResponse(response.headers)
+        if self.accel_redirect_prefix:
+            return self._accel_redirect_response(full_path, response)
+        return response
+
+    def _accel_redirect_response(self, full_path, file_response: FileResponse) -> Response:
+        relative_path = os.path.relpath(full_path, self.directory).replace(os.path.sep, "/")
+        headers = {
+            name: file_response.headers[name]
+            for name in ("cache-control", "etag", "last-modified", "accept-ranges")
+            if name in file_response.headers
+        }
+        headers["x-accel-redirect"] = self.accel_redirect_prefix.rstrip("/") + "/" + relative_path
+        return Response(status_code=file_response.status_code, headers=headers, media_type=file_response.media_type)
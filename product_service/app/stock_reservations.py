@@ -0,0 +1,147 @@
+import uuid
+from typing import List, Optional
+
+from sqlalchemy import select, update, bindparam, Integer, func as sqlalchemy_func, any_
+from sqlalchemy.dialects.postgresql import ARRAY, UUID, insert as pg_insert
+from sqlalchemy.orm import Session
+
+from . import models, schemas
+from .cache import product_cache
+
+# Резервирование остатков под заказ: списание по списку (product_id, quantity) в одной транзакции,
+# все или ничего. Порядок блокировок строк products всегда один (по product_id), поэтому
+# встречные резервирования с пересекающимися товарами ждут друг друга, а не взаимоблокируются.
+
+RESERVED = models.ReservationStatusEnum.RESERVED.value
+RELEASED = models.ReservationStatusEnum.RELEASED.value
+
+
+class InsufficientStockError(Exception):
+    def __init__(self, shortages: List[schemas.StockShortage]):
+        super().__init__("Insufficient stock for one or more products.")
+        self.shortages = shortages
+
+
+class ReservationKeyConflictError(Exception):
+    pass
+
+
+def normalize_items(items: List[schemas.StockReservationItem]) -> List[dict]:
+    # Повторы товара суммируются; порядок по product_id совпадает с порядком блокировок (uuid в PG сравнивается побайтно)
+    quantities: dict[uuid.UUID, int] = {}
+    for item in items:
+        quantities[item.product_id] = quantities.get(item.product_id, 0) + item.quantity
+    return [{"product_id": str(product_id), "quantity": quantity}
+            for product_id, quantity in sorted(quantities.items(), key=lambda pair: str(pair[0]))]
+
+
+def _requested_rows(items: List[dict]):
+    # unnest(:ids, :quantities) AS requested(product_id, quantity) - текст запроса не зависит от числа товаров
+    return sqlalchemy_func.unnest(
+        bindparam("product_ids", [uuid.UUID(item["product_id"]) for item in items], type_=ARRAY(UUID(as_uuid=True))),
+        bindparam("quantities", [item["quantity"] for item in items], type_=ARRAY(Integer)),
+    ).table_valued("product_id", "quantity").render_derived(name="requested")
+
+
+def _lock_products(db: Session, items: List[dict]) -> dict[uuid.UUID, int]:
+    product_ids = [uuid.UUID(item["product_id"]) for item in items]
+    rows = db.execute(
+        select(models.Product.product_id, models.Product.stock_quantity)
+        .where(models.Product.product_id == any_(bindparam("lock_ids", product_ids, type_=ARRAY(UUID(as_uuid=True)))))
+        .order_by(models.Product.product_id)
+        .with_for_update()
+    ).all()
+    return {row.product_id: row.stock_quantity for row in rows}
+
+
+def get_reservation(db: Session, reservation_key: str) -> Optional[models.StockReservation]:
+    return db.get(models.StockReservation, reservation_key, populate_existing=True)
+
+
+def reserve_stock(db: Session, reservation: schemas.StockReservationCreate) -> tuple[models.StockReservation, bool]:
+    """
+    Возвращает (резервирование, создано ли оно этим вызовом).
+    Повтор с тем же ключом и тем же составом возвращает существующее резервирование без списания;
+    с другим составом - ReservationKeyConflictError. Нехватка остатка - InsufficientStockError, ничего не списывается.
+    """
+    items = normalize_items(reservation.items)
+    # Ключ занимается первым: параллельный повтор с тем же ключом ждет на уникальном индексе,
+    # пока эта транзакция не завершится, и затем видит ее результат
+    created = db.execute(
+        pg_insert(models.StockReservation)
+        .values(reservation_key=reservation.reservation_key, status=RESERVED, items=items)
+        .on_conflict_do_nothing(index_elements=[models.StockReservation.reservation_key])
+        .returning(models.StockReservation.reservation_key)
+    ).scalar()
+    if created is None:
+        db.rollback()
+        existing = get_reservation(db, reservation.reservation_key)
+        if existing is None or existing.items != items:
+            raise ReservationKeyConflictError(
+                f"Reservation key '{reservation.reservation_key}' was already used with different items."
+            )
+        return existing, False
+
+    try:
+        available = _lock_products(db, items)
+        shortages = [
+            schemas.StockShortage(product_id=item["product_id"], requested=item["quantity"],
+                                  available=available.get(uuid.UUID(item["product_id"])))
+            for item in items
+            if available.get(uuid.UUID(item["product_id"]), 0) < item["quantity"]
+        ]
+        if shortages:
+            raise InsufficientStockError(shortages)
+
+        requested = _requested_rows(items)
+        updated = db.execute(
+            update(models.Product)
+            .where(models.Product.product_id == requested.c.product_id,
+                   models.Product.stock_quantity >= requested.c.quantity)
+            .values(stock_quantity=models.Product.stock_quantity - requested.c.quantity,
+                    updated_at=sqlalchemy_func.now())
+            .returning(models.Product.product_id)
+        ).scalars().all()
+        if len(updated) != len(items):  # Строки заблокированы выше - условие может не пройти только при ошибке в логике
+            raise RuntimeError("Conditional stock update did not match all locked products.")
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+
+    product_cache.invalidate_products([uuid.UUID(item["product_id"]) for item in items])
+    print(f"STOCK: reserved {len(items)} product(s) under key '{reservation.reservation_key}'")
+    return get_reservation(db, reservation.reservation_key), True
+
+
+def release_stock(db: Session, reservation_key: str) -> Optional[models.StockReservation]:
+    """Возвращает остатки резервирования. Повторный вызов ничего не меняет. None - ключ не найден."""
+    # Смена статуса - условный UPDATE: из параллельных вызовов остатки вернет только один
+    items = db.execute(
+        update(models.StockReservation)
+        .where(models.StockReservation.reservation_key == reservation_key,
+               models.StockReservation.status == RESERVED)
+        .values(status=RELEASED, released_at=sqlalchemy_func.now())
+        .returning(models.StockReservation.items)
+    ).scalar()
+    if items is None:
+        db.rollback()
+        return get_reservation(db, reservation_key)
+
+    try:
+        _lock_products(db, items)
+        requested = _requested_rows(items)
+        db.execute(
+            update(models.Product)
+            .where(models.Product.product_id == requested.c.product_id)  # Удаленные с тех пор товары пропускаются
+            .values(stock_quantity=models.Product.stock_quantity + requested.c.quantity,
+                    updated_at=sqlalchemy_func.now())
+        )
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+
+    product_cache.invalidate_products([uuid.UUID(item["product_id"]) for item in items])
+    print(f"STOCK: released reservation '{reservation_key}'")
+    return get_reservation(db, reservation_key)
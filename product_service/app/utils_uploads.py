@@ -1,92 +1,273 @@
+import asyncio
+import hashlib
 import uuid
-import shutil
 import os
 from pathlib import Path
+from typing import BinaryIO, List, NamedTuple, Optional
 from fastapi import UploadFile, HTTPException, status
+from starlette.concurrency import run_in_threadpool
+from starlette.responses import JSONResponse
 
-from .config import PRODUCT_IMAGES_DIR, STATIC_FILES_DIR  # Пути из config.py
+from .config import PRODUCT_IMAGES_DIR, STATIC_FILES_DIR, settings  # Пути из config.py
+from .image_variant_paths import variant_paths
 
+ALLOWED_CONTENT_TYPES = ["image/jpeg", "image/png", "image/gif", "image/webp"]
+ALLOWED_EXTENSIONS = [".jpg", ".jpeg", ".png", ".gif", ".webp"]
+# Расширение хранимого файла по типу изображения: одинаковое содержимое -> одинаковое имя
+CANONICAL_EXTENSIONS = {"image/jpeg": ".jpg", "image/png": ".png", "image/gif": ".gif", "image/webp": ".webp"}
+UPLOAD_CHUNK_SIZE = 256 * 1024  # Файл копируется кусками, целиком в память не читается
+
+
+def detect_image_type(header: bytes) -> Optional[str]:
+    # Тип изображения по сигнатуре (magic bytes) - не доверяем Content-Type и расширению клиента
+    if header.startswith(b"\xff\xd8\xff"):
+        return "image/jpeg"
+    if header.startswith(b"\x89PNG\r\n\x1a\n"):
+        return "image/png"
+    if header.startswith((b"GIF87a", b"GIF89a")):
+        return "image/gif"
+    if header[:4] == b"RIFF" and header[8:12] == b"WEBP":
+        return "image/webp"
+    return None
 
-# СИНХРОННЫЙ хелпер для сохранения файла и получения его относительного URL
-def save_upload_file_sync(file: UploadFile, entity_id_for_filename: uuid.UUID) -> tuple[
-    Path, str]:  # <--- Обновляем тип возвращаемого значения
-    print(f"--- Attempting to save file: {file.filename} for entity {entity_id_for_filename}")
-    print(f"PRODUCT_IMAGES_DIR: {PRODUCT_IMAGES_DIR}")
-    if not os.path.exists(PRODUCT_IMAGES_DIR):
-        print(f"ERROR: PRODUCT_IMAGES_DIR {PRODUCT_IMAGES_DIR} does not exist!")
-        raise IOError(f"Upload directory does not exist: {PRODUCT_IMAGES_DIR}")
-    elif not os.access(PRODUCT_IMAGES_DIR, os.W_OK):
-        print(f"ERROR: No write access to PRODUCT_IMAGES_DIR {PRODUCT_IMAGES_DIR}")
-        raise IOError(f"No write access to upload directory: {PRODUCT_IMAGES_DIR}")
 
-    allowed_content_types = ["image/jpeg", "image/png", "image/gif", "image/webp"]
-    if file.content_type not in allowed_content_types:
+def validate_upload_metadata(file: UploadFile) -> str:
+    # Проверки, не требующие чтения файла. Возвращает расширение файла.
+    if file.content_type not in ALLOWED_CONTENT_TYPES:
         raise ValueError(
-            f"Invalid image type for {file.filename}. Allowed: {', '.join(allowed_content_types)}"
+            f"Invalid image type for {file.filename}. Allowed: {', '.join(ALLOWED_CONTENT_TYPES)}"
         )
 
     try:
         file_extension = Path(file.filename).suffix.lower()
-        if not file_extension or file_extension not in [".jpg", ".jpeg", ".png", ".gif", ".webp"]:
-            raise ValueError(f"Invalid file extension for {file.filename}. Supported: .jpg, .jpeg, .png, .gif, .webp")
     except Exception:
         raise ValueError(f"Could not determine file extension for {file.filename}.")
+    if not file_extension or file_extension not in ALLOWED_EXTENSIONS:
+        raise ValueError(f"Invalid file extension for {file.filename}. Supported: .jpg, .jpeg, .png, .gif, .webp")
+
+    # Размер известен после разбора multipart - отсекаем большой файл, не копируя его
+    if file.size is not None and file.size > settings.PRODUCT_IMAGE_MAX_BYTES:
+        raise ValueError(
+            f"Image {file.filename} is too large: {file.size} bytes (max {settings.PRODUCT_IMAGE_MAX_BYTES})."
+        )
+    return file_extension
+
+
+def copy_image_stream(source: BinaryIO, destination: Path, filename: str) -> tuple[int, str, str]:
+    # Потоковое копирование с проверкой сигнатуры по первому куску и лимита размера по ходу записи.
+    # sha256 считается по тем же кускам, без повторного чтения файла.
+    # Возвращает (количество записанных байт, sha256 в hex, MIME-тип по сигнатуре).
+    written = 0
+    image_type = None
+    digest = hashlib.sha256()
+    with open(destination, "wb") as buffer:
+        while chunk := source.read(UPLOAD_CHUNK_SIZE):
+            if written == 0:
+                image_type = detect_image_type(chunk)
+                if image_type is None:
+                    raise ValueError(f"File {filename} is not a valid JPEG, PNG, GIF or WEBP image.")
+            written += len(chunk)
+            if written > settings.PRODUCT_IMAGE_MAX_BYTES:
+                raise ValueError(f"Image {filename} is too large (max {settings.PRODUCT_IMAGE_MAX_BYTES} bytes).")
+            digest.update(chunk)
+            buffer.write(chunk)
+    if written == 0:
+        raise ValueError(f"File {filename} is empty.")
+    return written, digest.hexdigest(), image_type
+
+
+class StagedUpload(NamedTuple):
+    # Загрузка, записанная во временный .part: хэш и итоговый путь известны, в хранилище файл еще не перенесен
+    partial_path: Path
+    path: Path
+    url: str
+    content_hash: str
+
 
-    new_filename = f"{entity_id_for_filename}_{uuid.uuid4()}{file_extension}"
-    file_path = Path(PRODUCT_IMAGES_DIR) / new_filename  # file_path это объект Path
+class SavedImage(NamedTuple):
+    path: Path
+    url: str
+    content_hash: str
+    created: bool  # False - такой файл уже был в хранилище (дубликат), удалять его при откате нельзя
+
+
+def content_addressed_path(content_hash: str, file_extension: str) -> Path:
+    # product_images/ab/cd/abcd...ef.png - два уровня шардирования, чтобы в одном каталоге не копились
+    # сотни тысяч файлов. Одинаковое содержимое всегда получает один и тот же путь (и URL).
+    return Path(PRODUCT_IMAGES_DIR) / content_hash[:2] / content_hash[2:4] / f"{content_hash}{file_extension}"
+
+
+def public_url_for(file_path: Path) -> str:
+    relative_path_to_static_root = file_path.relative_to(Path(STATIC_FILES_DIR))
+    return f"/static/{str(relative_path_to_static_root).replace(os.path.sep, '/')}"
+
+
+# Файлы адресуются по содержимому (sha256): повторная загрузка той же картинки не создает копию.
+# Сохранение идет в два шага. stage_upload_file_sync пишет файл во временный .part и вычисляет хэш -
+# это можно делать параллельно и без блокировок. store_staged_upload переносит его в хранилище или
+# переиспользует уже сохраненный файл; вызывать его нужно под блокировкой URL (crud.lock_image_files),
+# которую транзакция держит до коммита строки product_images, - иначе параллельное удаление последней
+# ссылки может удалить переиспользованный файл.
+def stage_upload_file_sync(file: UploadFile) -> StagedUpload:
+    print(f"--- Attempting to save file: {file.filename}")
+    if not os.path.exists(PRODUCT_IMAGES_DIR):
+        print(f"ERROR: PRODUCT_IMAGES_DIR {PRODUCT_IMAGES_DIR} does not exist!")
+        raise IOError(f"Upload directory does not exist: {PRODUCT_IMAGES_DIR}")
+    elif not os.access(PRODUCT_IMAGES_DIR, os.W_OK):
+        print(f"ERROR: No write access to PRODUCT_IMAGES_DIR {PRODUCT_IMAGES_DIR}")
+        raise IOError(f"No write access to upload directory: {PRODUCT_IMAGES_DIR}")
 
     try:
-        with open(file_path, "wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)
-        print(f"File {file.filename} successfully saved to {file_path}")  # Лог успешного сохранения
-    except Exception as e:
-        print(f"ERROR saving file {file.filename} to {file_path}: {e}")  # Лог ошибки сохранения
-        raise IOError(f"Could not save image file {file.filename}: {str(e)}") from e
+        validate_upload_metadata(file)
+        # Хэш известен только после записи, поэтому пишем во временный файл и затем переименовываем:
+        # недописанный файл не появится под публичным URL
+        partial_path = Path(PRODUCT_IMAGES_DIR) / f".upload-{uuid.uuid4().hex}.part"
+
+        try:
+            _, content_hash, image_type = copy_image_stream(file.file, partial_path, file.filename)
+        except Exception as e:
+            if partial_path.exists():
+                os.remove(partial_path)
+            if isinstance(e, ValueError):
+                raise
+            print(f"ERROR saving file {file.filename}: {e}")  # Лог ошибки сохранения
+            raise IOError(f"Could not save image file {file.filename}: {str(e)}") from e
     finally:
         if hasattr(file, 'file') and hasattr(file.file, 'close') and callable(file.file.close):
             file.file.close()
 
-    relative_path_to_static_root = file_path.relative_to(Path(STATIC_FILES_DIR))
-    public_image_url = f"/static/{str(relative_path_to_static_root).replace(os.path.sep, '/')}"
+    # Расширение - по фактическому типу, а не по имени файла клиента (.jpeg/.JPG -> .jpg)
+    file_path = content_addressed_path(content_hash, CANONICAL_EXTENSIONS[image_type])
+    return StagedUpload(partial_path=partial_path, path=file_path, url=public_url_for(file_path),
+                        content_hash=content_hash)
+
+
+def store_staged_upload(staged: StagedUpload) -> SavedImage:
+    # Вызывать под блокировкой staged.url (см. комментарий к stage_upload_file_sync)
+    try:
+        if staged.path.exists():
+            os.remove(staged.partial_path)
+            # mtime обновляется: сборщик мусора (scripts/gc_orphan_images.py) не тронет файл в grace-период,
+            # пока строка product_images с этим URL еще не закоммичена
+            os.utime(staged.path)
+            print(f"File {staged.partial_path.name} is a duplicate of {staged.path}, reusing stored file")
+            created = False
+        else:
+            staged.path.parent.mkdir(parents=True, exist_ok=True)
+            os.replace(staged.partial_path, staged.path)
+            print(f"File successfully saved to {staged.path}")  # Лог успешного сохранения
+            created = True
+    except OSError as e:
+        print(f"ERROR storing file {staged.path}: {e}")
+        raise IOError(f"Could not save image file {staged.path.name}: {str(e)}") from e
+    return SavedImage(path=staged.path, url=staged.url, content_hash=staged.content_hash, created=created)
+
+
+def discard_staged_uploads(staged_files: List[StagedUpload]) -> None:
+    # Удаляет временные файлы, которые так и не попали в хранилище (например, после ошибки в транзакции)
+    for staged in staged_files:
+        if staged.partial_path.exists():
+            os.remove(staged.partial_path)
+
+
+# Асинхронные хелперы: те же операции с файлами, но в пуле потоков, чтобы не блокировать event loop
+async def stage_upload_file_async(file: UploadFile) -> StagedUpload:
+    return await run_in_threadpool(stage_upload_file_sync, file)
+
+
+async def store_staged_upload_async(staged: StagedUpload) -> SavedImage:
+    return await run_in_threadpool(store_staged_upload, staged)
+
+
+async def stage_upload_files_concurrently(files: List[UploadFile]) -> List[StagedUpload]:
+    """
+    Записывает несколько файлов во временные .part параллельно (не более PRODUCT_UPLOAD_PARALLEL_WRITES
+    одновременно). Результат - в порядке исходного списка. Если хотя бы один файл не записался,
+    временные файлы остальных удаляются, а первая ошибка пробрасывается дальше.
+    В хранилище файлы переносит store_staged_upload.
+    """
+    semaphore = asyncio.Semaphore(max(1, settings.PRODUCT_UPLOAD_PARALLEL_WRITES))
+
+    async def stage_one(upload: UploadFile) -> StagedUpload:
+        async with semaphore:
+            return await stage_upload_file_async(upload)
+
+    results = await asyncio.gather(*(stage_one(upload) for upload in files), return_exceptions=True)
+    errors = [result for result in results if isinstance(result, BaseException)]
+    if errors:
+        discard_staged_uploads([result for result in results if not isinstance(result, BaseException)])
+        raise errors[0]
+    return results
 
-    return file_path, public_image_url  # <--- ВОЗВРАЩАЕМ КОРТЕЖ: (путь_к_файлу, публичный_url)
 
+class UploadSizeLimitMiddleware:
+    """
+    ASGI middleware: ограничивает размер тела запросов с файлами ДО того, как Starlette
+    разберет multipart и сбросит файлы во временное хранилище.
+    Запрос с Content-Length больше лимита отклоняется сразу (413), запрос без него
+    (chunked) прерывается, как только прочитанный объем превысит лимит.
+    """
 
-# Асинхронный хелпер (если понадобится для эндпоинтов, не вызывающих синхронный CRUD)
-async def save_upload_file_async(file: UploadFile, entity_id_for_filename: uuid.UUID) -> str:
-    # Логика почти такая же, как в синхронной, но с await file.close()
-    allowed_content_types = ["image/jpeg", "image/png", "image/gif", "image/webp"]
-    if file.content_type not in allowed_content_types:
-        raise HTTPException(  # Здесь можно бросать HTTPException, т.к. это для API слоя
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail=f"Invalid image type for {file.filename}. Allowed: {', '.join(allowed_content_types)}"
+    def __init__(self, app, max_body_bytes: int):
+        self.app = app
+        self.max_body_bytes = max_body_bytes
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] not in ("POST", "PUT", "PATCH"):
+            await self.app(scope, receive, send)
+            return
+
+        headers = dict(scope.get("headers") or [])
+        if not headers.get(b"content-type", b"").startswith(b"multipart/form-data"):
+            await self.app(scope, receive, send)
+            return
+
+        content_length = headers.get(b"content-length")
+        if content_length is not None and content_length.isdigit() and int(content_length) > self.max_body_bytes:
+            await self._reject(scope, receive, send)
+            return
+
+        received = 0
+
+        async def limited_receive():
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > self.max_body_bytes:
+                    raise UploadTooLargeError(self.max_body_bytes)
+            return message
+
+        try:
+            await self.app(scope, limited_receive, send)
+        except UploadTooLargeError:
+            await self._reject(scope, receive, send)
+
+    async def _reject(self, scope, receive, send):
+        response = JSONResponse(
+            {"detail": f"Upload is too large (max {self.max_body_bytes} bytes)."},
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE
         )
-    # ... остальная логика генерации имени и пути ...
-    file_extension = Path(file.filename).suffix.lower()
-    if not file_extension or file_extension not in [".jpg", ".jpeg", ".png", ".gif", ".webp"]:
-        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST,
-                            detail=f"Invalid file extension for {file.filename}.")
+        await response(scope, receive, send)
 
-    new_filename = f"{entity_id_for_filename}_{uuid.uuid4()}{file_extension}"
-    file_path = Path(PRODUCT_IMAGES_DIR) / new_filename
 
-    try:
-        with open(file_path, "wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)
-    except Exception as e:
-        raise HTTPException(
-            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail=f"Could not save image file {file.filename}: {str(e)}"
+class UploadTooLargeError(HTTPException):
+    # HTTPException: FastAPI пробрасывает ее из разбора тела как есть и отвечает 413
+    def __init__(self, max_body_bytes: int):
+        super().__init__(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=f"Upload is too large (max {max_body_bytes} bytes)."
         )
-    finally:
-        await file.close()  # Используем await для async функции
 
-    relative_path_to_static_root = file_path.relative_to(Path(STATIC_FILES_DIR))
-    public_image_url = f"/static/{str(relative_path_to_static_root).replace(os.path.sep, '/')}"
-    return public_image_url
 
+def delete_physical_image(image_url: str, remaining_references: int = 0):
+    # Файл может быть общим для нескольких записей product_images (одинаковое содержимое).
+    # Вызывающий код передает число оставшихся ссылок на URL, посчитанное под блокировкой этого URL
+    # (crud.release_physical_images); удаляем только последнюю копию.
+    if remaining_references > 0:
+        print(f"Keeping physical file for {image_url}: still referenced {remaining_references} time(s)")
+        return False
 
-def delete_physical_image(image_url: str):
     if not image_url or not image_url.startswith("/static/"):
         print(f"Skipping deletion of invalid or non-local image URL: {image_url}")
         return False
@@ -97,12 +278,22 @@ def delete_physical_image(image_url: str):
     if file_to_delete_path.exists():
         try:
             os.remove(file_to_delete_path)
+            delete_variants(file_to_delete_path)
             print(f"Successfully deleted physical file: {file_to_delete_path}")
             return True
         except Exception as e:
             print(f"Error deleting physical file {file_to_delete_path}: {e}")
-            # Логируем ошибку, но не прерываем операцию в БД (можно решить иначе)
+            # Логируем ошибку, но не прерываем операцию в БД: оставшийся файл уберет scripts/gc_orphan_images.py
             return False
     else:
         print(f"Physical file not found for deletion: {file_to_delete_path}")
-        return False
\ No newline at end of file
+        return False
+
+
+def delete_variants(original_path: Path) -> None:
+    for path in variant_paths(original_path).values():
+        if path.exists():
+            try:
+                os.remove(path)
+            except Exception as e:
+                print(f"Error deleting image variant {path}: {e}")
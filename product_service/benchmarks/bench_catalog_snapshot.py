@@ -0,0 +1,134 @@
+"""
+Бенчмарк режима снимка каталога (PRODUCT_SNAPSHOT_ENABLED, см. app/catalog_snapshot.py):
+обычный путь (SQL + ORM/Row + Pydantic на каждый товар) против склейки заранее сериализованных байтов.
+
+Приложение вызывается в процессе через ASGI-транспорт httpx (без сети), кэш товаров выключен, чтобы
+в обычном режиме каждый запрос доходил до БД. Смесь запросов: страницы каталога, страницы с фильтром
+и карточки товаров. Печатаются запросы/сек и медиана/p95 задержки для каждого режима.
+
+Запуск из каталога product_service (БД - тестовая: товары создаются и затем удаляются):
+    PRODUCT_DATABASE_URL=postgresql+psycopg2://... python -m benchmarks.bench_catalog_snapshot --products 5000
+"""
+import argparse
+import asyncio
+import random
+import statistics
+import time
+import uuid
+
+import httpx
+from sqlalchemy import text
+
+from app.cache import NullCacheBackend, product_cache
+from app.catalog_snapshot import catalog_snapshot
+from app.db import SessionLocal
+from app.main import app
+
+SEED_SQL = text("""
+    WITH new_products AS (
+        INSERT INTO products (name, article, description, price, stock_quantity, manufacturer,
+                              product_technology, socket, power, created_at)
+        SELECT
+            'Snapshot lamp ' || :run_id || ' ' || g,
+            'SN-' || :run_id || '-' || g,
+            repeat('Описание лампы для бенчмарка. ', 10),
+            100 + g % 900, g % 50, 'BenchCorp', 'Светодиодная',
+            CASE WHEN g % 2 = 0 THEN 'E27' ELSE 'E14' END, 5 + g % 20,
+            NOW() - (g || ' seconds')::interval
+        FROM generate_series(1, :products) AS g
+        RETURNING product_id
+    )
+    INSERT INTO product_images (product_id, image_url, upload_at)
+    SELECT product_id, '/static/product_images/bench/' || product_id || '_' || i || '.png',
+           NOW() - (i || ' minutes')::interval
+    FROM new_products, generate_series(1, :images) AS i
+""")
+
+PRODUCT_IDS_SQL = text("SELECT product_id FROM products WHERE article LIKE 'SN-' || :run_id || '-%'")
+CLEANUP_SQL = text("DELETE FROM products WHERE article LIKE 'SN-' || :run_id || '-%'")
+
+
+def request_mix(product_ids: list, count: int, pages: int) -> list[str]:
+    # Одинаковая последовательность URL для обоих режимов
+    rng = random.Random(42)
+    urls = []
+    for _ in range(count):
+        kind = rng.random()
+        if kind < 0.5:
+            urls.append(f"/api/v1/products/?skip={rng.randrange(pages) * 20}&limit=20")
+        elif kind < 0.7:
+            urls.append(f"/api/v1/products/?socket=E27&min_power=10&skip={rng.randrange(10) * 20}&limit=20")
+        else:
+            urls.append(f"/api/v1/products/{rng.choice(product_ids)}")
+    return urls
+
+
+async def run_mode(urls: list[str], concurrency: int) -> tuple[float, list[float]]:
+    transport = httpx.ASGITransport(app=app)
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        async def one(url: str) -> None:
+            async with semaphore:
+                started = time.perf_counter()
+                response = await client.get(url)
+                latencies.append(time.perf_counter() - started)
+                response.raise_for_status()
+
+        started = time.perf_counter()
+        await asyncio.gather(*(one(url) for url in urls))
+        elapsed = time.perf_counter() - started
+    return len(urls) / elapsed, latencies
+
+
+def describe(name: str, result: tuple[float, list[float]]) -> str:
+    requests_per_sec, latencies = result
+    p95 = statistics.quantiles(latencies, n=20)[-1]
+    return (f"{name:<10} {requests_per_sec:9.0f} req/s | median {statistics.median(latencies) * 1000:7.2f} ms"
+            f" | p95 {p95 * 1000:7.2f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--products", type=int, default=5000)
+    parser.add_argument("--images", type=int, default=2, help="Images per product")
+    parser.add_argument("--requests", type=int, default=3000)
+    parser.add_argument("--concurrency", type=int, default=16)
+    args = parser.parse_args()
+
+    run_id = uuid.uuid4().hex[:8]
+    with SessionLocal() as db:
+        print(f"Seeding {args.products} products x {args.images} images (run {run_id})...")
+        db.execute(SEED_SQL, {"run_id": run_id, "products": args.products, "images": args.images})
+        db.execute(text("ANALYZE products; ANALYZE product_images"))
+        db.commit()
+        product_ids = [str(product_id) for product_id in db.execute(PRODUCT_IDS_SQL, {"run_id": run_id}).scalars()]
+
+    product_cache.backend = NullCacheBackend()  # Оба режима без кэша ответов
+    urls = request_mix(product_ids, args.requests, pages=max(args.products // 20, 1))
+    try:
+        catalog_snapshot.clear()
+        asyncio.run(run_mode(urls[:200], args.concurrency))  # Прогрев
+        orm_result = asyncio.run(run_mode(urls, args.concurrency))
+
+        with SessionLocal() as db:
+            started = time.perf_counter()
+            catalog_snapshot.load(db)
+            print(f"Snapshot loaded in {time.perf_counter() - started:.2f} s")
+        asyncio.run(run_mode(urls[:200], args.concurrency))
+        snapshot_result = asyncio.run(run_mode(urls, args.concurrency))
+
+        print(f"{args.requests} requests, concurrency {args.concurrency}")
+        print(describe("ORM", orm_result))
+        print(describe("snapshot", snapshot_result))
+        print(f"Speedup: x{snapshot_result[0] / orm_result[0]:.1f}")
+    finally:
+        catalog_snapshot.clear()
+        with SessionLocal() as db:
+            db.execute(CLEANUP_SQL, {"run_id": run_id})
+            db.commit()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,113 @@
+"""
+Бенчмарк страницы каталога: прежний путь (ORM Product + все изображения через selectin)
+против легкой проекции crud.get_all_products (колонки ProductInList + главное изображение через LATERAL).
+
+Меряются строки/сек и пик памяти Python (tracemalloc) на страницу, включая сборку ProductInList.
+
+Запуск из каталога product_service (БД - тестовая: товары создаются и затем удаляются):
+    PRODUCT_DATABASE_URL=postgresql+psycopg2://... python -m benchmarks.bench_list_projection --products 20000 --images 4
+"""
+import argparse
+import statistics
+import time
+import tracemalloc
+import uuid
+
+from sqlalchemy import text
+
+from app import crud, models, schemas
+from app.db import SessionLocal
+
+SEED_SQL = text("""
+    WITH new_products AS (
+        INSERT INTO products (name, article, description, price, stock_quantity, manufacturer,
+                              product_technology, socket, power, created_at)
+        SELECT
+            'Bench lamp ' || :run_id || ' ' || g,
+            'BL-' || :run_id || '-' || g,
+            repeat('Описание лампы для бенчмарка. ', 20),
+            100 + g % 900, g % 50, 'BenchCorp', 'Светодиодная', 'E27', 10,
+            NOW() - (g || ' seconds')::interval
+        FROM generate_series(1, :products) AS g
+        RETURNING product_id
+    )
+    INSERT INTO product_images (product_id, image_url, upload_at)
+    SELECT product_id, '/static/product_images/bench/' || product_id || '_' || i || '.png',
+           NOW() - (i || ' minutes')::interval
+    FROM new_products, generate_series(1, :images) AS i
+""")
+
+CLEANUP_SQL = text("DELETE FROM products WHERE article LIKE 'BL-' || :run_id || '-%'")
+
+
+def legacy_page(db, skip: int, limit: int) -> list:
+    # Путь до изменения: полные ORM-объекты, изображения подгружаются selectin, берется первое
+    products = (
+        db.query(models.Product)
+        .order_by(models.Product.created_at.desc(), models.Product.product_id.desc())
+        .offset(skip).limit(limit).all()
+    )
+    return [
+        schemas.ProductInList(
+            product_id=p.product_id, name=p.name, article=p.article, stock_quantity=p.stock_quantity,
+            price=p.price, main_image_url=p.images[0].image_url if p.images else None
+        )
+        for p in products
+    ]
+
+
+def projection_page(db, skip: int, limit: int) -> list:
+    rows, _, _ = crud.get_all_products(db, skip=skip, limit=limit)
+    return [schemas.ProductInList.from_row(row) for row in rows]
+
+
+def measure(page_func, pages: int, limit: int) -> tuple[float, list[float], list[int]]:
+    # Каждая страница - в новой сессии, как в запросе к API (без identity map предыдущих страниц)
+    timings, peaks, rows_total = [], [], 0
+    for page in range(pages):
+        with SessionLocal() as db:
+            tracemalloc.start()
+            started = time.perf_counter()
+            items = page_func(db, page * limit, limit)
+            timings.append(time.perf_counter() - started)
+            peaks.append(tracemalloc.get_traced_memory()[1])
+            tracemalloc.stop()
+            rows_total += len(items)
+    return rows_total / sum(timings), timings, peaks
+
+
+def describe(name: str, result: tuple[float, list[float], list[int]]) -> str:
+    rows_per_sec, timings, peaks = result
+    return (f"{name:<12} {rows_per_sec:10.0f} rows/s | median page {statistics.median(timings) * 1000:7.2f} ms"
+            f" | peak memory/page {statistics.median(peaks) / 1024:8.1f} KiB")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--products", type=int, default=20_000)
+    parser.add_argument("--images", type=int, default=4, help="Images per product")
+    parser.add_argument("--pages", type=int, default=50)
+    parser.add_argument("--limit", type=int, default=100)
+    args = parser.parse_args()
+
+    run_id = uuid.uuid4().hex[:8]
+    with SessionLocal() as db:
+        print(f"Seeding {args.products} products x {args.images} images (run {run_id})...")
+        db.execute(SEED_SQL, {"run_id": run_id, "products": args.products, "images": args.images})
+        db.execute(text("ANALYZE products; ANALYZE product_images"))
+        db.commit()
+
+    try:
+        measure(projection_page, 2, args.limit)  # Прогрев
+        measure(legacy_page, 2, args.limit)
+        print(f"{args.pages} pages x {args.limit} rows")
+        print(describe("ORM+selectin", measure(legacy_page, args.pages, args.limit)))
+        print(describe("projection", measure(projection_page, args.pages, args.limit)))
+    finally:
+        with SessionLocal() as db:
+            db.execute(CLEANUP_SQL, {"run_id": run_id})
+            db.commit()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+"""
+Бенчмарк поиска товаров: старый запрос (lower(...) ILIKE) против триграммного (pg_trgm + GIN).
+
+Запуск из каталога product_service (нужна БД с расширением pg_trgm):
+    PRODUCT_DATABASE_URL=postgresql+psycopg2://... python -m benchmarks.bench_search --rows 1000000
+
+Данные генерируются во временной таблице, рабочая таблица products не затрагивается.
+"""
+import argparse
+import statistics
+import time
+
+from sqlalchemy import create_engine, text
+
+from app.config import settings
+
+OLD_QUERY = text("""
+    SELECT product_id, name, article FROM bench_products
+    WHERE lower(name) ILIKE :pattern OR lower(article) ILIKE :pattern
+    ORDER BY created_at DESC, product_id DESC
+    LIMIT :limit
+""")
+
+TRGM_QUERY = text("""
+    SELECT product_id, name, article FROM bench_products
+    WHERE name ILIKE :pattern OR article ILIKE :pattern
+    ORDER BY greatest(similarity(name, :term), similarity(article, :term)) DESC, created_at DESC, product_id DESC
+    LIMIT :limit
+""")
+
+SETUP_SQL = [
+    "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+    """
+    CREATE TEMP TABLE bench_products (
+        product_id UUID PRIMARY KEY DEFAULT gen_random_uuid(),
+        name VARCHAR(128) NOT NULL,
+        article VARCHAR(32) NOT NULL,
+        created_at TIMESTAMP WITH TIME ZONE NOT NULL
+    )
+    """,
+    """
+    INSERT INTO bench_products (name, article, created_at)
+    SELECT
+        'Лампа ' || (ARRAY['LED', 'Накаливания', 'Галогенная', 'Филамент'])[1 + g % 4]
+            || ' ' || (ARRAY['E27', 'E14', 'GU10', 'G9', 'GX53'])[1 + g % 5]
+            || ' ' || (1 + g % 150) || 'W ' || substr(md5(g::text), 1, 10),
+        'LMP-' || upper(substr(md5((g * 7)::text), 1, 8)) || '-' || g,
+        NOW() - (g || ' seconds')::interval
+    FROM generate_series(1, :rows) AS g
+    """,
+    # Индексы, как в 02_init_tables.sql: B-tree (старые) и триграммные GIN
+    "CREATE INDEX ON bench_products (name)",
+    "CREATE INDEX ON bench_products (article)",
+    "CREATE INDEX ON bench_products USING gin (name gin_trgm_ops)",
+    "CREATE INDEX ON bench_products USING gin (article gin_trgm_ops)",
+    "ANALYZE bench_products",
+]
+
+
+def measure(conn, query, params: dict, repeat: int) -> list[float]:
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        conn.execute(query, params).fetchall()
+        timings.append((time.perf_counter() - started) * 1000)
+    return timings
+
+
+def describe(timings: list[float]) -> str:
+    ordered = sorted(timings)
+    p95 = ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))]
+    return f"median {statistics.median(ordered):8.2f} ms | p95 {p95:8.2f} ms"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--limit", type=int, default=20)
+    parser.add_argument("--terms", default="филамент,gu10,e14 12w,3f9a,LMP-0A1")
+    args = parser.parse_args()
+
+    engine = create_engine(settings.PRODUCT_DATABASE_URL)
+    with engine.connect() as conn:
+        print(f"Generating {args.rows} rows...")
+        started = time.perf_counter()
+        for statement in SETUP_SQL:
+            conn.execute(text(statement), {"rows": args.rows})
+        print(f"Setup done in {time.perf_counter() - started:.1f} s\n")
+
+        for term in (t.strip() for t in args.terms.split(",") if t.strip()):
+            old_params = {"pattern": f"%{term.lower()}%", "limit": args.limit}
+            new_params = {"pattern": f"%{term}%", "term": term, "limit": args.limit}
+            conn.execute(OLD_QUERY, old_params).fetchall()  # Прогрев кэша
+            conn.execute(TRGM_QUERY, new_params).fetchall()
+            print(f"term={term!r}")
+            print(f"  ILIKE (seq scan): {describe(measure(conn, OLD_QUERY, old_params, args.repeat))}")
+            print(f"  pg_trgm (GIN):    {describe(measure(conn, TRGM_QUERY, new_params, args.repeat))}")
+
+        plan = conn.execute(text("EXPLAIN " + TRGM_QUERY.text), {"pattern": "%gu10%", "term": "gu10", "limit": args.limit})
+        print("\nPlan of the trigram query:")
+        for (line,) in plan:
+            print(f"  {line}")
+    engine.dispose()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+"""
+Нагрузочный тест создания товаров с изображениями (POST /api/v1/products/).
+
+Параллельно с созданием товаров опрашивается GET /health: его задержка показывает,
+насколько event loop сервиса блокируется синхронными операциями (БД, запись файлов).
+Для сравнения "до/после" запустите тест против сервиса на нужных коммитах.
+
+Запуск (сервис должен быть запущен, БД - тестовая: товары создаются и затем удаляются):
+    python -m benchmarks.load_create_products --base-url http://localhost:8001 --requests 500 --concurrency 32
+"""
+import argparse
+import asyncio
+import base64
+import statistics
+import time
+import uuid
+
+import httpx
+
+# Минимальный валидный PNG 1x1
+PNG_BYTES = base64.b64decode(
+    "iVBORw0KGgoAAAANSUhEUgAAAAEAAAABCAYAAAAfFcSJAAAADUlEQVR42mNk+M9QDwADhgGAWjR9awAAAABJRU5ErkJggg=="
+)
+
+
+def product_form(run_id: str, index: int) -> dict:
+    return {
+        "name": f"Load test lamp {run_id} {index}",
+        "article": f"LT-{run_id}-{index}",
+        "price": "100.00",
+        "stock_quantity": "10",
+        "manufacturer": "LoadTest",
+        "product_technology": "Светодиодная",
+        "socket": "E27",
+        "power": "10.0",
+    }
+
+
+async def create_worker(client: httpx.AsyncClient, queue: asyncio.Queue, run_id: str, images: int,
+                        latencies: list, created_ids: list, errors: list):
+    while True:
+        try:
+            index = queue.get_nowait()
+        except asyncio.QueueEmpty:
+            return
+        files = [("images", (f"img{i}.png", PNG_BYTES, "image/png")) for i in range(images)]
+        started = time.perf_counter()
+        response = await client.post("/api/v1/products/", data=product_form(run_id, index), files=files or None)
+        latencies.append(time.perf_counter() - started)
+        if response.status_code == 201:
+            created_ids.append(response.json()["product_id"])
+        else:
+            errors.append(f"{response.status_code}: {response.text[:200]}")
+
+
+async def health_probe(client: httpx.AsyncClient, stop: asyncio.Event, latencies: list):
+    while not stop.is_set():
+        started = time.perf_counter()
+        await client.get("/health")
+        latencies.append(time.perf_counter() - started)
+        await asyncio.sleep(0.05)
+
+
+def summary(values: list) -> str:
+    if not values:
+        return "n/a"
+    ordered = sorted(values)
+    p95 = ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))]
+    return f"median {statistics.median(ordered) * 1000:.1f} ms, p95 {p95 * 1000:.1f} ms, max {ordered[-1] * 1000:.1f} ms"
+
+
+async def run(args):
+    run_id = uuid.uuid4().hex[:6]
+    queue: asyncio.Queue = asyncio.Queue()
+    for index in range(args.requests):
+        queue.put_nowait(index)
+
+    latencies, health_latencies, created_ids, errors = [], [], [], []
+    limits = httpx.Limits(max_connections=args.concurrency + 2)
+    async with httpx.AsyncClient(base_url=args.base_url, timeout=60, limits=limits) as client:
+        stop = asyncio.Event()
+        probe = asyncio.create_task(health_probe(client, stop, health_latencies))
+        started = time.perf_counter()
+        await asyncio.gather(*(
+            create_worker(client, queue, run_id, args.images, latencies, created_ids, errors)
+            for _ in range(args.concurrency)
+        ))
+        elapsed = time.perf_counter() - started
+        stop.set()
+        await probe
+
+        print(f"Created {len(created_ids)}/{args.requests} products in {elapsed:.2f} s "
+              f"-> {len(created_ids) / elapsed:.1f} products/s (concurrency {args.concurrency}, {args.images} image(s) each)")
+        print(f"POST latency:   {summary(latencies)}")
+        print(f"/health latency while loaded: {summary(health_latencies)}")
+        if errors:
+            print(f"Errors: {len(errors)}, first: {errors[0]}")
+
+        if not args.keep:
+            for product_id in created_ids:
+                await client.delete(f"/api/v1/products/{product_id}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--base-url", default="http://localhost:8001")
+    parser.add_argument("--requests", type=int, default=500)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--images", type=int, default=2, help="Изображений на товар")
+    parser.add_argument("--keep", action="store_true", help="Не удалять созданные товары")
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+"""
+Нагрузочный тест массового импорта: генерирует прайс-лист на N товаров и отправляет его
+потоком в POST /api/v1/products/import (CSV или NDJSON), затем повторно - как обновление.
+
+Запуск (сервис должен быть запущен, БД - тестовая: товары создаются и затем удаляются напрямую в БД,
+поэтому нужен и PRODUCT_DATABASE_URL):
+    python -m benchmarks.load_import_products --base-url http://localhost:8001 --rows 100000 --format csv
+"""
+import argparse
+import csv
+import io
+import json
+import time
+import uuid
+
+import httpx
+
+FIELDS = ["name", "article", "description", "price", "stock_quantity", "manufacturer",
+          "product_technology", "socket", "power", "lumens", "color_temperature", "class_energy_efficiency"]
+
+
+def product_row(run_id: str, index: int, price_shift: int) -> dict:
+    return {
+        "name": f"Import lamp {run_id} {index}",
+        "article": f"IM-{run_id}-{index}",
+        "description": "Лампа из прайс-листа поставщика",
+        "price": f"{100 + index % 900 + price_shift}.00",
+        "stock_quantity": index % 100,
+        "manufacturer": ["Philips", "Osram", "Gauss", "Navigator"][index % 4],
+        "product_technology": "Светодиодная",
+        "socket": ["E27", "E14", "GU10"][index % 3],
+        "power": f"{5 + index % 20}.0",
+        "lumens": 400 + index % 1200,
+        "color_temperature": [2700, 4000, 6500][index % 3],
+        "class_energy_efficiency": "A+",
+    }
+
+
+def generate_body(run_id: str, rows: int, fmt: str, price_shift: int = 0, chunk_rows: int = 5000):
+    # Генератор кусков тела: прайс-лист не собирается в памяти целиком
+    for start in range(0, rows, chunk_rows):
+        buffer = io.StringIO()
+        if fmt == "csv":
+            writer = csv.DictWriter(buffer, fieldnames=FIELDS, lineterminator="\n")
+            if start == 0:
+                writer.writeheader()
+            for index in range(start, min(rows, start + chunk_rows)):
+                writer.writerow(product_row(run_id, index, price_shift))
+        else:
+            for index in range(start, min(rows, start + chunk_rows)):
+                buffer.write(json.dumps(product_row(run_id, index, price_shift), ensure_ascii=False) + "\n")
+        yield buffer.getvalue().encode("utf-8")
+
+
+def run_import(client: httpx.Client, base_url: str, run_id: str, rows: int, fmt: str, price_shift: int) -> dict:
+    content_type = "text/csv" if fmt == "csv" else "application/x-ndjson"
+    started = time.perf_counter()
+    response = client.post(f"{base_url}/api/v1/products/import", content=generate_body(run_id, rows, fmt, price_shift),
+                           headers={"content-type": content_type})
+    elapsed = time.perf_counter() - started
+    response.raise_for_status()
+    report = response.json()
+    print(f"  {rows} rows in {elapsed:.2f} s ({rows / elapsed:,.0f} rows/s): inserted {report['inserted']}, "
+          f"updated {report['updated']}, failed {report['failed']}")
+    return report
+
+
+def cleanup(run_id: str) -> None:
+    # Сотни тысяч DELETE через API заняли бы больше времени, чем сам импорт - удаляем одной командой в БД
+    from sqlalchemy import text
+    from app.db import SessionLocal
+
+    with SessionLocal() as db:
+        deleted = db.execute(text("DELETE FROM products WHERE article LIKE :pattern"), {"pattern": f"IM-{run_id}-%"}).rowcount
+        db.commit()
+    print(f"Cleanup: deleted {deleted} products")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--base-url", default="http://localhost:8001")
+    parser.add_argument("--rows", type=int, default=100_000)
+    parser.add_argument("--format", choices=["csv", "ndjson"], default="csv")
+    parser.add_argument("--keep", action="store_true", help="Do not delete imported products")
+    args = parser.parse_args()
+
+    run_id = uuid.uuid4().hex[:8]
+    with httpx.Client(timeout=httpx.Timeout(10.0, read=None)) as client:
+        print(f"Import #1 (insert), format={args.format}:")
+        run_import(client, args.base_url, run_id, args.rows, args.format, price_shift=0)
+        print("Import #2 (update prices):")
+        run_import(client, args.base_url, run_id, args.rows, args.format, price_shift=10)
+    if not args.keep:
+        cleanup(run_id)
+
+
+if __name__ == "__main__":
+    main()
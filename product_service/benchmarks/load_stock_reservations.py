@@ -0,0 +1,137 @@
+"""
+Нагрузочный тест резервирования остатков: много одновременных "оформлений заказа" на одни и те же
+горячие товары через POST /api/v1/stock/reservations.
+
+Часть резервирований содержит оба горячих товара в случайном порядке (проверка на взаимоблокировки),
+часть запросов повторяется с тем же ключом (повтор клиента после таймаута), часть резервирований
+сразу отменяется. В конце остаток сверяется с суммой успешных списаний: потерянных обновлений быть не должно,
+ответов 5xx (в том числе из-за deadlock) - тоже.
+
+Запуск (сервис должен быть запущен; ключи резервирований удаляются напрямую в БД, нужен PRODUCT_DATABASE_URL):
+    python -m benchmarks.load_stock_reservations --base-url http://localhost:8001 --checkouts 3000 --concurrency 64
+"""
+import argparse
+import asyncio
+import random
+import time
+import uuid
+from collections import Counter
+
+import httpx
+
+
+async def create_hot_product(client: httpx.AsyncClient, base_url: str, run_id: str, index: int, stock: int) -> str:
+    response = await client.post(f"{base_url}/api/v1/products/", data={
+        "name": f"Hot lamp {run_id} {index}", "article": f"HOT-{run_id}-{index}", "price": "99.00",
+        "stock_quantity": str(stock), "manufacturer": "LoadTest", "product_technology": "Светодиодная",
+        "socket": "E27", "power": "7.0",
+    })
+    response.raise_for_status()
+    return response.json()["product_id"]
+
+
+async def read_stock(client: httpx.AsyncClient, base_url: str, product_ids: list[str]) -> list[int]:
+    # Через /products/batch: он не кэшируется, в отличие от GET /products/{id} (кэш у каждого воркера свой)
+    response = await client.post(f"{base_url}/api/v1/products/batch", json={"ids": product_ids})
+    response.raise_for_status()
+    stock_by_id = {product["product_id"]: product["stock_quantity"] for product in response.json()["items"]}
+    return [stock_by_id[product_id] for product_id in product_ids]
+
+
+async def checkout(client: httpx.AsyncClient, base_url: str, run_id: str, number: int, hot_ids: list[str],
+                   args, stats: Counter, reserved: Counter, semaphore: asyncio.Semaphore) -> None:
+    items = [{"product_id": hot_ids[0], "quantity": 1}]
+    if random.random() < args.multi_item_share:
+        items.append({"product_id": hot_ids[1], "quantity": 1})
+        random.shuffle(items)  # Разный порядок позиций в запросах - сервер все равно блокирует по product_id
+    body = {"reservation_key": f"LT-{run_id}-{number}", "items": items}
+    attempts = 2 if random.random() < args.retry_share else 1
+
+    async with semaphore:
+        created = False
+        for _ in range(attempts):
+            response = await client.post(f"{base_url}/api/v1/stock/reservations", json=body)
+            stats[response.status_code] += 1
+            created = created or response.status_code == 201
+        if not created:
+            return
+        for item in items:
+            reserved[item["product_id"]] += item["quantity"]
+        if random.random() < args.release_share:
+            response = await client.post(f"{base_url}/api/v1/stock/reservations/{body['reservation_key']}/release")
+            stats[f"release {response.status_code}"] += 1
+            if response.status_code == 200:
+                for item in items:
+                    reserved[item["product_id"]] -= item["quantity"]
+
+
+def cleanup(run_id: str) -> None:
+    from sqlalchemy import text
+    from app.db import SessionLocal
+
+    with SessionLocal() as db:
+        reservations = db.execute(text("DELETE FROM stock_reservations WHERE reservation_key LIKE :pattern"),
+                                  {"pattern": f"LT-{run_id}-%"}).rowcount
+        products = db.execute(text("DELETE FROM products WHERE article LIKE :pattern"),
+                              {"pattern": f"HOT-{run_id}-%"}).rowcount
+        db.commit()
+    print(f"Cleanup: deleted {reservations} reservations, {products} products")
+
+
+async def run(args, run_id: str) -> bool:
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    async with httpx.AsyncClient(timeout=30.0, limits=limits) as client:
+        hot_ids = [await create_hot_product(client, args.base_url, run_id, index, args.stock) for index in range(2)]
+        stats, reserved = Counter(), Counter()
+        semaphore = asyncio.Semaphore(args.concurrency)
+
+        started = time.perf_counter()
+        await asyncio.gather(*(
+            checkout(client, args.base_url, run_id, number, hot_ids, args, stats, reserved, semaphore)
+            for number in range(args.checkouts)
+        ))
+        elapsed = time.perf_counter() - started
+
+        final_stock = await read_stock(client, args.base_url, hot_ids)
+
+    requests_total = sum(stats.values())
+    print(f"{args.checkouts} checkouts, {requests_total} requests in {elapsed:.2f} s ({requests_total / elapsed:,.0f} req/s)")
+    for key, count in sorted(stats.items(), key=lambda pair: str(pair[0])):
+        print(f"  {key}: {count}")
+
+    ok = True
+    for product_id, stock in zip(hot_ids, final_stock):
+        expected = args.stock - reserved[product_id]
+        status = "OK" if stock == expected and stock >= 0 else "MISMATCH"
+        ok = ok and status == "OK"
+        print(f"  {product_id}: stock {stock}, expected {expected} -> {status}")
+    server_errors = sum(count for key, count in stats.items() if str(key).split()[-1].startswith("5"))
+    if server_errors:
+        print(f"  {server_errors} server error(s) - check the service log for deadlocks")
+        ok = False
+    return ok
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--base-url", default="http://localhost:8001")
+    parser.add_argument("--stock", type=int, default=1000, help="Initial stock of each hot product")
+    parser.add_argument("--checkouts", type=int, default=3000, help="More than --stock to hit the shortage path")
+    parser.add_argument("--concurrency", type=int, default=64)
+    parser.add_argument("--multi-item-share", type=float, default=0.5)
+    parser.add_argument("--retry-share", type=float, default=0.2)
+    parser.add_argument("--release-share", type=float, default=0.1)
+    parser.add_argument("--keep", action="store_true", help="Do not delete test products and reservations")
+    args = parser.parse_args()
+
+    run_id = uuid.uuid4().hex[:8]
+    try:
+        ok = asyncio.run(run(args, run_id))
+        print("RESULT:", "no lost updates" if ok else "FAILED")
+    finally:
+        if not args.keep:
+            cleanup(run_id)
+
+
+if __name__ == "__main__":
+    main()
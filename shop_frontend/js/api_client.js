@@ -1,7 +1,7 @@
-async function apiClientRequest(baseUrl, endpoint, method = 'GET', data = null) {
+async function apiClientRequest(baseUrl, endpoint, method = 'GET', data = null, extraHeaders = {}) {
     const config = {
         method: method,
-        headers: {},
+        headers: { ...extraHeaders },
     };
 
     if (data) {
@@ -84,6 +84,26 @@ function toggleSelectAllItems(selectAllChecked) {
     saveCartItems(cart);
 }
 
+// Актуальные цена и название товаров корзины одним запросом POST /products/batch
+// (вместо запроса на каждый товар). Товары, которых больше нет в каталоге, удаляются из корзины.
+async function refreshCartItems() {
+    const cart = getCartItems();
+    if (cart.length === 0) return cart;
+    const batch = await apiClientRequest(PRODUCT_SERVICE_API_URL, '/products/batch', 'POST', {
+        ids: cart.map(item => item.id)
+    });
+    const productsById = new Map(batch.items.map(product => [product.product_id, product]));
+    const refreshedCart = cart
+        .filter(item => !batch.missing_ids.includes(item.id))
+        .map(item => {
+            const product = productsById.get(item.id);
+            if (!product) return item;
+            return { ...item, name: product.name, price: parseFloat(product.price) };
+        });
+    saveCartItems(refreshedCart);
+    return refreshedCart;
+}
+
 
 function clearCart() {
     saveCartItems([]);
@@ -183,6 +183,10 @@ document.addEventListener('DOMContentLoaded', () => {
 
     // Первоначальный рендеринг корзины при загрузке страницы
     renderCartPage();
+    // Затем - с актуальными ценами из каталога (если сервис недоступен, остается сохраненная корзина)
+    refreshCartItems()
+        .then(renderCartPage)
+        .catch(err => console.error("Failed to refresh cart items:", err));
 
     // Универсальные обработчики количества из main.js могут конфликтовать или дублироваться.
     // Лучше, если логика изменения количества для корзины будет только здесь.
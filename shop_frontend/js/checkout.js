@@ -17,6 +17,14 @@ document.addEventListener('DOMContentLoaded', () => {
     let currentSubtotal = 0;
     let currentDiscountValue = 0; // Сумма скидки в рублях
     let appliedPromocodeName = null; // Имя примененного промокода
+    // Idempotency-Key текущей попытки оформления: повторная отправка того же заказа (двойной клик, сбой сети)
+    // идет с тем же ключом и не создаст второй заказ; при изменении данных заказа ключ меняется
+    let pendingOrderKey = null;
+    let pendingOrderPayloadJson = null;
+
+    const generateIdempotencyKey = () => (window.crypto && crypto.randomUUID)
+        ? crypto.randomUUID()
+        : `${Date.now().toString(36)}-${Math.random().toString(36).slice(2)}-${Math.random().toString(36).slice(2)}`;
 
     // Функция форматирования цены
     const formatPrice = (price) => new Intl.NumberFormat('ru-RU', { style: 'currency', currency: 'RUB', minimumFractionDigits: 2, maximumFractionDigits: 2 }).format(price);
@@ -80,30 +88,39 @@ document.addEventListener('DOMContentLoaded', () => {
             }
 
             try {
-                // Запрос к Order Service для проверки промокода
-                // Используем apiClientRequest из api_client.js
+                // Скидку считает Order Service (POST /orders/quote) - по тем же правилам, что и при создании заказа
                 // PRODUCT_SERVICE_API_URL и ORDER_SERVICE_API_URL должны быть доступны из config_client.js
-                const promoData = await apiClientRequest(ORDER_SERVICE_API_URL, `/promocodes/name/${encodeURIComponent(promoCodeName)}`);
-                
-                if (promoData && promoData.is_active) {
-                    // Проверяем min_order_cost (если есть)
-                    if (promoData.min_order_cost && currentSubtotal < parseFloat(promoData.min_order_cost)) {
-                        promoStatusEl.textContent = `Промокод действителен, но минимальная сумма заказа (${formatPrice(promoData.min_order_cost)}) не достигнута.`;
-                        promoStatusEl.classList.add('warning'); // Или error
-                    } else {
-                        if (promoData.percent) {
-                            currentDiscountValue = (currentSubtotal * promoData.percent) / 100;
-                        } else if (promoData.value) {
-                            currentDiscountValue = parseFloat(promoData.value);
-                        }
-                        currentDiscountValue = Math.min(currentDiscountValue, currentSubtotal); // Скидка не может быть больше суммы
-                        appliedPromocodeName = promoData.promocode_name;
+                const quoteResponse = await apiClientRequest(ORDER_SERVICE_API_URL, '/orders/quote', 'POST', {
+                    carts: [{
+                        items: checkoutItems.map(item => ({
+                            product_id: item.id,
+                            quantity: item.quantity,
+                            price_per_one: item.price
+                        })),
+                        promocode_name: promoCodeName
+                    }]
+                });
+                const quote = quoteResponse.quotes[0];
+                currentSubtotal = parseFloat(quote.total_cost);
+
+                switch (quote.promocode_status) {
+                    case 'APPLIED':
+                        currentDiscountValue = parseFloat(quote.discount);
+                        appliedPromocodeName = quote.promocode_name;
                         promoStatusEl.textContent = 'Промокод применен!';
                         promoStatusEl.classList.add('success');
-                    }
-                } else {
-                    promoStatusEl.textContent = 'Промокод не найден или неактивен.';
-                    promoStatusEl.classList.add('error');
+                        break;
+                    case 'BELOW_MIN_ORDER_COST':
+                        promoStatusEl.textContent = `Промокод действителен, но минимальная сумма заказа (${formatPrice(quote.promocode_min_order_cost)}) не достигнута.`;
+                        promoStatusEl.classList.add('warning');
+                        break;
+                    case 'INACTIVE':
+                        promoStatusEl.textContent = 'Промокод неактивен.';
+                        promoStatusEl.classList.add('error');
+                        break;
+                    default: // NOT_FOUND
+                        promoStatusEl.textContent = 'Промокод не найден.';
+                        promoStatusEl.classList.add('error');
                 }
             } catch (error) {
                 console.error("Error applying promocode:", error);
@@ -184,8 +201,15 @@ document.addEventListener('DOMContentLoaded', () => {
 
             console.log('Отправка заказа на бэкенд:', orderPayload);
             
+            const orderPayloadJson = JSON.stringify(orderPayload);
+            if (orderPayloadJson !== pendingOrderPayloadJson) {
+                pendingOrderKey = generateIdempotencyKey();
+                pendingOrderPayloadJson = orderPayloadJson;
+            }
+
             try {
-                const createdOrder = await apiClientRequest(ORDER_SERVICE_API_URL, '/orders', 'POST', orderPayload);
+                const createdOrder = await apiClientRequest(ORDER_SERVICE_API_URL, '/orders', 'POST', orderPayload,
+                    { 'Idempotency-Key': pendingOrderKey });
                 console.log('Заказ успешно создан:', createdOrder);
 
                 if (createdOrder && createdOrder.number) {
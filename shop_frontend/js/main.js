@@ -121,6 +121,7 @@ document.addEventListener('DOMContentLoaded', () => {
         let catalogIsLoading = false;
         let catalogAllProductsLoaded = false;
         let catalogCurrentFilters = {};
+        let catalogNextCursor = null; // Курсор следующей страницы (keyset-пагинация)
 
         function applyCatalogFiltersAndLoad(newFilters = {}, page = 1) {
             catalogCurrentFilters = { ...catalogCurrentFilters, ...newFilters };
@@ -130,6 +131,7 @@ document.addEventListener('DOMContentLoaded', () => {
                 }
             }
             catalogCurrentPage = page; // При новом фильтре начинаем с 1-й страницы
+            catalogNextCursor = null;
             catalogAllProductsLoaded = false;
             productGrid.innerHTML = ''; // Очищаем перед новым запросом
             if (loadMoreButton) loadMoreButton.style.display = 'block';
@@ -143,10 +145,13 @@ document.addEventListener('DOMContentLoaded', () => {
             if (loadMoreButton) loadMoreButton.textContent = 'Загрузка...';
 
             try {
-                const queryParams = new URLSearchParams({
-                    skip: (page - 1) * limit,
-                    limit: limit
-                });
+                const queryParams = new URLSearchParams({ limit: limit });
+                if (page > 1 && catalogNextCursor) {
+                    // Следующие страницы запрашиваем по курсору: без OFFSET и COUNT(*) на сервере
+                    queryParams.set('cursor', catalogNextCursor);
+                } else {
+                    queryParams.set('skip', (page - 1) * limit);
+                }
                 for (const key in filters) {
                     if (filters[key]) {
                         queryParams.set(key, filters[key]);
@@ -160,9 +165,10 @@ document.addEventListener('DOMContentLoaded', () => {
 
                 if (responseData && responseData.items) {
                     renderCatalogProducts(responseData.items);
-                    catalogCurrentPage = responseData.page ? responseData.page + 1 : page + 1;
+                    catalogCurrentPage = page + 1;
+                    catalogNextCursor = responseData.next_cursor || null;
                     
-                    if (responseData.items.length < limit || (responseData.page * limit) >= responseData.total_count) {
+                    if (responseData.items.length < limit || !catalogNextCursor) {
                         catalogAllProductsLoaded = true;
                         if (loadMoreButton) loadMoreButton.style.display = 'none';
                     } else {
@@ -191,15 +197,20 @@ document.addEventListener('DOMContentLoaded', () => {
             products.forEach(product => {
                 const articleEl = document.createElement('article');
                 const productServiceBase = "http://localhost:8001"
+                // Для плитки - уменьшенная копия (WebP, если браузер поддерживает), оригинал - если копий еще нет
+                const variants = product.main_image_variants;
                 const imageUrl = product.main_image_url
-                    ? `${productServiceBase}${product.main_image_url}`
+                    ? `${productServiceBase}${variants ? variants.thumb : product.main_image_url}`
                     : 'https://placehold.co/250x250/e9ecef/adb5bd?text=Image';
+                const webpSource = variants
+                    ? `<source srcset="${productServiceBase}${variants.thumb_webp}" type="image/webp">`
+                    : '';
                 console.log(imageUrl);
                 articleEl.className = 'product-card';
                 articleEl.innerHTML = `
                     <a href="product.html?id=${product.product_id}" class="product-card__link">
                         <div class="product-card__image">
-                            <img src="${imageUrl}" alt="${escapeHtml(product.name)}">
+                            <picture>${webpSource}<img src="${imageUrl}" alt="${escapeHtml(product.name)}" loading="lazy"></picture>
                         </div>
                         <h3 class="product-card__title">${escapeHtml(product.name)}</h3>
                     </a>
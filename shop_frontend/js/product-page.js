@@ -69,7 +69,9 @@ document.addEventListener('DOMContentLoaded', async () => {
 
         // Галерея изображений
         if (mainProductImageEl && productThumbnailsContainer && product.images && product.images.length > 0) {
-            const firstImageUrlFull = `${productServiceBaseForStatic}${product.images[0].image_url}`;
+            // Уменьшенные копии (если созданы): medium - для основного изображения, thumb - для миниатюр
+            const imageSrc = (img, variant) => `${productServiceBaseForStatic}${img.variants ? img.variants[variant] : img.image_url}`;
+            const firstImageUrlFull = imageSrc(product.images[0], 'medium');
             mainProductImageEl.src = firstImageUrlFull;
             mainProductImageEl.alt = `${escapeHtml(product.name)} - вид 1`;
 
@@ -82,12 +84,12 @@ document.addEventListener('DOMContentLoaded', async () => {
                 thumbButton.setAttribute('aria-label', `Показать изображение ${index + 1}`);
                 thumbButton.type = 'button';
 
-                const fullImageUrl = `${productServiceBaseForStatic}${img.image_url}`;
+                const fullImageUrl = imageSrc(img, 'medium');
                 thumbButton.dataset.imageSrc = fullImageUrl; // Сохраняем ПОЛНЫЙ URL
                 thumbButton.dataset.imageAlt = `${escapeHtml(product.name)} - вид ${index + 1}`;
 
                 const thumbImg = document.createElement('img');
-                thumbImg.src = fullImageUrl; // ПОЛНЫЙ URL для миниатюры
+                thumbImg.src = imageSrc(img, 'thumb');
                 thumbImg.alt = `Миниатюра: ${escapeHtml(product.name)} - вид ${index + 1}`;
 
                 thumbButton.appendChild(thumbImg);